@@ -0,0 +1,265 @@
+"""ยอดสรุป P&L ที่อัปเดตทีละดีล — /report ไม่ต้องอ่าน realized/trades ทั้งตารางทุกครั้ง
+
+- เก็บเป็นถังรายวันต่อคู่เหรียญ ไฟล์ละเดือน: <ledger>/aggregates/<YYYY-MM>.json = {วัน: {pair: ยอด}}
+  และยอดรวมตลอดต่อคู่ใน totals.json (เขียนท้ายสุด) พร้อมจำนวนแถว trades/realized ที่นับรวมแล้ว
+  — TradeStorage เทียบจำนวนนี้กับ ledger ทุกครั้งที่โหลดจากดิสก์ ไม่ตรง (หยุดก่อน flush หรือ transaction ของ
+  CSV ล้มหลังเขียนไปบางส่วน) = สร้างใหม่
+- TradeStorage เรียก add_trade / add_realized ทุกครั้งที่บันทึก แล้ว flush เฉพาะไฟล์ที่เปลี่ยนเมื่อจบ transaction
+- รายงานวัน/สัปดาห์/เดือนรวมถังรายวันไม่เกิน 31 ถังต่อคู่ จึงใช้เวลาเท่าเดิมไม่ว่าประวัติจะยาวแค่ไหน
+- ledger ที่ยังไม่มี totals.json (มีข้อมูลก่อนมีไฟล์นี้) และหลัง replay จะสร้างใหม่จากทั้งตารางครั้งเดียว
+
+    python aggregates.py rebuild [--user <chat_id>]
+    python aggregates.py report [day|week|month|all|YYYY-MM|YYYY-MM-DD] [--user <chat_id>]
+"""
+import os
+import json
+import argparse
+import contextlib
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+FIELDS = ("trades", "volume", "fees", "sells", "wins", "losses", "realized")
+TOTALS = "totals"
+PERIODS = ("day", "week", "month", "all")
+
+def _num(v) -> float:
+    try:
+        return float(v or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _read_json(path: Optional[str]):
+    if not path:
+        return None
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _write_json(path: str, data) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp, path)
+
+class PnLAggregates:
+    def __init__(self, path: Optional[str], utc_offset_hours: float = 7.0):
+        """path = โฟลเดอร์ของไฟล์ยอดสรุป (None = เก็บในหน่วยความจำอย่างเดียว)"""
+        self.path = path
+        self.tz = timezone(timedelta(hours=utc_offset_hours))
+        self._totals: Optional[Dict[str, Dict[str, float]]] = None
+        self._counts: Dict[str, int] = {"trades": 0, "realized": 0}   # แถวของ ledger ที่นับรวมแล้ว
+        self._months: Dict[str, Dict[str, Dict[str, Dict[str, float]]]] = {}
+        self._dirty: set = set()
+        self._depth = 0
+        if path:
+            os.makedirs(path, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg: dict, ledger_dir: str) -> Optional["PnLAggregates"]:
+        c = cfg.get("pnl_report") or {}
+        if not c.get("enabled", True):
+            return None
+        return cls(os.path.join(ledger_dir, c.get("dir", "aggregates")), float(c.get("utc_offset_hours", 7)))
+
+    def _file(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, name + ".json") if self.path else None
+
+    @property
+    def loaded(self) -> bool:
+        """มียอดสรุปในหน่วยความจำแล้ว (False = ยังไม่ได้อ่าน หรือถูกทิ้งหลัง transaction ล้ม)"""
+        return self._totals is not None
+
+    @property
+    def ready(self) -> bool:
+        """มียอดสรุปแล้วหรือยัง (False = ต้อง rebuild จากประวัติก่อนใช้) — ไฟล์รูปแบบเก่าที่ไม่มีจำนวนแถวถือว่าไม่มี"""
+        if self._totals is None:
+            data = _read_json(self._file(TOTALS))
+            if data and "pairs" in data:
+                self._totals = data["pairs"]
+                self._counts = {"trades": 0, "realized": 0, **data.get("counts", {})}
+        return self._totals is not None
+
+    @property
+    def counts(self) -> Dict[str, int]:
+        """จำนวนแถว trades / realized ที่ยอดสรุปนับรวมแล้ว"""
+        return dict(self._counts)
+
+    def _month(self, month: str) -> Dict[str, Dict[str, Dict[str, float]]]:
+        m = self._months.get(month)
+        if m is None:
+            m = self._months[month] = _read_json(self._file(month)) or {}
+        return m
+
+    def _day(self, ts) -> str:
+        """วันที่ของดีลตามเขตเวลาของรายงาน (เวลาที่ไม่มี timezone ถือว่าเป็นเวลาท้องถิ่นอยู่แล้ว)"""
+        try:
+            dt = datetime.fromisoformat(str(ts).replace("Z", "+00:00"))
+        except ValueError:
+            dt = datetime.now(self.tz)
+        if dt.tzinfo is not None:
+            dt = dt.astimezone(self.tz)
+        return dt.date().isoformat()
+
+    def today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    # ---------- อัปเดต ----------
+
+    def _add(self, table: str, ts, pair: str, **values) -> None:
+        if self._totals is None:
+            self._totals = {}
+        self._counts[table] += 1
+        day = self._day(ts)
+        month = day[:7]
+        for stats in (self._month(month).setdefault(day, {}).setdefault(pair, dict.fromkeys(FIELDS, 0)),
+                      self._totals.setdefault(pair, dict.fromkeys(FIELDS, 0))):
+            for k, v in values.items():
+                stats[k] = stats.get(k, 0) + v
+        self._dirty.update((month, TOTALS))
+        if not self._depth:
+            self.flush()
+
+    def add_trade(self, ts, pair, price, qty, fee) -> None:
+        self._add("trades", ts, pair or "?", trades=1, volume=_num(price) * _num(qty), fees=_num(fee))
+
+    def add_realized(self, ts, pair, pnl) -> None:
+        pnl = _num(pnl)
+        self._add("realized", ts, pair or "?", sells=1, wins=int(pnl > 0), losses=int(pnl < 0), realized=pnl)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """รวมการอัปเดตใน transaction ของ ledger: flush ครั้งเดียวตอนจบ, ทิ้งถ้า transaction ล้ม"""
+        self._depth += 1
+        ok = False
+        try:
+            yield
+            ok = True
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                if ok:
+                    self.flush()
+                else:
+                    # อ่านจากดิสก์ใหม่ครั้งหน้า (TradeStorage จะตรวจจำนวนแถวกับ ledger อีกรอบ)
+                    self._totals, self._months, self._dirty = None, {}, set()
+
+    def flush(self) -> None:
+        if not self.path:
+            self._dirty.clear()
+            return
+        # เขียน totals ท้ายสุด: ถ้าหยุดกลางคัน ไฟล์เดือนอาจใหม่กว่า totals แต่ไม่มีทางกลับกัน
+        for month in sorted(self._dirty - {TOTALS}):
+            _write_json(self._file(month), self._months[month])
+        if TOTALS in self._dirty:
+            _write_json(self._file(TOTALS), {"counts": self._counts, "pairs": self._totals})
+        self._dirty.clear()
+
+    def rebuild(self, trades: Iterable[Dict[str, Any]], realized: Iterable[Dict[str, Any]]) -> None:
+        """สร้างยอดสรุปใหม่ทั้งหมดจากแถว trades / realized (dict ตามหัวตาราง)"""
+        if self.path:
+            # ลบ totals ก่อน: ถ้าหยุดกลางคัน ครั้งหน้าจะ rebuild ใหม่
+            for name in sorted(os.listdir(self.path), key=lambda n: n != TOTALS + ".json"):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.path, name))
+        self._totals, self._months, self._dirty = {}, {}, {TOTALS}
+        self._counts = {"trades": 0, "realized": 0}
+        depth, self._depth = self._depth, 1
+        try:
+            for r in trades:
+                self.add_trade(r.get("ts_iso"), r.get("pair"), r.get("price"), r.get("qty"), r.get("fee"))
+            for r in realized:
+                self.add_realized(r.get("ts_iso"), r.get("pair"), r.get("realized_pnl"))
+        finally:
+            self._depth = depth
+        if not depth:
+            # อยู่ใน batch (เช่น replay ใน transaction): เขียนตอน batch จบ, ทิ้งถ้า transaction ล้ม
+            self.flush()
+
+    # ---------- อ่าน ----------
+
+    def period_range(self, period: str, today: date = None) -> Tuple[Optional[date], Optional[date]]:
+        """day | week | month | all | YYYY-MM | YYYY-MM-DD → (วันแรก, วันสุดท้าย); all = (None, None)"""
+        today = today or self.today()
+        if period == "all":
+            return None, None
+        if period == "day":
+            return today, today
+        if period == "week":
+            return today - timedelta(days=today.weekday()), today
+        if period == "month":
+            return today.replace(day=1), today
+        try:
+            if len(period) == 7:
+                start = date.fromisoformat(period + "-01")
+                end = (start + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+                return start, end
+            d = date.fromisoformat(period)
+            return d, d
+        except ValueError:
+            raise ValueError(f"ช่วงเวลาไม่ถูกต้อง: {period} (ใช้ {' | '.join(PERIODS)} | YYYY-MM | YYYY-MM-DD)")
+
+    def summary(self, start: Optional[date] = None, end: Optional[date] = None) -> Dict[str, Dict[str, float]]:
+        """ยอดต่อคู่ในช่วง [start, end] — ไม่ระบุ = ตลอดทั้งหมด (อ่าน totals อย่างเดียว)"""
+        if start is None:
+            return {p: dict(s) for p, s in self._totals.items()} if self.ready else {}
+        out: Dict[str, Dict[str, float]] = {}
+        month = start.replace(day=1)
+        lo, hi = start.isoformat(), end.isoformat()
+        while month <= end:
+            for day, pairs in self._month(month.isoformat()[:7]).items():
+                if lo <= day <= hi:
+                    for pair, stats in pairs.items():
+                        acc = out.setdefault(pair, dict.fromkeys(FIELDS, 0))
+                        for k, v in stats.items():
+                            acc[k] = acc.get(k, 0) + v
+            month = (month + timedelta(days=31)).replace(day=1)
+        return out
+
+    def report(self, period: str = "month", today: date = None) -> Dict[str, Any]:
+        start, end = self.period_range(period, today)
+        return {"period": period, "start": start, "end": end, "pairs": self.summary(start, end)}
+
+_LABELS = {"day": "วันนี้", "week": "สัปดาห์นี้", "month": "เดือนนี้", "all": "ทั้งหมด"}
+
+def _line(name: str, s: Dict[str, float]) -> str:
+    sells = int(s.get("sells", 0))
+    win = f"ชนะ {s.get('wins', 0) / sells * 100:.0f}%" if sells else "ชนะ -"
+    return (f"- {name}: P&L {s.get('realized', 0):+.6f} | ขาย {sells} ครั้ง {win} | "
+            f"fee {s.get('fees', 0):.6f} | {int(s.get('trades', 0))} ดีล")
+
+def format_report(rep: Dict[str, Any]) -> str:
+    label = _LABELS.get(rep["period"], rep["period"])
+    if rep["start"] is not None:
+        label += f" ({rep['start']}" + (f" – {rep['end']})" if rep["end"] != rep["start"] else ")")
+    pairs = rep["pairs"]
+    if not pairs:
+        return f"P&L {label}: ยังไม่มีดีลในช่วงนี้ค่ะ"
+    total = dict.fromkeys(FIELDS, 0)
+    for s in pairs.values():
+        for k in FIELDS:
+            total[k] += s.get(k, 0)
+    lines = [f"P&L {label}:"]
+    for pair, s in sorted(pairs.items(), key=lambda kv: -kv[1].get("realized", 0)):
+        lines.append(_line(pair, s))
+    lines.append(_line("รวม", total))
+    return "\n".join(lines)
+
+def main():
+    from storage import TradeStorage
+    ap = argparse.ArgumentParser(description="ยอดสรุป P&L (/report)")
+    ap.add_argument("cmd", choices=("rebuild", "report"))
+    ap.add_argument("period", nargs="?", default="month")
+    ap.add_argument("--user", default=None, help="chat id ของ ledger ผู้ใช้ (ค่าเริ่มต้น: ledger รวมใน data/)")
+    args = ap.parse_args()
+    storage = TradeStorage(shard=args.user)
+    try:
+        if args.cmd == "rebuild":
+            storage.rebuild_aggregates()
+        print(format_report(storage.report(args.period)))
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    main()
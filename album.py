@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+logger = logging.getLogger("tradebot.album")
+
+class AlbumCollector:
+    """รวมรูปที่ส่งมาเป็นอัลบั้ม (media group) ให้เป็นก้อนเดียวก่อนประมวลผล
+
+    Telegram ส่งรูปในอัลบั้มมาเป็น update แยกกันทีละรูปที่มี media_group_id เดียวกัน
+    และไม่บอกว่าอัลบั้มมีกี่รูป — จึงรอจนไม่มีรูปใหม่ของกลุ่มนั้นเข้ามาอีก window_sec วินาที
+    (นับใหม่ทุกครั้งที่มีรูปเข้ามา) แล้วเรียก on_album(updates, context) ครั้งเดียว
+    โดยเรียง update ตามลำดับ message_id
+    """
+
+    def __init__(self, on_album: Callable[[List[Any], Any], Awaitable[None]], window_sec: float = 1.5,
+                 max_photos: int = 10):
+        self.on_album = on_album
+        self.window = window_sec
+        self.max_photos = max_photos
+        self._groups: Dict[Tuple[Any, str], Dict[str, Any]] = {}
+
+    @classmethod
+    def from_config(cls, cfg: dict, on_album: Callable[[List[Any], Any], Awaitable[None]]) -> "AlbumCollector":
+        c = cfg.get("album") or {}
+        return cls(on_album, window_sec=float(c.get("window_sec", 1.5)), max_photos=int(c.get("max_photos", 10)))
+
+    @property
+    def pending(self) -> int:
+        return len(self._groups)
+
+    def add(self, update, context) -> None:
+        key = (update.effective_chat.id if update.effective_chat else None, update.message.media_group_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = {"updates": [], "context": context, "task": None}
+        else:
+            group["task"].cancel()
+        group["updates"].append(update)
+        if len(group["updates"]) >= self.max_photos:
+            # อัลบั้มของ Telegram มีได้ไม่เกิน 10 รูป — ครบแล้วไม่ต้องรอต่อ
+            group["task"] = asyncio.create_task(self._flush(key, 0))
+        else:
+            group["task"] = asyncio.create_task(self._flush(key, self.window))
+
+    async def _flush(self, key, delay: float) -> None:
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            return
+        group = self._groups.pop(key, None)
+        if group is None:
+            return
+        updates = sorted(group["updates"], key=lambda u: u.message.message_id)
+        try:
+            await self.on_album(updates, group["context"])
+        except Exception:
+            logger.exception("ประมวลผลอัลบั้ม %s ไม่สำเร็จ", key[1])
@@ -0,0 +1,401 @@
+"""ทดสอบโหลดบอททั้งระบบแบบ offline: Application + handler จริงของ main.py คุยกับ Bot API ปลอมในเครื่อง
+
+    python -m bench.bot_load                                  # ผู้ใช้ 8 คน คนละ 5 รอบ, OCR จริง (ต้องมี tesseract)
+    python -m bench.bot_load --users 50 --rounds 10 --fake-ocr-ms 300   # จำลอง OCR 300 ms ต่อรูปใน worker
+    python -m bench.bot_load --concurrent-updates 0           # เทียบกับการประมวลผลทีละ update
+    python -m bench.bot_load --workers 2 --max-p99-ms 5000    # exit 1 ถ้า p99 เกินงบ
+    python -m bench.bot_load --burst-users 4                  # ผู้ใช้ที่ส่งรัวในแชทเดียวกัน 4 คน
+
+แต่ละรอบของผู้ใช้: ส่งรูปเดี่ยวหรืออัลบั้ม (--album-ratio) → รอ preview → ยืนยันด้วย 'ok' หรือส่งแก้ไขเป็น JSON
+(--correction-ratio) → รอบอทตอบรับ และ (ถ้าเปิด journal) รอข้อความถูกแก้เป็นผล P&L
+ผู้ใช้ส่งรัว (--burst-users): ส่ง รูป, 'ok', รูป, 'ok' ติดกันโดยไม่รอคำตอบ แล้ว /auto_on + รูปสองใบติดกัน —
+คำตอบต้องมาตามลำดับที่ส่ง และ 'ok' ต้องยืนยันดีลของรูปก่อนหน้า (ไม่งั้นนับเป็น burst_mismatch)
+วัดเวลาตั้งแต่ update เข้าคิวของ Bot API จนบอทตอบ แยกตามชนิด, throughput, ความลึกคิว
+(update ที่บอทยังไม่ดึง / รูปที่รอ OCR / journal backlog), event loop lag และ error
+
+บอทรันในโฟลเดอร์ชั่วคราว (คัดลอก *.yaml แล้วปรับ config ตาม option) จึงไม่แตะ data/ จริง
+exit 1 ถ้ามี error/timeout หรือเกิน --max-p99-ms / --max-lag-ms
+"""
+import io
+import os
+import re
+import sys
+import glob
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+import statistics
+from collections import defaultdict
+from typing import Any, Dict, List, Optional
+
+import yaml
+
+from bench import slips as slipgen
+from bench.fake_telegram import FakeBotAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHAT0 = 900_000_000
+QUEUE_NOTICE = "ตอนนี้มีรูปรอประมวลผลอยู่ค่ะ"
+APPLYING = "กำลังอัปเดต position"
+TRADE_KINDS = ["binance_spot", "binance_convert", "mexc_spot", "pionex_grid"]
+
+def _fake_ocr(data) -> tuple:
+    """แทน ocr_engine.extract_text_timed ใน worker: หน่วงตาม BENCH_FAKE_OCR_MS แล้วคืนข้อความที่ฝังมากับรูป"""
+    from PIL import Image
+    delay = float(os.environ.get("BENCH_FAKE_OCR_MS", "0")) / 1000
+    t0 = time.perf_counter()
+    text = Image.open(io.BytesIO(bytes(data))).info.get("slip", "")
+    while time.perf_counter() - t0 < delay:   # ใช้ CPU จริงเหมือน tesseract (ไม่ใช่ sleep)
+        pass
+    return text, {"tesseract": time.perf_counter() - t0}, {"peak_rss_mb": 0.0, "rss_mb": 0.0, "layout": "fake"}
+
+def _fake_image(slip, rnd: random.Random) -> bytes:
+    """PNG เล็ก ๆ ที่ไม่ซ้ำกัน (ไม่โดนแคช) และฝังข้อความในอุดมคติไว้ใน tEXt ให้ _fake_ocr อ่าน"""
+    from PIL import Image, PngImagePlugin
+    img = Image.frombytes("L", (120, 240), rnd.randbytes(120 * 240))
+    info = PngImagePlugin.PngInfo()
+    info.add_text("slip", slip.text)
+    buf = io.BytesIO()
+    img.save(buf, format="PNG", pnginfo=info)
+    return buf.getvalue()
+
+def _images(n: int, fake: bool, seed: int) -> List[bytes]:
+    rnd = random.Random(seed)
+    langs = ("en", "th") if fake or slipgen.THAI_FONT else ("en",)
+    slips = slipgen.generate(n, seed=seed, kinds=TRADE_KINDS, langs=langs, with_images=not fake)
+    return [_fake_image(s, rnd) if fake else s.encode("JPEG", quality=85) for s in slips]
+
+def _burst_images(n: int, fake: bool, seed: int) -> List[tuple]:
+    """(รูป, ค่าจริง) ของสลิป BUY แบบ Binance spot — ข้อความตอบรับแสดง qty ตามสลิปเสมอ (SELL อาจถูกตัดตาม position)"""
+    rnd = random.Random(seed)
+    slips = [s for s in slipgen.generate(n * 4, seed=seed, kinds=["binance_spot"], langs=("en",), with_images=False)
+             if s.truth["side"] == "BUY"][:n]
+    out = []
+    for s in slips:
+        if not fake:
+            s.image = slipgen.render(s, rnd)
+        out.append((_fake_image(s, rnd) if fake else s.encode("JPEG", quality=85), s.truth))
+    return out
+
+def _workdir(args) -> str:
+    """โฟลเดอร์ชั่วคราวที่มี *.yaml ของ repo และ config ที่ปรับตาม option"""
+    tmp = tempfile.mkdtemp(prefix="bot_load_")
+    for path in glob.glob(os.path.join(ROOT, "*.yaml")):
+        shutil.copy(path, tmp)
+    with open(os.path.join(tmp, "config.yaml"), encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg["auto_accept"] = False
+    cfg.setdefault("metrics", {}).update({"prometheus_port": 0, "profiler": False})
+    cfg.setdefault("journal", {})["enabled"] = not args.no_journal
+    cfg.setdefault("ocr_pool", {})["workers"] = args.workers
+    cfg["ocr_pool"]["max_queue"] = max(int(cfg["ocr_pool"].get("max_queue", 32)),
+                                       args.users * args.album_size + args.burst_users * 2)
+    cfg.setdefault("layouts", {})["learn"] = False
+    cfg["storage_backend"] = args.backend
+    cfg["use_google_sheets"] = False
+    if args.concurrent_updates is not None:
+        cfg.setdefault("telegram", {})["concurrent_updates"] = args.concurrent_updates
+    with open(os.path.join(tmp, "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True)
+    return tmp
+
+def _pct(xs: List[float], q: float) -> float:
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] * 1000 if xs else 0.0
+
+class Traffic:
+    """ผู้ใช้ปลอม N คน รันใน event loop ของตัวเอง (thread แยกจากบอท) ไม่ให้แย่ง event loop ของบอท"""
+
+    def __init__(self, api: FakeBotAPI, args, images: List[bytes], journal: bool, depth, burst: List[tuple] = ()):
+        self.api = api
+        self.args = args
+        self.images = iter(images[1:])   # รูปแรกใช้อุ่น worker
+        self.burst = iter(burst)
+        self.journal = journal
+        self.depth = depth
+        self.lat: Dict[str, List[float]] = defaultdict(list)
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.inbox: Dict[int, asyncio.Queue] = {}
+        self.edits: Dict[int, Dict[int, float]] = defaultdict(dict)
+
+    def on_reply(self, method: str, msg: Dict[str, Any]) -> None:
+        # เรียกจาก thread ของ Bot API ปลอม
+        t = time.perf_counter()
+        q = self.inbox.get(msg["chat"]["id"])
+        if q is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(q.put_nowait, (t, method, msg))
+
+    async def _next(self, chat: int) -> Optional[tuple]:
+        """ข้อความตอบถัดไปของ chat นี้ (ข้ามการแจ้งลำดับคิว; เก็บการแก้ข้อความที่มาช้าไว้ใช้ทีหลัง)"""
+        deadline = time.perf_counter() + self.args.timeout
+        while True:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return None
+            try:
+                t, method, msg = await asyncio.wait_for(self.inbox[chat].get(), left)
+            except asyncio.TimeoutError:
+                return None
+            if method == "editMessageText":
+                self.edits[chat][msg["message_id"]] = t
+            elif msg.get("text", "").startswith(QUEUE_NOTICE):
+                self.counts["queue_notices"] += 1
+            else:
+                return t, msg
+
+    async def _edited(self, chat: int, message_id: int) -> Optional[float]:
+        deadline = time.perf_counter() + self.args.timeout
+        while message_id not in self.edits[chat]:
+            left = deadline - time.perf_counter()
+            if left <= 0:
+                return None
+            try:
+                t, method, msg = await asyncio.wait_for(self.inbox[chat].get(), left)
+            except asyncio.TimeoutError:
+                return None
+            if method == "editMessageText":
+                self.edits[chat][msg["message_id"]] = t
+        return self.edits[chat].pop(message_id)
+
+    async def _user(self, u: int) -> None:
+        chat = CHAT0 + u
+        rnd = random.Random(u)
+        self.inbox[chat] = asyncio.Queue()
+        await asyncio.sleep(rnd.uniform(0, self.args.think_ms / 1000))
+        for r in range(self.args.rounds):
+            album = rnd.random() < self.args.album_ratio
+            kind = "album" if album else "photo"
+            t0 = time.perf_counter()
+            for _ in range(self.args.album_size if album else 1):
+                self.api.push_message(chat, photo=next(self.images), media_group_id=f"{chat}-{r}" if album else None)
+            got = await self._next(chat)
+            if got is None:
+                self.counts[f"timeout.{kind}"] += 1
+                continue
+            self.lat[kind].append(got[0] - t0)
+
+            if rnd.random() < self.args.correction_ratio:
+                how, text = "json", json.dumps({"1": {"fee": 0.01}} if album else {"fee": 0.01})
+            else:
+                how, text = "ok", "ok"
+            t0 = time.perf_counter()
+            self.api.push_message(chat, text=text)
+            got = await self._next(chat)
+            if got is None:
+                self.counts[f"timeout.{how}"] += 1
+                continue
+            t, msg = got
+            self.lat[how].append(t - t0)
+            if (APPLYING if self.journal else "สำเร็จ") not in msg["text"]:
+                self.counts["incomplete"] += 1   # OCR อ่านไม่ครบ — ดีลไม่ถูกบันทึก
+                continue
+            self.counts["trades"] += self.args.album_size if album else 1
+            if self.journal:
+                t = await self._edited(chat, msg["message_id"])
+                if t is None:
+                    self.counts["timeout.applied"] += 1
+                    continue
+                self.lat["applied"].append(t - t0)
+            await asyncio.sleep(rnd.uniform(0, self.args.think_ms / 1000))
+
+    async def _burst_user(self, b: int) -> None:
+        chat = CHAT0 + self.args.users + b
+        self.inbox[chat] = asyncio.Queue()
+        acks: List[int] = []
+        for _ in range(self.args.rounds):
+            shots = [next(self.burst) for _ in range(2)]
+            t0 = time.perf_counter()
+            for data, _ in shots:
+                self.api.push_message(chat, photo=data)
+                self.api.push_message(chat, text="ok")
+            for _ in shots:
+                preview, accepted = await self._next(chat), await self._next(chat)
+                if preview is None or accepted is None:
+                    self.counts["timeout.burst"] += 1
+                    return
+                qty = re.search(r"qty: (\S+)", preview[1]["text"])
+                if not qty or f"qty={qty.group(1)} " not in accepted[1]["text"]:
+                    self.counts["burst_mismatch"] += 1
+                acks.append(accepted[1]["message_id"])
+            self.lat["burst"].append(accepted[0] - t0)
+            self.counts["trades"] += len(shots)
+
+        # บันทึกอัตโนมัติ: ดีลต้องถูกรับตามลำดับรูป
+        self.api.push_message(chat, text="/auto_on")
+        if await self._next(chat) is None:
+            self.counts["timeout.burst"] += 1
+            return
+        shots = [next(self.burst) for _ in range(2)]
+        for data, _ in shots:
+            self.api.push_message(chat, photo=data)
+        for _, truth in shots:
+            got = await self._next(chat)
+            if got is None:
+                self.counts["timeout.burst"] += 1
+                return
+            if f"qty={truth['qty']} " not in got[1]["text"]:
+                self.counts["burst_mismatch"] += 1
+            acks.append(got[1]["message_id"])
+        self.counts["trades"] += len(shots)
+        if self.journal:
+            # รอผล P&L ของทุกดีลก่อนจบ (ไม่ให้ข้อความแก้มาถึงหลังเลิกวัด)
+            for mid in acks:
+                if await self._edited(chat, mid) is None:
+                    self.counts["timeout.applied"] += 1
+
+    async def _sample(self) -> None:
+        while True:
+            for name, value in self.depth().items():
+                self.samples[name].append(value)
+            await asyncio.sleep(0.02)
+
+    async def _run(self) -> float:
+        self.loop = asyncio.get_running_loop()
+        sampler = asyncio.create_task(self._sample())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(self._user(u) for u in range(self.args.users)),
+                             *(self._burst_user(b) for b in range(self.args.burst_users)))
+        elapsed = time.perf_counter() - t0
+        sampler.cancel()
+        return elapsed
+
+    def run(self) -> float:
+        return asyncio.run(self._run())
+
+async def _loop_lag(out: List[float], interval: float = 0.005) -> None:
+    """เวลาที่ event loop ของบอทตื่นช้ากว่ากำหนด — ค่าสูง = มีงาน sync บล็อก loop"""
+    while True:
+        t0 = time.perf_counter()
+        await asyncio.sleep(interval)
+        out.append(time.perf_counter() - t0 - interval)
+
+async def _run(args, images: List[bytes], burst: List[tuple]) -> Dict[str, Any]:
+    import main
+    import metrics
+
+    if args.fake_ocr_ms is not None:
+        # import ผ่านชื่อ module (ไม่ใช่ __main__) ให้ worker unpickle ฟังก์ชันได้
+        from bench.bot_load import _fake_ocr as fake
+        main.extract_text_timed = fake
+    traffic: Optional[Traffic] = None
+    api = FakeBotAPI(on_reply=lambda m, msg: traffic and traffic.on_reply(m, msg)).start()
+
+    def depth() -> Dict[str, float]:
+        d = {"updates": api.pending, "ocr_waiting": main.ocr_pool.waiting, "ocr_running": main.ocr_pool.running}
+        if main.journal:
+            d["journal_backlog"] = main.journal.backlog
+        return d
+
+    traffic = Traffic(api, args, images, main.journal is not None, depth, burst)
+    app = main.build_app("1:FAKE", api.base_url, api.base_file_url)
+    lag: List[float] = []
+    async with app:
+        await app.post_init(app)
+        await app.updater.start_polling(poll_interval=0.0, timeout=5)
+        await app.start()
+        lagger = asyncio.create_task(_loop_lag(lag))
+        # อุ่น worker ให้ครบก่อนจับเวลา (fork + โหลดโมเดล)
+        await asyncio.gather(*(main.ocr_pool.run(main.extract_text_timed, images[0])
+                               for _ in range(max(1, main.ocr_pool.workers))))
+        lag.clear()
+        elapsed = await asyncio.to_thread(traffic.run)
+        lagger.cancel()
+        # ผู้ใช้เห็นข้อความแก้ครบแล้ว แต่คำขอ editMessageText สุดท้ายอาจยังรอคำตอบอยู่ — ให้จบก่อนปิด Bot API ปลอม
+        await asyncio.gather(*list(main._background), return_exceptions=True)
+        await app.updater.stop()
+        await app.stop()
+        await app.post_shutdown(app)
+    api.stop()
+    errors = {k: v for k, v in metrics.get().errors.items() if v}
+    return {"elapsed": elapsed, "traffic": traffic, "lag": lag, "errors": errors,
+            "workers": main.ocr_pool.workers, "calls": dict(api.calls)}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", type=int, default=8)
+    ap.add_argument("--rounds", type=int, default=5, help="จำนวนรอบ (รูป/อัลบั้ม + ยืนยัน) ต่อผู้ใช้")
+    ap.add_argument("--album-ratio", type=float, default=0.25, help="สัดส่วนรอบที่ส่งเป็นอัลบั้ม")
+    ap.add_argument("--album-size", type=int, default=3)
+    ap.add_argument("--correction-ratio", type=float, default=0.3, help="สัดส่วนรอบที่ยืนยันด้วย JSON แก้ไข")
+    ap.add_argument("--think-ms", type=float, default=200.0, help="ผู้ใช้เว้นระหว่างรอบสุ่ม 0..ค่านี้")
+    ap.add_argument("--burst-users", type=int, default=2, help="ผู้ใช้ที่ส่งรูป/'ok' รัวในแชทเดียวโดยไม่รอคำตอบ")
+    ap.add_argument("--workers", type=int, default=0, help="จำนวน OCR worker (0 = เท่าจำนวน core)")
+    ap.add_argument("--concurrent-updates", type=int, default=None, help="ค่าเริ่มต้น: telegram.concurrent_updates ใน config")
+    ap.add_argument("--backend", choices=("csv", "sqlite"), default="csv")
+    ap.add_argument("--no-journal", action="store_true", help="ลง ledger ตรง ๆ แล้วค่อยตอบ")
+    ap.add_argument("--fake-ocr-ms", type=float, default=None, help="ไม่ใช้ tesseract: จำลอง OCR ที่ใช้ CPU เท่านี้ต่อรูป")
+    ap.add_argument("--timeout", type=float, default=60.0, help="วินาทีที่รอคำตอบแต่ละครั้ง")
+    ap.add_argument("--max-p99-ms", type=float, default=None, help="งบ p99 ของรูป/อัลบั้ม/ยืนยัน")
+    ap.add_argument("--max-lag-ms", type=float, default=None, help="งบ event loop lag สูงสุด")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    if args.fake_ocr_ms is None and not (shutil.which("tesseract") or _has_tesserocr()):
+        sys.exit("ไม่พบ tesseract — ติดตั้งก่อน หรือใช้ --fake-ocr-ms เพื่อจำลอง OCR")
+    if args.fake_ocr_ms is not None:
+        os.environ["BENCH_FAKE_OCR_MS"] = str(args.fake_ocr_ms)
+    n_images = args.users * args.rounds * args.album_size + 1
+    images = _images(n_images, args.fake_ocr_ms is not None, args.seed)
+    burst = _burst_images(args.burst_users * (args.rounds + 1) * 2, args.fake_ocr_ms is not None, args.seed + 1)
+
+    sys.path.insert(0, ROOT)
+    cwd = os.getcwd()
+    work = _workdir(args)
+    os.environ["TRADEBOT_CONFIG_DIR"] = work   # *.yaml ที่ปรับแล้ว (worker ที่ fork ออกไปเห็นด้วย)
+    os.chdir(work)                             # data/ ของรอบนี้
+    try:
+        res = asyncio.run(_run(args, images, burst))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work, ignore_errors=True)
+
+    tr: Traffic = res["traffic"]
+    ocr = f"จำลอง {args.fake_ocr_ms:.0f} ms" if args.fake_ocr_ms is not None else "tesseract"
+    print(f"ผู้ใช้ {args.users} คน (+ส่งรัว {args.burst_users}) x {args.rounds} รอบ, OCR worker {res['workers']} ({ocr}), "
+          f"concurrent_updates={args.concurrent_updates if args.concurrent_updates is not None else 'config'}, "
+          f"journal={'off' if args.no_journal else 'on'}, backend={args.backend}")
+    print(f"{'ชนิด':<8} {'n':>5} {'p50 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    worst = 0.0
+    for kind in ("photo", "album", "ok", "json", "burst", "applied"):
+        xs = tr.lat.get(kind)
+        if xs:
+            print(f"{kind:<8} {len(xs):>5} {statistics.median(xs) * 1000:>9.1f} {_pct(xs, 0.99):>9.1f} {max(xs) * 1000:>9.1f}")
+            if kind not in ("applied", "burst"):
+                worst = max(worst, _pct(xs, 0.99))
+    actions = sum(len(v) for k, v in tr.lat.items() if k not in ("applied", "burst"))
+    print(f"throughput: {actions / res['elapsed']:.1f} คำตอบ/s, {tr.counts['trades'] / res['elapsed']:.1f} ดีล/s "
+          f"({res['elapsed']:.1f}s)")
+    print("คิว (สูงสุด/เฉลี่ย): " + ", ".join(f"{k} {max(v):.0f}/{statistics.fmean(v):.1f}"
+                                              for k, v in tr.samples.items() if v))
+    lag_p99, lag_max = _pct(res["lag"], 0.99), max(res["lag"], default=0.0) * 1000
+    print(f"event loop lag: p99 {lag_p99:.1f} ms, max {lag_max:.1f} ms")
+    timeouts = {k: v for k, v in tr.counts.items() if k.startswith("timeout.")}
+    print(f"error: timeout {timeouts or 0}, handler/metrics {res['errors'] or 0}, "
+          f"อ่านสลิปไม่ครบ {tr.counts['incomplete']}, แจ้งคิว {tr.counts['queue_notices']}, "
+          f"ส่งรัวแล้วตอบผิดลำดับ/ยืนยันผิดดีล {tr.counts['burst_mismatch']}")
+
+    failed = bool(timeouts or res["errors"] or tr.counts["burst_mismatch"])
+    if args.max_p99_ms is not None and worst > args.max_p99_ms:
+        print(f"p99 {worst:.0f} ms เกินงบ {args.max_p99_ms:.0f} ms")
+        failed = True
+    if args.max_lag_ms is not None and lag_max > args.max_lag_ms:
+        print(f"event loop lag {lag_max:.0f} ms เกินงบ {args.max_lag_ms:.0f} ms")
+        failed = True
+    if failed:
+        sys.exit(1)
+
+def _has_tesserocr() -> bool:
+    try:
+        import tesserocr  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+if __name__ == "__main__":
+    main()
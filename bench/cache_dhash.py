@@ -0,0 +1,98 @@
+"""ตรวจว่าแคชชั้น dHash ไม่รวมสลิปคนละใบที่หน้าตาเหมือนกัน
+
+    python -m bench.cache_dhash                  # OCR จริงถ้ามี tesseract ไม่งั้นใช้ข้อความในอุดมคติของสลิป
+    python -m bench.cache_dhash --ideal --n 10
+
+สร้างสลิปคู่แฝด: แม่แบบ/ขนาด/ธีม/กราฟเดียวกัน ต่างกันแค่จำนวน (และยอดรวม/ค่าธรรมเนียม) — dHash ของคู่นี้
+แทบเท่ากัน แล้วส่งผ่านลำดับเดียวกับ _read_slip ของบอท (SHA-256 → near_dhash → OCR → confirm_near → put)
+exit 1 ถ้าสลิปแฝดได้ผลของใบแรก (ข้อความหรือจำนวนเดียวกับใบแรก)
+รายงานด้วยว่ารูปเดิมที่ถูกบีบอัดซ้ำ (JPEG คุณภาพต่ำลง) ถูกยืนยันว่าเป็นรูปเดิมกี่ใบ
+"""
+import sys
+import random
+import argparse
+import tempfile
+import dataclasses
+
+from bench import slips as slipgen
+from bench.stages import _tesseract_available
+from ocr_cache import OCRCache, sha256_bytes, image_dhash
+from parser_engine import parse_trade_from_text
+
+def _twin(slip: slipgen.Slip, seed: int) -> slipgen.Slip:
+    """สลิปแม่แบบเดียวกัน จำนวนต่างออกไป (ราคา/คู่/เวลา/กราฟเหมือนเดิม)"""
+    t = slip.truth
+    qty = slipgen._shown(t["qty"] * 1.5 + 0.37)
+    fee = slipgen._shown(qty * t["price"] * 0.001)
+    quote = t["pair"].split("/")[1]
+    values = {f"Filled ({t['pair'].split('/')[0]})": qty, f"Fee ({quote})": fee, f"Total ({quote})": t["price"] * qty}
+    lines = [(a, slipgen._fmt(values[a]) if a in values else b) for a, b in slip.lines]
+    twin = dataclasses.replace(slip, lines=lines, truth={**t, "qty": qty, "fee": fee}, image=None)
+    twin.image = slipgen.render(twin, random.Random(seed))
+    return twin
+
+def _lookup(cache: OCRCache, data: bytes, read) -> dict:
+    """ลำดับเดียวกับ main._read_slip (ไม่มีขั้น file_unique_id)"""
+    sha = sha256_bytes(data)
+    hit = cache.get_by_sha256(sha)
+    if hit is not None:
+        return hit
+    dhash = image_dhash(data)
+    near = cache.near_dhash(dhash)
+    text = read(data)
+    same = cache.confirm_near(near, text)
+    trade = same["trade"] if same else parse_trade_from_text(text)
+    return cache.put(sha, text, trade, dhash=dhash)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=6, help="จำนวนคู่สลิป")
+    ap.add_argument("--seed", type=int, default=11)
+    ap.add_argument("--ideal", action="store_true", help="ไม่ OCR จริง ใช้ข้อความในอุดมคติของสลิปแทน")
+    args = ap.parse_args()
+
+    ocr = not args.ideal and _tesseract_available()
+    if ocr:
+        from ocr_engine import extract_text_from_bytes as read_image
+    texts = {}
+
+    def read(data: bytes) -> str:
+        return read_image(data) if ocr else texts[data]
+
+    bad = near_pairs = resent = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = OCRCache(cache_dir=tmp)
+        base = slipgen.generate(args.n, seed=args.seed, kinds=["binance_spot"], langs=("en",), with_images=False)
+        for i, slip in enumerate(base):
+            seed = args.seed * 1000 + i
+            slip.image = slipgen.render(slip, random.Random(seed))
+            twin = _twin(slip, seed)
+            a, b, again = slip.encode("JPEG", quality=90), twin.encode("JPEG", quality=90), slip.encode("JPEG", quality=60)
+            texts.update({a: slip.text, b: twin.text, again: slip.text})
+            dist = (image_dhash(a) ^ image_dhash(b)).bit_count()
+            near_pairs += dist <= cache.phash_distance
+
+            first = _lookup(cache, a, read)
+            second = _lookup(cache, b, read)
+            before = cache.stats["dhash_same"]
+            _lookup(cache, again, read)
+            resent += cache.stats["dhash_same"] - before
+
+            got = (second.get("trade") or {}).get("qty")
+            # OCR จริงอาจอ่านตัวเลขผิดเอง — ที่ตรวจคือไม่ได้ผลของใบแรกกลับมา
+            ok = second["text"] != first["text"] and got != (first.get("trade") or {}).get("qty")
+            if not ocr:
+                ok = ok and got == twin.truth["qty"]
+            bad += not ok
+            print(f"#{i} dHash ห่าง {dist:>2} บิต  จำนวนใบแรก {slip.truth['qty']:<10} ใบแฝด {twin.truth['qty']:<10} "
+                  f"อ่านได้ {got}  {'ok' if ok else 'ผิด: ได้ผลของใบแรก/อ่านไม่ตรง'}")
+
+        print(f"OCR {'จริง' if ocr else 'ในอุดมคติ'}: คู่ที่ dHash อยู่ในระยะ {cache.phash_distance} บิต "
+              f"{near_pairs}/{args.n}, รูปเดิมที่บีบอัดซ้ำถูกยืนยันว่าเป็นรูปเดิม {resent}/{args.n}")
+        print(cache.stats_text())
+    if bad:
+        print(f"สลิปแฝดได้ผลผิด {bad}/{args.n} คู่")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
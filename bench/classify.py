@@ -0,0 +1,130 @@
+"""วัด throughput ของ classifier (regex คีย์เวิร์ดตัวเดียว) และการ parse แบบแยก route เทียบกับแบบเดิม
+
+    python -m bench.classify                          # สลิปสังเคราะห์ 500 ใบ
+    python -m bench.classify --corpus data/ocr_cache  # ข้อความ OCR จริง (.txt / .json ของแคช / .jsonl ของ ingest)
+    python -m bench.classify --corpus ingest_results.jsonl --rounds 20
+
+แบบเดิม = หา exchange ด้วย substring ทีละคีย์เวิร์ด แล้ว parse ด้วยทุก pattern family
+แบบใหม่ = classify รอบเดียว แล้ว parse เฉพาะ family ใน route ของ (exchange, ชนิดสลิป)
+รายงานเวลาต่อข้อความ, ข้อความต่อวินาที และจำนวนข้อความที่ผลต่างจากแบบเดิม (ควรเป็น 0)
+"""
+import os
+import json
+import time
+import argparse
+from collections import Counter
+from typing import List, Tuple
+
+import parser_engine
+from parser_engine import PatternRegistry, parse_trade_from_text
+
+def _legacy_guess_exchange(text: str) -> str:
+    t = text.lower()
+    for ex, keys in (parser_engine.CFG.get("exchange_keywords") or {}).items():
+        if any(k.lower() in t for k in keys):
+            return ex
+    return "unknown"
+
+def load_corpus(path: str) -> List[str]:
+    if path.endswith(".jsonl"):
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+        return [r["text"] for r in rows if r.get("text")]
+    texts = []
+    for dirpath, _, names in os.walk(path):
+        for name in sorted(names):
+            full = os.path.join(dirpath, name)
+            if name.endswith(".txt"):
+                with open(full, encoding="utf-8") as f:
+                    texts.append(f.read())
+            elif name.endswith(".json"):
+                with open(full, encoding="utf-8") as f:
+                    entry = json.load(f)
+                if isinstance(entry, dict) and entry.get("text"):
+                    texts.append(entry["text"])
+    return texts
+
+def synthetic_corpus(n: int, seed: int) -> Tuple[List[str], List[str]]:
+    from bench import slips as slipgen
+    slips = slipgen.generate(n=n, seed=seed, with_images=False)
+    return [s.text for s in slips], [s.kind for s in slips]
+
+def _per_text_us(fn, texts: List[str], rounds: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(rounds):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - t0) / (rounds * len(texts)) * 1e6
+
+def run(texts: List[str], rounds: int = 10):
+    routed = parser_engine.registry()
+    unrouted = PatternRegistry({k: v for k, v in routed.raw.items() if k != "routes"}, routed.version)
+
+    def legacy(text):
+        parser_engine._REGISTRY = unrouted
+        trade = parse_trade_from_text(text)
+        trade["exchange"] = _legacy_guess_exchange(text)
+        return trade
+
+    def current(text):
+        parser_engine._REGISTRY = routed
+        route = parser_engine.classify(text)
+        trade = parse_trade_from_text(text, route)
+        trade["exchange"] = route.exchange
+        return trade
+
+    try:
+        diffs = []
+        for t in texts:
+            a, b = legacy(t), current(t)
+            a.pop("exchange"), b.pop("exchange")
+            if a != b:
+                diffs.append((t, a, b))
+        parser_engine._REGISTRY = routed
+        text_bytes = sum(len(t.encode("utf-8")) for t in texts) / len(texts)
+        rows = [
+            ("exchange", _per_text_us(_legacy_guess_exchange, texts, rounds),
+                         _per_text_us(routed.classify, texts, rounds)),
+            ("parse", _per_text_us(legacy, texts, rounds), _per_text_us(current, texts, rounds)),
+        ]
+    finally:
+        parser_engine._REGISTRY = routed
+    return rows, diffs, text_bytes
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--corpus", help="โฟลเดอร์ .txt/.json หรือไฟล์ .jsonl ที่มีฟิลด์ text (ไม่ระบุ = สลิปสังเคราะห์)")
+    ap.add_argument("--n", type=int, default=500, help="จำนวนสลิปสังเคราะห์")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--rounds", type=int, default=10, help="จำนวนรอบที่วนทั้ง corpus")
+    args = ap.parse_args()
+
+    if args.corpus:
+        texts, kinds = load_corpus(args.corpus), None
+    else:
+        texts, kinds = synthetic_corpus(args.n, args.seed)
+    if not texts:
+        raise SystemExit("ไม่พบข้อความใน corpus")
+
+    rows, diffs, text_bytes = run(texts, args.rounds)
+    print(f"corpus: {len(texts)} ข้อความ, เฉลี่ย {text_bytes:.0f} bytes")
+    print(f"{'stage':<9} {'before (us)':>12} {'after (us)':>11} {'after texts/s':>14} {'speedup':>8}")
+    for name, before, after in rows:
+        print(f"{name:<9} {before:>12.1f} {after:>11.1f} {1e6 / after:>14.0f} {before / after:>7.2f}x")
+
+    routes = Counter()
+    for t in texts:
+        c = parser_engine.classify(t)
+        routes[(c.exchange, c.slip_type)] += 1
+    print("route:", ", ".join(f"{ex}/{st}={n}" for (ex, st), n in routes.most_common()))
+    if kinds:
+        labeled = [(t, k.split("_")[0]) for t, k in zip(texts, kinds) if k != "wallet"]
+        before = sum(_legacy_guess_exchange(t) == ex for t, ex in labeled)
+        after = sum(parser_engine.classify(t).exchange == ex for t, ex in labeled)
+        print(f"exchange ถูกต้อง: เดิม {before}/{len(labeled)}, ใหม่ {after}/{len(labeled)}")
+    print(f"ผล parse ต่างจากแบบเดิม: {len(diffs)} ข้อความ")
+    for t, a, b in diffs[:3]:
+        print("---", repr(t[:120]), "\n  เดิม:", a, "\n  ใหม่:", b)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""หน่วยความจำสูงสุดของการส่งออก ledger เทียบกับขนาด ledger (ควรคงที่ ไม่โตตามจำนวนแถว)
+
+    python -m bench.export                                  # 1k / 100k / 1M แถว, CSV backend → CSV
+    python -m bench.export --sizes 1000,200000 --backend sqlite --format parquet
+
+สร้าง trades/realized ปลอมตามขนาดที่กำหนด แล้ววัด peak ของ tracemalloc ระหว่าง export()
+exit 1 ถ้า peak เกิน --max-peak-mb หรือ ledger ที่ใหญ่ที่สุดใช้หน่วยความจำเกิน --max-growth เท่าของขนาดที่เล็กที่สุด
+ที่ยังเต็มก้อน (>= chunk_rows)
+"""
+import os
+import sys
+import csv
+import time
+import random
+import argparse
+import tempfile
+import tracemalloc
+from datetime import datetime, timedelta
+
+from export import export
+from storage import TradeStorage, CSVBackend, TRADE_HEADERS, REALIZED_HEADERS
+
+def _rows(n: int, seed: int = 3):
+    rnd = random.Random(seed)
+    t0 = datetime(2024, 1, 1)
+    for i in range(n):
+        ts = (t0 + timedelta(seconds=30 * i)).isoformat()
+        pair = f"C{i % 40}/USDT"
+        price, qty = round(100 * (1 + rnd.uniform(-0.2, 0.2)), 4), round(rnd.uniform(0.1, 2), 4)
+        yield ([ts, "binance", pair, "BUY" if i % 3 else "SELL", price, qty, 0.01, "USDT", price * qty, "", f"b{i}"],
+               [ts, pair, qty, 99.5, price, 0.01, round((price - 99.5) * qty, 6), "", f"b{i}"])
+
+def _build(kind: str, root: str, n: int) -> TradeStorage:
+    """เขียน ledger ตรง ๆ (ไม่ผ่าน PnLEngine) — เร็วพอสำหรับหลักล้านแถว"""
+    os.makedirs(root, exist_ok=True)
+    positions = [[f"C{i}/USDT", 1.0, 100.0, "2024-01-01T00:00:00"] for i in range(40)]
+    if kind == "sqlite":
+        from storage_sqlite import SQLiteBackend
+        be = SQLiteBackend(os.path.join(root, "ledger.db"))
+        batch_t, batch_r = [], []
+        for t, r in _rows(n):
+            batch_t.append(t)
+            batch_r.append(r)
+            if len(batch_t) >= 20000:
+                be.append_trades(batch_t)
+                be.append_realized_rows(batch_r)
+                batch_t, batch_r = [], []
+        be.append_trades(batch_t)
+        be.append_realized_rows(batch_r)
+        be.replace_positions(positions)
+    else:
+        be = CSVBackend(root)
+        with open(os.path.join(root, "trades.csv"), "w", newline="", encoding="utf-8") as ft, \
+                open(os.path.join(root, "realized.csv"), "w", newline="", encoding="utf-8") as fr:
+            wt, wr = csv.writer(ft), csv.writer(fr)
+            wt.writerow(TRADE_HEADERS)
+            wr.writerow(REALIZED_HEADERS)
+            for t, r in _rows(n):
+                wt.writerow(t)
+                wr.writerow(r)
+        be.replace_positions(positions)
+    st = TradeStorage(be)
+    st.aggregates = None   # ไม่เกี่ยวกับการส่งออก
+    return st
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--sizes", default="1000,100000,1000000", help="จำนวนแถวของ trades/realized คั่นด้วย ,")
+    ap.add_argument("--backend", choices=("csv", "sqlite"), default="csv")
+    ap.add_argument("--format", choices=("csv", "parquet"), default="csv")
+    ap.add_argument("--gzip", action="store_true")
+    ap.add_argument("--chunk-rows", type=int, default=10000)
+    ap.add_argument("--max-peak-mb", type=float, default=64)
+    ap.add_argument("--max-growth", type=float, default=2.0)
+    args = ap.parse_args()
+    sizes = [int(s) for s in args.sizes.split(",")]
+    if args.format == "parquet":
+        try:
+            import pyarrow.parquet  # noqa: F401 — โหลดก่อนเริ่มวัด ไม่ให้ตัวโมดูลนับเป็น peak
+        except ImportError:
+            print("--format parquet ต้องติดตั้ง pyarrow")
+            sys.exit(2)
+
+    peaks = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"backend={args.backend} format={args.format} chunk_rows={args.chunk_rows}")
+        print(f"{'แถว':>9} {'สร้าง s':>8} {'export s':>9} {'แถว/s':>9} {'ไฟล์ MB':>8} {'peak MB':>8}")
+        for n in sizes:
+            t0 = time.perf_counter()
+            st = _build(args.backend, os.path.join(tmp, f"ledger{n}"), n)
+            built = time.perf_counter() - t0
+            out = os.path.join(tmp, f"out{n}")
+            tracemalloc.start()
+            t0 = time.perf_counter()
+            res = export(st, out, fmt=args.format, compress=args.gzip, chunk_size=args.chunk_rows,
+                         compress_over_mb=0)
+            took = time.perf_counter() - t0
+            peaks[n] = tracemalloc.get_traced_memory()[1] / 1048576
+            tracemalloc.stop()
+            st.close()
+            rows = sum(r["rows"] for r in res)
+            size = sum(r["bytes"] for r in res) / 1048576
+            if rows != 2 * n + 40:
+                print(f"จำนวนแถวที่ส่งออกไม่ตรง: {rows} (ควรเป็น {2 * n + 40})")
+                sys.exit(1)
+            print(f"{n:>9} {built:>8.1f} {took:>9.2f} {rows / took:>9.0f} {size:>8.1f} {peaks[n]:>8.1f}")
+
+    ok = True
+    worst = max(peaks.values())
+    if worst > args.max_peak_mb:
+        print(f"peak {worst:.1f} MB เกินงบ {args.max_peak_mb} MB")
+        ok = False
+    full = [n for n in sizes if n >= args.chunk_rows]
+    if len(full) >= 2:
+        growth = peaks[max(full)] / peaks[min(full)]
+        print(f"peak ที่ {max(full)} แถว / {min(full)} แถว = {growth:.2f} เท่า")
+        if growth > args.max_growth:
+            print(f"หน่วยความจำโตตามขนาด ledger (เกิน {args.max_growth} เท่า)")
+            ok = False
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""gspread จำลองในหน่วยความจำ — นับจำนวนครั้งที่เรียก API และจำลอง 429 ได้"""
+from collections import Counter
+from typing import List, Any, Dict
+
+import gspread
+
+class _FakeResponse:
+    def __init__(self, code: int, message: str):
+        self.status_code = code
+        self._body = {"error": {"code": code, "message": message, "status": "RESOURCE_EXHAUSTED"}}
+
+    def json(self):
+        return self._body
+
+class FakeWorksheet:
+    def __init__(self, book: "FakeSpreadsheet", title: str, rows: int = 1000):
+        self.book = book
+        self.title = title
+        self.row_count = rows
+        self.cells: Dict[int, List[Any]] = {}
+
+    def _call(self, name: str):
+        self.book._call(name)
+
+    def _last_row(self) -> int:
+        return max(self.cells) if self.cells else 0
+
+    def get_all_records(self):
+        self._call("get_all_records")
+        if 1 not in self.cells:
+            return []
+        head = self.cells[1]
+        return [dict(zip(head, self.cells.get(r, []))) for r in range(2, self._last_row() + 1)]
+
+    def get(self, range_name: str, **kw):
+        """อ่านช่วง A1 เช่น "A2:K10001" — ตัดแถวว่างท้ายชีตออกเหมือน API จริง"""
+        self._call("get")
+        first, last = range_name.split(":")
+        r0 = int("".join(c for c in first if c.isdigit()))
+        r1 = min(int("".join(c for c in last if c.isdigit())), self._last_row())
+        c0, c1 = ord(first[0].upper()) - ord("A"), ord(last[0].upper()) - ord("A") + 1
+        return [list(self.cells.get(r, []))[c0:c1] for r in range(r0, r1 + 1)]
+
+    def append_row(self, row):
+        self._call("append_row")
+        self.cells[self._last_row() + 1] = list(row)
+
+    def append_rows(self, rows):
+        self._call("append_rows")
+        for row in rows:
+            self.cells[self._last_row() + 1] = list(row)
+
+    def update(self, values, range_name=None, **kw):
+        self._call("update")
+        self._write(range_name, values)
+
+    def batch_update(self, data, **kw):
+        self._call("batch_update")
+        for d in data:
+            self._write(d["range"], d["values"])
+
+    def clear(self):
+        self._call("clear")
+        self.cells = {}
+
+    def resize(self, rows: int = None, cols: int = None):
+        self._call("resize")
+        if rows is not None:
+            self.row_count = rows
+
+    def add_rows(self, rows: int):
+        self._call("add_rows")
+        self.row_count += rows
+
+    def _write(self, a1: str, values):
+        start = a1.split(":")[0]
+        row = int("".join(c for c in start if c.isdigit()))
+        col = ord(start[0].upper()) - ord("A")
+        if row > self.row_count:
+            raise ValueError(f"row {row} เกินขนาดชีต {self.row_count}")
+        for i, vals in enumerate(values):
+            cur = self.cells.setdefault(row + i, [])
+            need = col + len(vals)
+            cur.extend([""] * (need - len(cur)))
+            cur[col:need] = list(vals)
+
+class FakeSpreadsheet:
+    """fail_every=N: ทุก ๆ N ครั้งที่เรียก API จะโยน APIError 429"""
+
+    def __init__(self, fail_every: int = 0):
+        self.sheets: Dict[str, FakeWorksheet] = {}
+        self.calls: Counter = Counter()
+        self.fail_every = fail_every
+        self._n = 0
+
+    def _call(self, name: str):
+        self._n += 1
+        if self.fail_every and self._n % self.fail_every == 0:
+            self.calls["429"] += 1
+            raise gspread.exceptions.APIError(_FakeResponse(429, "Quota exceeded"))
+        self.calls[name] += 1
+
+    def worksheet(self, title: str) -> FakeWorksheet:
+        self._call("worksheet")
+        if title not in self.sheets:
+            raise gspread.WorksheetNotFound(title)
+        return self.sheets[title]
+
+    def add_worksheet(self, title: str, rows: int = 1000, cols: int = 20) -> FakeWorksheet:
+        self._call("add_worksheet")
+        ws = FakeWorksheet(self, title, rows)
+        self.sheets[title] = ws
+        return ws
+
+    def total_calls(self) -> int:
+        return sum(v for k, v in self.calls.items() if k != "429")
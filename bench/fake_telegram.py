@@ -0,0 +1,212 @@
+"""Bot API ปลอมในเครื่อง (http.server ของ stdlib) — ให้บอทจริงคุยด้วยแบบ offline ตอนทดสอบโหลด
+
+เมธอดที่รองรับ: getMe, deleteWebhook, getUpdates (long polling ตาม offset/timeout), getFile,
+ดาวน์โหลดไฟล์ (/file/bot<token>/...), sendMessage, editMessageText, sendDocument
+เมธอดอื่นตอบ ok=true / result=true และนับไว้ใน calls
+
+    api = FakeBotAPI(on_reply=...).start()
+    app = Application.builder().token("1:FAKE").base_url(api.base_url).base_file_url(api.base_file_url).build()
+    api.push_message(chat_id=42, text="ok")
+"""
+import json
+import time
+import threading
+from collections import Counter
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot",
+            "can_join_groups": False, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+def _parse_body(content_type: str, body: bytes) -> Tuple[Dict[str, Any], Dict[str, Tuple[str, bytes]]]:
+    """คืน (พารามิเตอร์, ไฟล์ที่แนบ {ชื่อฟิลด์: (ชื่อไฟล์, ไบต์)}) จาก body แบบ form / multipart / JSON"""
+    if not body:
+        return {}, {}
+    if content_type.startswith("application/json"):
+        return json.loads(body), {}
+    if content_type.startswith("multipart/form-data"):
+        msg = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+        params, files = {}, {}
+        for part in msg.iter_parts():
+            name = part.get_param("name", header="content-disposition")
+            data = part.get_payload(decode=True) or b""
+            if part.get_filename():
+                files[name] = (part.get_filename(), data)
+            else:
+                params[name] = data.decode("utf-8")
+        return params, files
+    return {k: v[-1] for k, v in parse_qs(body.decode("utf-8"), keep_blank_values=True).items()}, {}
+
+class FakeBotAPI:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0,
+                 on_reply: Optional[Callable[[str, Dict[str, Any]], None]] = None):
+        """on_reply(method, message) ถูกเรียกจาก thread ของ server ทุกครั้งที่บอทส่ง/แก้ข้อความหรือส่งไฟล์"""
+        self.host = host
+        self.port = port
+        self.on_reply = on_reply
+        self.calls: Counter = Counter()
+        self.files: Dict[str, bytes] = {}
+        self.documents: List[Dict[str, Any]] = []   # ไฟล์ที่บอทส่งมา (sendDocument) พร้อมไบต์
+        self._updates: List[Dict[str, Any]] = []
+        self._next_update = 1
+        self._next_message = 1
+        self._next_file = 1
+        self._cond = threading.Condition()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._closed = False
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/bot"
+
+    @property
+    def base_file_url(self) -> str:
+        return f"http://{self.host}:{self.port}/file/bot"
+
+    @property
+    def pending(self) -> int:
+        """update ที่บอทยังไม่ได้ดึงไป (ความลึกคิวฝั่ง Telegram)"""
+        with self._cond:
+            return len(self._updates)
+
+    def start(self) -> "FakeBotAPI":
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                parts = self.path.split("/")
+                if len(parts) >= 4 and parts[1] == "file" and parts[-1] in api.files:
+                    self._send(200, api.files[parts[-1]], "application/octet-stream")
+                else:
+                    self._send(404, b"not found", "text/plain")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                method = self.path.rsplit("/", 1)[-1]
+                params, files = _parse_body(self.headers.get("Content-Type", ""), body)
+                try:
+                    result = api._call(method, params, files)
+                    out = {"ok": True, "result": result}
+                except KeyError as e:
+                    out = {"ok": False, "error_code": 400, "description": f"Bad Request: {e}"}
+                self._send(200, json.dumps(out).encode(), "application/json")
+
+            def _send(self, code: int, data: bytes, ctype: str):
+                self.send_response(code)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass   # บอทปิด long poll ไปก่อน (ตอนหยุด)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((self.host, self.port), Handler)
+        self._server.daemon_threads = True
+        self.port = self._server.server_address[1]
+        threading.Thread(target=self._server.serve_forever, name="fake-bot-api", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+    # ---------- ฝั่งผู้ใช้ปลอม ----------
+
+    def add_file(self, data: bytes) -> Tuple[str, str]:
+        """เก็บรูปไว้ให้บอทดาวน์โหลด คืน (file_id, file_unique_id)"""
+        with self._cond:
+            n = self._next_file
+            self._next_file += 1
+        file_id = f"f{n}"
+        self.files[file_id] = bytes(data)
+        return file_id, f"u{n}"
+
+    def push_message(self, chat_id: int, text: Optional[str] = None, photo: Optional[bytes] = None,
+                     media_group_id: Optional[str] = None) -> Dict[str, Any]:
+        """ใส่ update ข้อความ/รูปจากผู้ใช้ chat_id ลงคิวของ getUpdates"""
+        msg: Dict[str, Any] = {"date": int(time.time()), "chat": {"id": chat_id, "type": "private"},
+                               "from": {"id": chat_id, "is_bot": False, "first_name": f"user{chat_id}"}}
+        if text is not None:
+            msg["text"] = text
+            if text.startswith("/"):
+                msg["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        if photo is not None:
+            file_id, unique = self.add_file(photo)
+            msg["photo"] = [{"file_id": file_id, "file_unique_id": unique, "width": 1080, "height": 2400,
+                             "file_size": len(photo)}]
+        if media_group_id:
+            msg["media_group_id"] = media_group_id
+        with self._cond:
+            msg["message_id"] = self._next_message
+            self._next_message += 1
+            self._updates.append({"update_id": self._next_update, "message": msg})
+            self._next_update += 1
+            self._cond.notify_all()
+        return msg
+
+    # ---------- Bot API ----------
+
+    def _message(self, chat_id, **fields) -> Dict[str, Any]:
+        with self._cond:
+            mid = self._next_message
+            self._next_message += 1
+        return {"message_id": mid, "date": int(time.time()), "chat": {"id": int(chat_id), "type": "private"},
+                "from": BOT_USER, **fields}
+
+    def _reply(self, method: str, msg: Dict[str, Any]) -> Dict[str, Any]:
+        if self.on_reply:
+            self.on_reply(method, msg)
+        return msg
+
+    def _call(self, method: str, p: Dict[str, Any], files: Dict[str, Tuple[str, bytes]]):
+        self.calls[method] += 1
+        if method == "getMe":
+            return BOT_USER
+        if method == "getUpdates":
+            return self._get_updates(int(p.get("offset") or 0), float(p.get("timeout") or 0),
+                                     int(p.get("limit") or 100))
+        if method == "getFile":
+            fid = p["file_id"]
+            return {"file_id": fid, "file_unique_id": "u" + fid[1:], "file_size": len(self.files[fid]),
+                    "file_path": f"photos/{fid}"}
+        if method == "sendMessage":
+            return self._reply(method, self._message(p["chat_id"], text=p["text"]))
+        if method == "editMessageText":
+            msg = self._message(p["chat_id"], text=p["text"])
+            msg["message_id"] = int(p["message_id"])
+            msg["edit_date"] = int(time.time())
+            return self._reply(method, msg)
+        if method == "sendDocument":
+            name, data = files.get("document") or ("document", b"")
+            msg = self._message(p["chat_id"], caption=p.get("caption"),
+                                document={"file_id": f"d{len(self.documents) + 1}", "file_unique_id": f"d{len(self.documents) + 1}",
+                                          "file_name": name, "file_size": len(data)})
+            self.documents.append({"chat_id": int(p["chat_id"]), "file_name": name, "data": data,
+                                   "caption": p.get("caption")})
+            return self._reply(method, msg)
+        return True
+
+    def _get_updates(self, offset: int, timeout: float, limit: int) -> List[Dict[str, Any]]:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            # offset = ยืนยันว่ารับ update ก่อนหน้านั้นแล้ว
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+            while not self._updates:
+                left = deadline - time.monotonic()
+                if left <= 0 or self._closed:
+                    return []
+                self._cond.wait(left)
+            return self._updates[:limit]
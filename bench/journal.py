@@ -0,0 +1,187 @@
+"""เทียบเวลาที่ผู้ใช้ต้องรอหลังยืนยันดีล: ลง ledger ตรง ๆ (แบบเดิม) กับผ่าน journal
+
+    python -m bench.journal                          # 500 ดีล ผู้ใช้ 20 คนยืนยันพร้อมกัน, CSV
+    python -m bench.journal --backend sqlite --users 50
+    python -m bench.journal --latency-ms 300         # จำลอง storage ที่ช้าแบบ Google Sheets
+
+แบบเดิม = เรียก PnLEngine.record_trade บน event loop ทีละดีล (ผู้ใช้รอจนเขียน ledger เสร็จ)
+แบบ journal = รอแค่ append + fsync (group commit) แล้ว applier ลง ledger เบื้องหลังเป็นชุด
+รายงาน p50/p99 ของเวลารอ, จำนวนดีลต่อวินาที, ขนาด group commit เฉลี่ย และเวลาจนลง ledger ครบ
+แล้วตรวจว่า ledger ของผู้ใช้คนหนึ่งที่ลงไม่ได้ (storage ล่ม) ไม่ทำให้ผู้ใช้คนอื่นค้าง และกู้ต่อหลังรีสตาร์ทไม่ซ้ำ
+และดีลที่ลงไม่ได้ถาวร (ค่าเสีย) ถูกข้ามไป ไม่ทำให้ดีลหลังจากนั้นใน shard เดียวกันค้าง (exit 1 ถ้าไม่ผ่าน)
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+
+from journal import TradeJournal, ApplyFailed
+from pnl import PnLEngine
+from storage import TradeStorage, CSVBackend, is_transient
+
+def _trade(i: int):
+    return {"ts_iso": f"2024-01-01T00:00:00.{i:06d}", "exchange": "binance", "pair": f"C{i % 7}/USDT",
+            "side": "BUY" if i % 3 else "SELL", "price": 100.0 + i % 13, "qty": 1.0, "src_image_id": f"b{i}"}
+
+def _storage(kind: str, tmp: str) -> TradeStorage:
+    if kind == "sqlite":
+        from storage_sqlite import SQLiteBackend
+        return TradeStorage(SQLiteBackend(os.path.join(tmp, "ledger.db")))
+    return TradeStorage(CSVBackend(tmp))
+
+def _pct(xs, q):
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * q))] * 1000
+
+async def _users(n: int, users: int, confirm) -> list:
+    waits = []
+
+    async def user(u: int):
+        for i in range(u, n, users):
+            t0 = time.perf_counter()
+            await asyncio.sleep(0)   # ให้ทุกผู้ใช้ยืนยันพร้อมกัน — เวลารอรวมเวลาที่ event loop ถูกคนอื่นบล็อก
+            await confirm(_trade(i))
+            waits.append(time.perf_counter() - t0)
+
+    await asyncio.gather(*(user(u) for u in range(users)))
+    return waits
+
+async def run(n: int, users: int, backend: str, latency: float):
+    out = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        pnl = PnLEngine(_storage(backend, os.path.join(tmp, "direct")))
+
+        async def direct(trade):
+            if latency:
+                time.sleep(latency)   # storage ที่ช้าบล็อก event loop เหมือน HTTP แบบ sync ของ gspread
+            pnl.record_trade(trade)
+
+        t0 = time.perf_counter()
+        waits = await _users(n, users, direct)
+        out["direct"] = (waits, time.perf_counter() - t0, None)
+
+        pnl = PnLEngine(_storage(backend, os.path.join(tmp, "journal")))
+        journal = TradeJournal(os.path.join(tmp, "journal", "journal.jsonl"))
+
+        def write(trades):
+            if latency:
+                time.sleep(latency)
+            return pnl.record_trades(trades)
+
+        async def apply(shard, trades, recovering):
+            return await asyncio.to_thread(write, trades)
+
+        await journal.start(apply)
+        t0 = time.perf_counter()
+        waits = await _users(n, users, lambda t: journal.append([t]))
+        acked = time.perf_counter() - t0
+        await journal.drain()
+        out["journal"] = (waits, acked, time.perf_counter() - t0)
+        out["group"] = n / max(journal.commits, 1)
+        await journal.close()
+    return out
+
+async def isolation(users: int, down_sec: float = 1.5) -> dict:
+    """shard หนึ่งล่ม down_sec วินาที: เวลาที่ shard อื่นลงเสร็จ, และหลังหยุดกลางคันแล้วเริ่มใหม่ลงอะไรซ้ำหรือไม่"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.jsonl")
+        done = []
+        broken = {"until": time.perf_counter() + down_sec}
+
+        async def apply(shard, trades, recovering):
+            if shard == "down" and time.perf_counter() < broken["until"]:
+                raise OSError("storage ของ shard นี้ล่ม")
+            done.extend(t["src_image_id"] for t in trades)
+            return ["ok"] * len(trades)
+
+        journal = TradeJournal(path, fsync=False)
+        await journal.start(apply)
+        t0 = time.perf_counter()
+        stuck = await journal.append([_trade(0)], "down")
+        others = [await journal.append([_trade(i)], f"u{i % users}") for i in range(1, 4 * users)]
+        # /report ของผู้ใช้อื่นรอ drain เฉพาะ shard ของตัวเอง
+        await journal.drain("u1")
+        drain_s = time.perf_counter() - t0
+        await asyncio.gather(*others)
+        others_s = time.perf_counter() - t0
+        # หยุดกลางคันขณะ shard ที่ล่มยังค้าง แล้วเริ่มใหม่ (storage กลับมาแล้ว)
+        for task in list(journal._appliers.values()):
+            task.cancel()
+        journal._file.close()
+        stuck.cancel()
+        broken["until"] = 0
+        before = list(done)
+        journal = TradeJournal(path, fsync=False)
+        recovered = await journal.start(apply)
+        await journal.drain()
+        await journal.close()
+        again = done[len(before):]
+        return {"others_s": others_s, "drain_s": drain_s, "down_s": down_sec, "recovered": recovered,
+                "dupes": len(again) - len(set(again) - set(before)), "lost": 4 * users - len(set(done))}
+
+async def poison(timeout: float = 10.0) -> dict:
+    """entry ที่มีค่าเสีย (price "abc") อยู่กลางชุดของ shard เดียว: ดีลดีก่อน/หลังต้องลง, drain ต้องจบ,
+    entry เสียได้ ApplyFailed และรีสตาร์ทแล้วไม่กู้ entry นั้นมาลงซ้ำ"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "journal.jsonl")
+        engine = PnLEngine(_storage("csv", tmp))
+
+        async def apply(shard, trades, recovering):
+            return await asyncio.to_thread(engine.recover_trades if recovering else engine.record_trades, trades)
+
+        journal = TradeJournal(path, fsync=False, transient=is_transient)
+        await journal.start(apply)
+        bad = dict(_trade(2), price="abc")
+        futs = [await journal.append([t], "u") for t in (_trade(1), bad, _trade(3))]
+        try:
+            await asyncio.wait_for(journal.drain(), timeout)
+            drained = True
+        except asyncio.TimeoutError:
+            drained = False
+        results = await asyncio.gather(*futs, return_exceptions=True)
+        if drained:
+            await journal.close()
+        journal = TradeJournal(path, fsync=False, transient=is_transient)
+        recovered = await journal.start(apply)
+        await journal.close()
+        ids = [r["src_image_id"] for chunk in engine.storage.iter_rows("trades") for r in chunk]
+        return {"drained": drained, "failed": isinstance(results[1], ApplyFailed),
+                "good": ids == ["b1", "b3"], "recovered": recovered}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=500, help="จำนวนดีล")
+    ap.add_argument("--users", type=int, default=20, help="จำนวนผู้ใช้ที่ยืนยันพร้อมกัน")
+    ap.add_argument("--backend", choices=("csv", "sqlite"), default="csv")
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="หน่วงเพิ่มต่อการเขียน ledger หนึ่งครั้ง")
+    args = ap.parse_args()
+
+    res = asyncio.run(run(args.n, args.users, args.backend, args.latency_ms / 1000.0))
+    print(f"{args.n} ดีล, ผู้ใช้ {args.users} คน, backend={args.backend}, latency={args.latency_ms:.0f}ms")
+    print(f"{'mode':<8} {'p50 ms':>8} {'p99 ms':>8} {'acks/s':>8} {'ledger done s':>14}")
+    group = res.pop("group")
+    for mode, (waits, acked, done) in res.items():
+        print(f"{mode:<8} {statistics.median(waits) * 1000:>8.2f} {_pct(waits, 0.99):>8.2f} "
+              f"{len(waits) / acked:>8.0f} {done if done is not None else acked:>14.2f}")
+    print(f"group commit เฉลี่ย {group:.1f} entry ต่อ fsync")
+
+    iso = asyncio.run(isolation(args.users))
+    print(f"shard ล่ม {iso['down_s']:.1f}s: ผู้ใช้อื่นลงครบใน {iso['others_s']:.2f}s "
+          f"(drain ของผู้ใช้อื่น {iso['drain_s']:.2f}s), "
+          f"หลังรีสตาร์ทกู้ {iso['recovered']} entry, ลงซ้ำ {iso['dupes']}, หาย {iso['lost']}")
+    if max(iso["others_s"], iso["drain_s"]) >= iso["down_s"] or iso["dupes"] or iso["lost"]:
+        print("shard ที่ล่มทำให้ shard อื่นค้าง หรือกู้ journal ไม่ถูกต้อง")
+        sys.exit(1)
+
+    bad = asyncio.run(poison())
+    print(f"ดีลค่าเสียกลาง shard: drain จบ {bad['drained']}, ได้ ApplyFailed {bad['failed']}, "
+          f"ดีลก่อน/หลังลงครบ {bad['good']}, รีสตาร์ทแล้วกู้ {bad['recovered']} entry")
+    if not (bad["drained"] and bad["failed"] and bad["good"]) or bad["recovered"]:
+        print("entry ที่ลงไม่ได้ถาวรทำให้ shard ค้าง")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""เทียบการอ่านสลิปด้วยแม่แบบ layout กับ ocr_cascade บนสลิปสังเคราะห์ (ต้องมี tesseract)
+
+    python -m bench.layouts                 # 40 ใบ ขนาด 1080x2340
+    python -m bench.layouts --n 80 --seed 3
+
+เรียนรู้แม่แบบจากสลิปใบแรกของแต่ละชนิด (เก็บในโฟลเดอร์ชั่วคราว ไม่แตะ data/layouts)
+แล้วอ่านใบที่เหลือทั้งสองแบบ รายงาน median ของเวลาต่อรูป, ความแม่นของฟิลด์, จำนวนรูปที่ตรงแม่แบบ
+และจำนวนที่อ่านด้วยแม่แบบได้แต่ค่าไม่ผ่านการตรวจ (reject → ใช้ cascade แทน)
+"""
+import time
+import argparse
+import tempfile
+import statistics
+from collections import defaultdict
+
+from bench import slips as slipgen
+from bench.stages import _tesseract_available
+
+def _read(data: bytes, layouts):
+    import ocr_engine
+    ocr_engine._LAYOUTS, ocr_engine._LAYOUTS_LOADED = layouts, True
+    timings, info = {}, {}
+    t0 = time.perf_counter()
+    text = ocr_engine._extract(data, timings, info)
+    return text, time.perf_counter() - t0, info.get("layout"), info.get("layout_rejected")
+
+def run(n: int = 40, seed: int = 7, size=(1080, 2340)):
+    import ocr_engine
+    from layouts import LayoutRegistry
+    from parser_engine import parse_trade_from_text
+
+    slips = [s for s in slipgen.generate(n=n, seed=seed, langs=("en",), sizes=[size]) if s.kind != "wallet"]
+    by_kind = defaultdict(list)
+    for s in slips:
+        by_kind[s.kind].append(s)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        reg = LayoutRegistry(path="", learned_dir=tmp)
+        saved = ocr_engine._LAYOUTS, ocr_engine._LAYOUTS_LOADED
+        try:
+            ocr_engine._LAYOUTS, ocr_engine._LAYOUTS_LOADED = reg, True
+            for kind, group in by_kind.items():
+                try:
+                    # เหมือนบอท: เรียนรู้จากค่าที่ยืนยันแล้ว + ยอด Total ที่ parser อ่านได้ (ใช้ตรวจ price × qty)
+                    first = group[0]
+                    total = parse_trade_from_text(first.text).get("quote_amount")
+                    name = ocr_engine.learn_layout(first.encode("PNG"), {**first.truth, "quote_amount": total})
+                    print(f"เรียนรู้ {kind}: {name}")
+                except ValueError as e:
+                    print(f"เรียนรู้ {kind} ไม่ได้: {e}")
+
+            rows = {}
+            for kind, group in by_kind.items():
+                stat = {"layout": [], "cascade": [], "layout_ok": 0, "cascade_ok": 0, "total": 0, "hits": 0,
+                        "rejected": 0}
+                for s in group[1:]:
+                    data = s.encode("PNG")
+                    text, dt, used, rejected = _read(data, reg.refresh())
+                    ok, total = slipgen.score(s, parse_trade_from_text(text))
+                    stat["layout"].append(dt)
+                    stat["layout_ok"] += ok
+                    stat["hits"] += used is not None
+                    stat["rejected"] += rejected is not None
+                    text, dt, _, _ = _read(data, None)
+                    stat["cascade"].append(dt)
+                    stat["cascade_ok"] += slipgen.score(s, parse_trade_from_text(text))[0]
+                    stat["total"] += total
+                rows[kind] = stat
+        finally:
+            ocr_engine._LAYOUTS, ocr_engine._LAYOUTS_LOADED = saved
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=40)
+    ap.add_argument("--seed", type=int, default=7)
+    args = ap.parse_args()
+    if not _tesseract_available():
+        raise SystemExit("ไม่พบ tesseract")
+
+    rows = run(args.n, args.seed)
+    print(f"{'kind':<16} {'hit':>5} {'reject':>6} {'layout ms':>10} {'cascade ms':>11} "
+          f"{'layout acc':>11} {'cascade acc':>12}")
+    for kind, st in rows.items():
+        if not st["layout"]:
+            continue
+        n = len(st["layout"])
+        print(f"{kind:<16} {st['hits']:>2}/{n:<2} {st['rejected']:>6} "
+              f"{statistics.median(st['layout']) * 1000:>10.0f} "
+              f"{statistics.median(st['cascade']) * 1000:>11.0f} "
+              f"{st['layout_ok']:>5}/{st['total']:<5} {st['cascade_ok']:>6}/{st['total']:<5}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""เทียบ OCR backend: pytesseract (spawn process ต่อรูป) กับ tesserocr (โหลดโมเดลครั้งเดียว)
+
+    python -m bench.ocr_backends                 # ทุก backend ที่ติดตั้งไว้, 20 รูป
+    python -m bench.ocr_backends --n 50 --lang tha+eng --input full
+
+รายงานต่อ backend: เวลารูปแรก (รวมโหลดโมเดล), median/p95 ของรูปถัดไป และหน่วยความจำ
+(RSS ที่เพิ่มขึ้นของ process ที่วัด และ RSS สูงสุดของ process tesseract ที่ถูก spawn)
+แต่ละ backend รันใน process ใหม่ของตัวเอง เพื่อไม่ให้หน่วยความจำปนกัน — อ่านค่าจาก /proc (Linux)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+import statistics
+import multiprocessing as mp
+from typing import Dict, Any, List
+
+import numpy as np
+
+from bench import slips as slipgen
+
+BACKENDS = ("pytesseract", "tesserocr")
+
+def _images(n: int, seed: int, kind: str) -> List[np.ndarray]:
+    import cv2
+    from ocr_engine import _preprocess, _text_rows, _row_strip, CASCADE
+    out = []
+    for s in slipgen.generate(n=n, seed=seed):
+        img = np.array(s.image.convert("RGB"))[:, :, ::-1]
+        if kind == "full":
+            out.append(_preprocess(img))
+            continue
+        gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        rows, glyph = _text_rows(gray)
+        out.append(_row_strip(gray, rows, glyph, float(CASCADE["target_line_px"])) if rows else _preprocess(img))
+    return out
+
+def _status(pid) -> Dict[str, str]:
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            return dict(line.rstrip("\n").split(":\t", 1) for line in f if ":\t" in line)
+    except OSError:
+        return {}
+
+def _status_kb(pid, field: str) -> int:
+    value = _status(pid).get(field)
+    return int(value.split()[0]) if value else 0
+
+class ChildPeak(threading.Thread):
+    """คอยอ่าน VmHWM ของ process ลูก (tesseract ที่ pytesseract spawn) แล้วเก็บค่าสูงสุด"""
+
+    def __init__(self, interval: float = 0.002):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_kb = 0
+        self.own_name = _status("self").get("Name")
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            try:
+                tids = os.listdir("/proc/self/task")
+            except OSError:
+                return
+            for tid in tids:
+                try:
+                    with open(f"/proc/self/task/{tid}/children") as f:
+                        pids = f.read().split()
+                except OSError:
+                    continue
+                for pid in pids:
+                    st = _status(pid)
+                    # ช่วงหลัง fork แต่ยังไม่ exec ตัวลูกยังเป็น python (RSS เท่าตัวแม่) — ข้ามไป
+                    if st.get("Name") != self.own_name and st.get("VmHWM"):
+                        self.peak_kb = max(self.peak_kb, int(st["VmHWM"].split()[0]))
+
+    def stop(self):
+        self._halt.set()
+        self.join()
+
+def _run_backend(name: str, n: int, seed: int, lang: str, kind: str, conn):
+    try:
+        from ocr_engine import PytesseractBackend, TesserocrBackend
+        images = _images(n, seed, kind)
+        base_kb = _status_kb("self", "VmRSS")
+        children = ChildPeak()
+        children.start()
+        backend = TesserocrBackend() if name == "tesserocr" else PytesseractBackend()
+        psm = None if kind == "full" else 6
+        times = []
+        for img in images:
+            t0 = time.perf_counter()
+            backend.image_to_string(img, lang, psm)
+            times.append(time.perf_counter() - t0)
+        rss_kb = _status_kb("self", "VmRSS") - base_kb
+        children.stop()
+        backend.close()
+        rest = sorted(times[1:]) or times
+        conn.send({
+            "backend": name,
+            "images": len(times),
+            "first_ms": round(times[0] * 1000, 2),
+            "median_ms": round(statistics.median(rest) * 1000, 2),
+            "p95_ms": round(rest[min(len(rest) - 1, int(len(rest) * 0.95))] * 1000, 2),
+            "mean_ms": round(statistics.fmean(rest) * 1000, 2),
+            "rss_self_mb": round(rss_kb / 1024, 1),
+            "rss_children_peak_mb": round(children.peak_kb / 1024, 1),
+        })
+    except ImportError as e:
+        conn.send({"backend": name, "skipped": f"ไม่ได้ติดตั้ง ({e})"})
+    except Exception as e:
+        conn.send({"backend": name, "skipped": f"{type(e).__name__}: {e}"})
+
+def run(n: int = 20, seed: int = 1, lang: str = "eng", kind: str = "strip",
+        backends=BACKENDS) -> List[Dict[str, Any]]:
+    ctx = mp.get_context("spawn")
+    results = []
+    for name in backends:
+        parent, child = ctx.Pipe(duplex=False)
+        p = ctx.Process(target=_run_backend, args=(name, n, seed, lang, kind, child))
+        p.start()
+        results.append(parent.recv())
+        p.join()
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=20, help="จำนวนรูป")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--lang", default="eng")
+    ap.add_argument("--input", choices=("strip", "full"), default="strip",
+                    help="strip = แถวข้อความที่ครอปแล้ว (pass แรกของ cascade), full = ทั้งภาพแบบ _preprocess")
+    ap.add_argument("--backend", action="append", choices=BACKENDS, help="เลือกเฉพาะบาง backend")
+    args = ap.parse_args()
+    results = run(args.n, args.seed, args.lang, args.input, tuple(args.backend or BACKENDS))
+    for r in results:
+        print(json.dumps(r, ensure_ascii=False))
+    done = {r["backend"]: r for r in results if "median_ms" in r}
+    if len(done) == 2:
+        a, b = done["pytesseract"], done["tesserocr"]
+        print(f"tesserocr เร็วกว่า {a['median_ms'] / max(b['median_ms'], 1e-9):.2f}x ต่อรูป (median)", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
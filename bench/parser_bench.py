@@ -0,0 +1,133 @@
+"""เทียบเวลา parse ต่อสลิป: แบบเดิม (re.search สตริงดิบทีละฟิลด์) กับ PatternRegistry ที่คอมไพล์แล้ว
+
+    python -m bench.parser_bench [--n 2000]
+"""
+import re
+import time
+import argparse
+
+import parser_engine
+from parser_engine import parse_trade_from_text, parse_wallet_from_text, _normalize_pair, _num
+
+SAMPLE_SLIPS = [
+    # Binance spot order detail
+    "SOL/BTC\nBuy\nFilled\nPrice (BTC) 0.0016906\nFilled (SOL) 1.00\n"
+    "Fee (BNB) 0.00012\nTotal (BTC) 0.0016906\n2024-08-01 12:30:45\n",
+    # Binance Convert (inverse price)
+    "Convert\nYou will receive +400 CRV\nFrom 0.00296493 BTC\n"
+    "Inverse Price 1 CRV = 0.00000741 BTC\nTransaction Amount 0.00296493 BTC\n"
+    "Time 2024-08-02 09:10:11\n",
+    # Binance Convert (direct price)
+    "Receive +150 ADA\nFrom 0.0011 BTC\nPrice 1 BTC = 134910.5 ADA\n2024-08-03 01:02:03\n",
+    # Thai spot
+    "ETH/USDT ขาย\nราคา: 3,120.55\nจำนวน: 0.25\nค่าธรรมเนียม: 0.78\nเวลา 2024-08-04 18:00:00\n",
+    # MEXC-like
+    "MEXC\nPEPE/USDT SELL filled\nprice 0.00001234\namount 1,000,000\nfee 0.01 USDT\n",
+]
+
+WALLET_TEXT = "Hide assets < 1 USD\nBTC 0.0123 $812.40\nETH 1.5 $4,650\nUSDT 250.0 $250\nBNB 0.3\n"
+
+# ---------- แบบเดิม (ก่อน PatternRegistry) ----------
+
+def _legacy_first_match(patterns, text, group_name):
+    for pat in (patterns or []):
+        m = re.search(pat, text, flags=re.IGNORECASE | re.MULTILINE)
+        if m and group_name in (m.groupdict() or {}):
+            g = m.group(group_name)
+            if g is not None and g != "":
+                return str(g).strip()
+    return None
+
+def legacy_parse_trade(text, PAT):
+    fm = _legacy_first_match
+    qty = fm(PAT.get("convert_receive_patterns", []), text, "qty")
+    base = fm(PAT.get("convert_receive_patterns", []), text, "base")
+    inv_p = fm(PAT.get("convert_inverse_price_patterns", []), text, "price")
+    inv_q = fm(PAT.get("convert_inverse_price_patterns", []), text, "quote")
+    dir_units = fm(PAT.get("convert_direct_price_patterns", []), text, "units")
+    dir_quote = fm(PAT.get("convert_direct_price_patterns", []), text, "quote")
+    tx_quote = fm(PAT.get("convert_tx_amount_patterns", []), text, "quote")
+    from_amt = fm(PAT.get("convert_from_amount_patterns", []), text, "amount")
+    from_q = fm(PAT.get("convert_from_amount_patterns", []), text, "quote")
+    ttime = fm(PAT.get("time_patterns", []), text, "time")
+    if qty and base and (inv_p and (inv_q or tx_quote)):
+        quote = inv_q or tx_quote
+        return {"pair": _normalize_pair(None, base, quote), "side": "BUY", "price": _num(inv_p),
+                "qty": _num(qty), "fee": 0.0, "fee_asset": None, "time": ttime,
+                "quote_amount": _num(from_amt), "quote_asset": (from_q or tx_quote)}
+    if qty and base and dir_units and (dir_quote or tx_quote):
+        units = _num(dir_units)
+        quote = dir_quote or tx_quote
+        return {"pair": _normalize_pair(None, base, quote), "side": "BUY",
+                "price": (1.0 / units) if units else None, "qty": _num(qty), "fee": 0.0,
+                "fee_asset": None, "time": ttime,
+                "quote_amount": _num(from_amt), "quote_asset": (from_q or tx_quote)}
+    pair = fm(PAT.get("pair_patterns", []), text, "pair")
+    base_only = fm(PAT.get("pair_patterns", []), text, "base")
+    side_raw = fm(PAT.get("side_patterns", []), text, "side")
+    price = fm(PAT.get("price_patterns", []), text, "price")
+    qty_val = fm(PAT.get("qty_patterns", []), text, "qty")
+    fee = fm(PAT.get("fee_patterns", []), text, "fee")
+    fee_asset = fm(PAT.get("fee_patterns", []), text, "fee_asset")
+    ttime = ttime or fm(PAT.get("time_patterns", []), text, "time")
+    total_amt = fm(PAT.get("total_patterns", []), text, "total")
+    total_q = fm(PAT.get("total_quote_patterns", []), text, "quote")
+    side = None
+    if side_raw:
+        s = side_raw.strip().upper()
+        if s in ("BUY", "ซื้อ"):
+            side = "BUY"
+        elif s in ("SELL", "ขาย"):
+            side = "SELL"
+    return {"pair": _normalize_pair(pair, base_only, total_q), "side": side, "price": _num(price),
+            "qty": _num(qty_val), "fee": _num(fee), "fee_asset": (fee_asset or "").upper() or None,
+            "time": ttime, "quote_amount": _num(total_amt), "quote_asset": (total_q or "").upper() or None}
+
+def legacy_parse_wallet(text, PAT):
+    assets = []
+    for line in [l.strip() for l in text.splitlines()]:
+        for pat in (PAT.get("wallet_row_patterns", []) or []):
+            m = re.search(pat, line, flags=re.IGNORECASE)
+            if m:
+                sym = (m.group("asset") or "").upper()
+                qty = _num(m.group("qty"))
+                usd = _num((m.groupdict() or {}).get("usd"))
+                if sym and sym.isupper() and qty is not None:
+                    assets.append({"asset": sym, "qty": qty, "usd": usd})
+                break
+    return {"type": "wallet", "assets": assets} if assets else None
+
+# ---------- วัดเวลา ----------
+
+def _per_call_us(fn, texts, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        for t in texts:
+            fn(t)
+    return (time.perf_counter() - t0) / (n * len(texts)) * 1e6
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=2000, help="จำนวนรอบต่อชุดสลิป")
+    args = ap.parse_args()
+
+    PAT = parser_engine.registry().raw
+    # ผลต้องตรงกันก่อนจะเทียบความเร็ว
+    for t in SAMPLE_SLIPS:
+        assert legacy_parse_trade(t, PAT) == parse_trade_from_text(t), t
+    assert legacy_parse_wallet(WALLET_TEXT, PAT) == parse_wallet_from_text(WALLET_TEXT)
+
+    # ให้แบบเดิมไม่ได้ประโยชน์จาก cache ภายในของโมดูล re
+    re.purge()
+    rows = [
+        ("trade", _per_call_us(lambda t: legacy_parse_trade(t, PAT), SAMPLE_SLIPS, args.n),
+                  _per_call_us(parse_trade_from_text, SAMPLE_SLIPS, args.n)),
+        ("wallet", _per_call_us(lambda t: legacy_parse_wallet(t, PAT), [WALLET_TEXT], args.n),
+                   _per_call_us(parse_wallet_from_text, [WALLET_TEXT], args.n)),
+    ]
+    print(f"{'parser':<8} {'before (us/slip)':>18} {'after (us/slip)':>17} {'speedup':>8}")
+    for name, before, after in rows:
+        print(f"{name:<8} {before:>18.1f} {after:>17.1f} {before / after:>7.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""เทียบเวลาตอบ /report: ยอดสรุปที่อัปเดตทีละดีล กับการอ่าน trades/realized ทั้งตารางทุกครั้ง
+
+    python -m bench.report                      # ประวัติ 20,000 ดีล 12 คู่, CSV
+    python -m bench.report --trades 200000 --backend sqlite
+
+สร้าง ledger ผ่าน PnLEngine.record_trades (ยอดสรุปอัปเดตไปพร้อมกัน) แล้ววัด
+- เวลาต่อ /report ของแต่ละช่วง (day/week/month/all) จากยอดสรุป เทียบกับสแกนทั้งตาราง
+- ต้นทุนเพิ่มต่อดีลตอนบันทึก (record_trade แบบมี/ไม่มียอดสรุป)
+และตรวจว่ายอดที่อัปเดตทีละดีลตรงกับยอดที่ rebuild จากประวัติ — exit 1 ถ้าไม่ตรง
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from datetime import datetime, timedelta
+
+from aggregates import PnLAggregates, PERIODS
+from pnl import PnLEngine
+from storage import TradeStorage, CSVBackend
+
+def _storage(kind: str, root: str, aggregates: bool) -> TradeStorage:
+    if kind == "sqlite":
+        from storage_sqlite import SQLiteBackend
+        st = TradeStorage(SQLiteBackend(os.path.join(root, "ledger.db")))
+    else:
+        st = TradeStorage(CSVBackend(root))
+    if not aggregates:
+        st.aggregates = None
+    return st
+
+def _history(n: int, pairs: int, seed: int = 7):
+    rnd = random.Random(seed)
+    t0 = datetime.now() - timedelta(days=400)
+    names = [f"C{i}/USDT" for i in range(pairs)]
+    for i in range(n):
+        ts = t0 + timedelta(days=400 * i / n)
+        side = "BUY" if rnd.random() < 0.55 else "SELL"
+        yield {"ts_iso": ts.isoformat(), "exchange": "binance", "pair": rnd.choice(names), "side": side,
+               "price": round(100 * (1 + rnd.uniform(-0.2, 0.2)), 4), "qty": round(rnd.uniform(0.1, 2), 4),
+               "fee": 0.01, "src_image_id": f"h{i}"}
+
+def _close(a: dict, b: dict) -> bool:
+    if a.keys() != b.keys():
+        return False
+    return all(abs(a[p][k] - b[p][k]) <= 1e-6 * max(1.0, abs(b[p][k])) for p in a for k in a[p])
+
+def _timeit(fn, reps: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(reps):
+        fn()
+    return (time.perf_counter() - t0) / reps * 1000
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--trades", type=int, default=20000, help="จำนวนดีลในประวัติ")
+    ap.add_argument("--pairs", type=int, default=12)
+    ap.add_argument("--backend", choices=("csv", "sqlite"), default="csv")
+    ap.add_argument("--reps", type=int, default=20)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        st = _storage(args.backend, os.path.join(tmp, "ledger"), True)
+        pnl = PnLEngine(st)
+        hist = list(_history(args.trades, args.pairs))
+        t0 = time.perf_counter()
+        for i in range(0, len(hist), 500):
+            pnl.record_trades(hist[i:i + 500])
+        print(f"{args.trades} ดีล, {args.pairs} คู่, backend={args.backend} "
+              f"(สร้างประวัติ {time.perf_counter() - t0:.1f}s)")
+
+        def scan(period):
+            agg = PnLAggregates(None)
+            agg.rebuild(st._rows("trades"), st._rows("realized"))
+            return agg.report(period)
+
+        ok = True
+        print(f"{'period':<7} {'ยอดสรุป ms':>11} {'สแกน ms':>9} {'เร็วขึ้น':>8}")
+        for period in PERIODS:
+            fresh = PnLAggregates(st.aggregates.path)   # อ่านจากดิสก์ ไม่ใช้ที่แคชในหน่วยความจำ
+            fast = _timeit(lambda: PnLAggregates(st.aggregates.path).report(period), args.reps)
+            slow = _timeit(lambda: scan(period), max(1, args.reps // 10))
+            ok &= _close(fresh.report(period)["pairs"], scan(period)["pairs"])
+            print(f"{period:<7} {fast:>11.2f} {slow:>9.1f} {slow / fast:>7.0f}x")
+
+        costs = {}
+        for label, with_agg in (("ไม่มียอดสรุป", False), ("มียอดสรุป", True)):
+            led = PnLEngine(_storage(args.backend, os.path.join(tmp, label), with_agg))
+            trades = list(_history(300, args.pairs, seed=11))
+            costs[label] = _timeit(lambda it=iter(trades): led.record_trade(next(it)), len(trades))
+            led.storage.close()
+        print("record_trade ต่อดีล: " + ", ".join(f"{k} {v:.2f} ms" for k, v in costs.items()))
+        st.close()
+
+    if not ok:
+        print("ยอดสรุปที่อัปเดตทีละดีลไม่ตรงกับยอดที่คำนวณจากทั้งตาราง")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
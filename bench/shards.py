@@ -0,0 +1,97 @@
+"""ทดสอบบันทึกดีลพร้อมกันหลายผู้ใช้: throughput ตามจำนวนผู้ใช้ และตรวจว่าไม่มี update หาย
+
+    python -m bench.shards                           # ผู้ใช้ 1,2,4,8,16 คน คนละ 100 ดีล, CSV
+    python -m bench.shards --backend sqlite --trades 200
+    python -m bench.shards --latency-ms 20           # จำลอง storage ที่ช้า (เช่น Sheets) ต่อการเขียนหนึ่งครั้ง
+
+โหมดที่วัด:
+  sharded  = ledger แยกตาม chat + lock ต่อ ledger (แบบปัจจุบัน)
+  shared   = ทุกคนใช้ ledger เดียว + lock เดียว (เหมือน shard_by_chat: false)
+  unlocked = ledger เดียวแบบไม่มี lock (แบบเดิมก่อนมี lock) — ใช้ดูว่า position หายได้จริง
+ทุกดีลเป็น BUY qty=1 จึงตรวจได้ว่า position_qty และจำนวนแถว trades ต้องเท่ากับจำนวนดีลที่ส่งไป
+exit 1 ถ้าโหมด sharded หรือ shared มี update หาย
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+from collections import Counter
+
+from ledgers import LedgerShards
+
+PAIRS = ["BTC/USDT", "ETH/USDT", "SOL/USDT"]
+
+def _trade(user: int, i: int):
+    return {"ts_iso": f"2024-01-01T00:00:00.{user:03d}{i:03d}", "exchange": "binance",
+            "pair": PAIRS[i % len(PAIRS)], "side": "BUY", "price": 100.0 + i, "qty": 1.0,
+            "src_image_id": f"u{user}-{i}"}
+
+async def _run(mode: str, users: int, trades: int, backend: str, latency: float, root: str):
+    cfg = {"storage_backend": backend, "ledger": {"users_dir": root}}
+    shards = LedgerShards(cfg, shard_by_chat=True)
+
+    def chat(u: int) -> str:
+        return f"u{u}" if mode == "sharded" else "all"
+
+    def record(led, trade):
+        if latency:
+            time.sleep(latency)
+        return led.pnl.record_trades([trade])
+
+    async def user(u: int):
+        led = shards.get(chat(u))
+        for i in range(trades):
+            if mode == "unlocked":
+                try:
+                    await asyncio.to_thread(record, led, _trade(u, i))
+                except OSError:
+                    pass   # เขียน positions.csv ชนกัน — นับรวมใน "หาย" ตอนตรวจ
+            else:
+                await led.run(record, led, _trade(u, i))
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(user(u) for u in range(users)))
+    elapsed = time.perf_counter() - t0
+
+    lost = 0
+    for key in {chat(u) for u in range(users)}:
+        led = shards.get(key)
+        owners = [u for u in range(users) if chat(u) == key]
+        expected = Counter(PAIRS[i % len(PAIRS)] for _ in owners for i in range(trades))
+        for pair, n in expected.items():
+            lost += int(round(n - led.storage.get_position(pair)["position_qty"]))
+        rows = sum(len(c) for c in led.storage.iter_rows("trades"))
+        lost += len(owners) * trades - rows
+    shards.close()
+    return users * trades / elapsed, lost
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--users", default="1,2,4,8,16", help="จำนวนผู้ใช้ที่วัด คั่นด้วย ,")
+    ap.add_argument("--trades", type=int, default=100, help="จำนวนดีลต่อผู้ใช้")
+    ap.add_argument("--backend", choices=("csv", "sqlite"), default="csv")
+    ap.add_argument("--latency-ms", type=float, default=0.0)
+    ap.add_argument("--modes", default="sharded,shared,unlocked")
+    args = ap.parse_args()
+
+    modes = args.modes.split(",")
+    print(f"backend={args.backend}, {args.trades} ดีล/ผู้ใช้, latency={args.latency_ms:.0f}ms")
+    print(f"{'users':>5} " + " ".join(f"{m + ' ดีล/s':>16} {'หาย':>5}" for m in modes))
+    failed = False
+    for n in [int(x) for x in args.users.split(",")]:
+        cells = []
+        for mode in modes:
+            with tempfile.TemporaryDirectory() as tmp:
+                rate, lost = asyncio.run(_run(mode, n, args.trades, args.backend, args.latency_ms / 1000.0,
+                                              os.path.join(tmp, "users")))
+            cells.append(f"{rate:>16.0f} {lost:>5}")
+            failed |= lost != 0 and mode != "unlocked"
+        print(f"{n:>5} " + " ".join(cells))
+    if failed:
+        print("มี update หายในโหมดที่มี lock")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
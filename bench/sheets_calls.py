@@ -0,0 +1,59 @@
+"""นับจำนวน Sheets API call ต่อดีล เมื่อบันทึกผ่าน PnLEngine + SheetsBackend (ใช้ gspread จำลอง)
+
+    python -m bench.sheets_calls [--trades 500] [--pairs 20] [--fail-every 0]
+"""
+import os
+import random
+import argparse
+import tempfile
+
+from bench.fake_gspread import FakeSpreadsheet
+from storage import TradeStorage
+from storage_sheets import SheetsBackend
+from pnl import PnLEngine
+
+def run(trades: int, pairs: int, fail_every: int = 0, max_pending: int = 50):
+    book = FakeSpreadsheet()
+    retry_path = os.path.join(tempfile.mkdtemp(), "sheets_retry.json")
+    backend = SheetsBackend(book, max_pending=max_pending, retry_path=retry_path,
+                            flush_interval=3600, autostart=False)
+    setup_calls = book.total_calls()
+    book.fail_every = fail_every  # จำลอง 429 เฉพาะช่วง sync ไม่ใช่ตอนเปิดชีต
+    engine = PnLEngine(TradeStorage(backend))
+    rnd = random.Random(7)
+    for i in range(trades):
+        pair = f"C{rnd.randrange(pairs)}/USDT"
+        side = "BUY" if rnd.random() < 0.6 else "SELL"
+        engine.record_trade({"pair": pair, "side": side, "price": rnd.uniform(1, 100),
+                             "qty": rnd.uniform(0.1, 5), "src_image_id": f"img{i}"})
+        if fail_every:
+            backend._retry_at = 0.0  # ไม่ต้องรอ backoff จริงในการวัด
+    backend._retry_at = 0.0
+    backend.close()
+    while backend.pending():
+        backend._retry_at = 0.0
+        backend.flush()
+
+    sync_calls = book.total_calls() - setup_calls
+
+    # ตรวจว่าข้อมูลในชีตจำลองตรงกับ index ในหน่วยความจำ
+    sheet_pos = {r["pair"]: r for r in book.sheets["positions"].get_all_records()}
+    for p in backend.get_all_positions():
+        assert abs(float(sheet_pos[p["pair"]]["position_qty"]) - p["position_qty"]) < 1e-9, p
+    assert len(book.sheets["trades"].cells) == trades + 1
+    return book, setup_calls, sync_calls
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--trades", type=int, default=500)
+    ap.add_argument("--pairs", type=int, default=20)
+    ap.add_argument("--fail-every", type=int, default=0, help="จำลอง 429 ทุก ๆ N calls")
+    ap.add_argument("--max-pending", type=int, default=50)
+    args = ap.parse_args()
+    book, setup, used = run(args.trades, args.pairs, args.fail_every, args.max_pending)
+    print(f"trades={args.trades} setup_calls={setup} sync_calls={used} "
+          f"calls/trade={used / args.trades:.3f} simulated_429={book.calls['429']}")
+    print("by method:", dict(book.calls))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+"""สร้างรูปสลิปเทรดสังเคราะห์ด้วย PIL พร้อมค่าจริง (ground truth) ของแต่ละฟิลด์
+
+ชนิดสลิป: Binance spot, Binance Convert, MEXC spot, Pionex (grid) และหน้า Wallet
+ภาษาไทย/อังกฤษ, ธีมสว่าง/มืด, ที่ความละเอียดหน้าจอมือถือ
+
+ฟอนต์: ตั้ง BENCH_FONT / BENCH_FONT_THAI เป็นพาธ .ttf ได้ ไม่งั้นจะหาจากพาธมาตรฐานของระบบ
+ถ้าไม่เจอฟอนต์ไทย สลิปไทยยังถูกสร้าง (ใช้วัด parser ได้) แต่จะถูกตัดออกจากการวัดความแม่นของ OCR
+"""
+import io
+import os
+import random
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+PHONE_RESOLUTIONS = [(1080, 2400), (720, 1600), (1170, 2532)]
+
+_LATIN_FONTS = [
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/liberation/LiberationSans-Regular.ttf",
+    "/Library/Fonts/Arial.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+]
+_THAI_FONTS = [
+    "/usr/share/fonts/truetype/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/noto/NotoSansThai-Regular.ttf",
+    "/usr/share/fonts/truetype/tlwg/Loma.ttf",
+    "/usr/share/fonts/truetype/tlwg/Garuda.ttf",
+    "/System/Library/Fonts/Supplemental/Thonburi.ttc",
+    "C:/Windows/Fonts/tahoma.ttf",
+]
+
+def _find_font(env: str, candidates: List[str]) -> Optional[str]:
+    path = os.getenv(env)
+    if path and os.path.exists(path):
+        return path
+    for p in candidates:
+        if os.path.exists(p):
+            return p
+    return None
+
+LATIN_FONT = _find_font("BENCH_FONT", _LATIN_FONTS)
+THAI_FONT = _find_font("BENCH_FONT_THAI", _THAI_FONTS)
+
+def _font(size: int, thai: bool = False):
+    path = (THAI_FONT if thai else None) or LATIN_FONT
+    if path:
+        return ImageFont.truetype(path, size)
+    return ImageFont.load_default(size=size)
+
+@dataclass
+class Slip:
+    kind: str                      # binance_spot | binance_convert | mexc_spot | pionex_grid | wallet
+    lang: str                      # en | th
+    size: Tuple[int, int]
+    theme: str                     # light | dark
+    lines: List[Tuple[str, str]]   # (label, value) ตามลำดับบนจอ
+    truth: Dict[str, Any]          # ค่าที่ parser ควรอ่านได้
+    image: Optional[Image.Image] = None
+    meta: Dict[str, Any] = field(default_factory=dict)
+
+    @property
+    def text(self) -> str:
+        """ข้อความในอุดมคติ (เหมือน OCR อ่านถูกทุกตัว) — ใช้วัด parser แยกจาก OCR"""
+        return "\n".join(f"{a} {b}".strip() for a, b in self.lines) + "\n"
+
+    @property
+    def ocr_comparable(self) -> bool:
+        return self.lang == "en" or THAI_FONT is not None
+
+    def encode(self, fmt: str = "PNG", quality: int = 90) -> bytes:
+        buf = io.BytesIO()
+        img = self.image.convert("RGB") if fmt.upper() == "JPEG" else self.image
+        img.save(buf, format=fmt, quality=quality)
+        return buf.getvalue()
+
+# ---------------- เนื้อหาสลิป ----------------
+
+_COINS = [("SOL", "USDT", 142.37), ("ETH", "USDT", 3120.55), ("BTC", "USDT", 64850.2),
+          ("SOL", "BTC", 0.0021906), ("PEPE", "USDT", 0.00001234), ("ADA", "USDT", 0.4521)]
+
+def _fmt(x: float) -> str:
+    if x >= 1000:
+        return f"{x:,.2f}"
+    if x >= 1:
+        return f"{x:.4f}".rstrip("0").rstrip(".")
+    return f"{x:.8f}".rstrip("0").rstrip(".")
+
+def _shown(x: float) -> float:
+    """ค่าที่ปรากฏบนสลิปจริง (ตามความละเอียดของ _fmt) — ใช้เป็นค่าเฉลยแทนค่าดิบ"""
+    return float(_fmt(x).replace(",", ""))
+
+def _time(rnd: random.Random) -> str:
+    return (f"2024-{rnd.randint(1, 12):02d}-{rnd.randint(1, 28):02d} "
+            f"{rnd.randint(0, 23):02d}:{rnd.randint(0, 59):02d}:{rnd.randint(0, 59):02d}")
+
+def _binance_spot(rnd, lang):
+    base, quote, px = rnd.choice(_COINS)
+    price = round(px * rnd.uniform(0.9, 1.1), 8)
+    qty = round(rnd.uniform(0.01, 50), 4) if px > 1e-3 else float(rnd.randint(100000, 9000000))
+    price, qty = _shown(price), _shown(qty)
+    fee = _shown(qty * price * 0.001)
+    side = rnd.choice(["BUY", "SELL"])
+    t = _time(rnd)
+    if lang == "th":
+        lines = [(f"{base}/{quote}", ""), ("ซื้อ" if side == "BUY" else "ขาย", ""),
+                 ("ราคา", _fmt(price)), ("จำนวน", _fmt(qty)),
+                 ("ค่าธรรมเนียม", _fmt(fee)), ("เวลา", t)]
+        truth = {"pair": f"{base}/{quote}", "side": side, "price": price, "qty": qty, "fee": fee, "time": t}
+    else:
+        lines = [("Binance", ""), (f"{base}/{quote}", ""), (side.title(), "Filled"),
+                 (f"Price ({quote})", _fmt(price)), (f"Filled ({base})", _fmt(qty)),
+                 (f"Fee ({quote})", _fmt(fee)), (f"Total ({quote})", _fmt(price * qty)),
+                 ("Time", t)]
+        truth = {"pair": f"{base}/{quote}", "side": side, "price": price, "qty": qty,
+                 "fee": fee, "fee_asset": quote, "time": t}
+    return lines, truth
+
+def _binance_convert(rnd, lang):
+    base = rnd.choice(["CRV", "ADA", "DOT", "LINK"])
+    quote = "BTC"
+    price = _shown(rnd.uniform(0.000005, 0.0003))
+    qty = float(rnd.randint(10, 900))
+    t = _time(rnd)
+    lines = [("Convert", "Successful"), ("You will receive", f"+{_fmt(qty)} {base}"),
+             ("From", f"{_fmt(qty * price)} {quote}"),
+             ("Inverse Price", f"1 {base} = {_fmt(price)} {quote}"),
+             ("Transaction Amount", f"{_fmt(qty * price)} {quote}"), ("Time", t)]
+    if lang == "th":
+        lines[0] = ("แปลง", "สำเร็จ")
+    truth = {"pair": f"{base}/{quote}", "side": "BUY", "price": price, "qty": qty, "time": t}
+    return lines, truth
+
+def _mexc_spot(rnd, lang):
+    base, quote, px = rnd.choice([c for c in _COINS if c[1] == "USDT"])
+    price = round(px * rnd.uniform(0.9, 1.1), 8)
+    qty = round(rnd.uniform(0.01, 50), 4) if px > 1e-3 else float(rnd.randint(100000, 9000000))
+    price, qty = _shown(price), _shown(qty)
+    fee = _shown(qty * price * 0.001)
+    side = rnd.choice(["BUY", "SELL"])
+    t = _time(rnd)
+    lines = [("MEXC", ""), (f"{base}/{quote}", f"{side.title()} Filled"),
+             ("Price", _fmt(price)), ("Amount", _fmt(qty)), ("Fee", f"{_fmt(fee)} USDT"), ("Time", t)]
+    if lang == "th":
+        lines[2] = ("ราคา", _fmt(price))
+        lines[3] = ("จำนวน", _fmt(qty))
+        lines[4] = ("ค่าธรรมเนียม", f"{_fmt(fee)} USDT")
+    truth = {"pair": f"{base}/{quote}", "side": side, "price": price, "qty": qty, "fee": fee, "time": t}
+    return lines, truth
+
+def _pionex_grid(rnd, lang):
+    base, quote, px = rnd.choice([c for c in _COINS if c[1] == "USDT" and c[2] > 1])
+    price = round(px * rnd.uniform(0.95, 1.05), 4)
+    qty = round(rnd.uniform(0.001, 2), 4)
+    price, qty = _shown(price), _shown(qty)
+    fee = _shown(price * qty * 0.0005)
+    side = rnd.choice(["BUY", "SELL"])
+    t = _time(rnd)
+    lines = [("Pionex", "Grid Bot"), (f"{base}/{quote}", side.title()),
+             ("Price", _fmt(price)), ("Qty", _fmt(qty)), ("Fee", _fmt(fee)), ("Filled time", t)]
+    truth = {"pair": f"{base}/{quote}", "side": side, "price": price, "qty": qty, "fee": fee, "time": t}
+    return lines, truth
+
+def _wallet(rnd, lang):
+    assets = []
+    lines = [("Hide assets < 1 USD", "")]
+    coins = list({c[0]: c for c in _COINS}.values())
+    for sym, _, px in rnd.sample(coins, 4):
+        qty = _shown(rnd.uniform(0.01, 20))
+        usd = round(qty * px, 2)
+        lines.append((sym, f"{_fmt(qty)} ${usd:,.2f}"))
+        assets.append({"asset": sym, "qty": qty, "usd": usd})
+    return lines, {"assets": assets}
+
+KINDS = {
+    "binance_spot": _binance_spot,
+    "binance_convert": _binance_convert,
+    "mexc_spot": _mexc_spot,
+    "pionex_grid": _pionex_grid,
+    "wallet": _wallet,
+}
+
+# ---------------- วาดภาพ ----------------
+
+def render(slip: Slip, rnd: random.Random) -> Image.Image:
+    w, h = slip.size
+    bg, fg, dim = ((255, 255, 255), (20, 20, 20), (140, 140, 140)) if slip.theme == "light" \
+        else ((18, 20, 24), (235, 235, 235), (120, 120, 120))
+    img = Image.new("RGB", (w, h), bg)
+    d = ImageDraw.Draw(img)
+    fs = max(14, w // 27)
+    thai = slip.lang == "th"
+    font = _font(fs, thai)
+    small = _font(int(fs * 0.7))
+
+    # status bar + ส่วนที่ไม่ใช่ข้อความ (กราฟ/ปุ่ม) ให้ใกล้ภาพจริง
+    d.text((int(w * 0.05), int(fs * 0.4)), "9:41", font=small, fill=fg)
+    d.rectangle((w - int(w * 0.12), int(fs * 0.5), w - int(w * 0.05), int(fs * 1.0)), outline=fg, width=2)
+    y = int(h * 0.06)
+    if slip.kind in ("binance_spot", "mexc_spot", "pionex_grid"):
+        chart_h = int(h * 0.18)
+        pts = [(int(w * 0.05 + i * w * 0.9 / 40), y + int(chart_h * rnd.uniform(0.1, 0.9))) for i in range(41)]
+        d.line(pts, fill=(46, 189, 133) if rnd.random() < 0.5 else (246, 70, 93), width=3)
+        y += chart_h + fs
+
+    margin = int(w * 0.06)
+    line_gap = int(fs * 1.9)
+    for label, value in slip.lines:
+        d.text((margin, y), label, font=font, fill=fg if not value else dim)
+        if value:
+            tw = d.textlength(value, font=font)
+            d.text((w - margin - tw, y), value, font=font, fill=fg)
+        y += line_gap
+
+    # ปุ่มด้านล่าง
+    d.rounded_rectangle((margin, h - int(h * 0.09), w - margin, h - int(h * 0.04)),
+                        radius=fs // 2, fill=(240, 185, 11))
+    return img
+
+def generate(n: int = 20, seed: int = 1, kinds: List[str] = None, langs=("en", "th"),
+             sizes: List[Tuple[int, int]] = None, with_images: bool = True) -> List[Slip]:
+    rnd = random.Random(seed)
+    kinds = kinds or list(KINDS)
+    sizes = sizes or PHONE_RESOLUTIONS
+    out = []
+    for i in range(n):
+        kind = kinds[i % len(kinds)]
+        lang = langs[(i // len(kinds)) % len(langs)]
+        lines, truth = KINDS[kind](rnd, lang)
+        slip = Slip(kind, lang, rnd.choice(sizes), rnd.choice(["light", "dark"]), lines, truth)
+        if with_images:
+            slip.image = render(slip, rnd)
+        out.append(slip)
+    return out
+
+# ---------------- ตรวจความถูกต้อง ----------------
+
+def _same(expected, got) -> bool:
+    if isinstance(expected, float):
+        try:
+            return got is not None and abs(float(got) - expected) <= 1e-9 + 1e-6 * abs(expected)
+        except (TypeError, ValueError):
+            return False
+    return expected == got
+
+def score(slip: Slip, parsed: Optional[Dict[str, Any]]) -> Tuple[int, int]:
+    """(จำนวนฟิลด์ที่ถูก, จำนวนฟิลด์ทั้งหมด)"""
+    if slip.kind == "wallet":
+        want = slip.truth["assets"]
+        got = {a["asset"]: a for a in ((parsed or {}).get("assets") or [])}
+        ok = sum(1 for a in want if a["asset"] in got and _same(a["qty"], got[a["asset"]]["qty"]))
+        return ok, len(want)
+    parsed = parsed or {}
+    ok = sum(1 for k, v in slip.truth.items() if _same(v, parsed.get(k)))
+    return ok, len(slip.truth)
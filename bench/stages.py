@@ -0,0 +1,173 @@
+"""วัดเวลาแต่ละขั้นของ pipeline แยกกัน บนสลิปสังเคราะห์ และเทียบกับ baseline
+
+    python -m bench.stages                       # วัดแล้วเทียบกับ bench/baseline.json
+    python -m bench.stages --update-baseline     # บันทึกผลครั้งนี้เป็น baseline ใหม่
+    python -m bench.stages --n 50 --threshold 0.2
+
+ขั้นที่วัด: decode, preprocess, tesseract (pass เดียวแบบเดิม), ocr_cascade (ครอป+ไล่ pass),
+parse_trade, parse_wallet, record_trade (CSV)
+และรายงานความแม่นของการดึงฟิลด์ (จากข้อความในอุดมคติ และจาก OCR จริงถ้ามี tesseract)
+คืน exit code 1 ถ้า median ของขั้นใดช้าลงเกิน threshold หรือความแม่นลดลงจาก baseline
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+from typing import Dict, Any, List, Callable
+
+from bench import slips as slipgen
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "n": len(ms),
+        "median_ms": round(statistics.median(ms), 4),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 4),
+        "mean_ms": round(statistics.fmean(ms), 4),
+    }
+
+def _timed(fn: Callable, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+def _tesseract_available() -> bool:
+    try:
+        import pytesseract
+        pytesseract.get_tesseract_version()
+        return True
+    except Exception:
+        return False
+
+def run(n: int = 20, seed: int = 1, ocr: bool = True) -> Dict[str, Any]:
+    from ocr_engine import _preprocess, _cascade, decode_gray
+    from parser_engine import parse_trade_from_text, parse_wallet_from_text
+
+    slips = slipgen.generate(n=n, seed=seed)
+    encoded = [s.encode("JPEG" if i % 2 else "PNG") for i, s in enumerate(slips)]
+    times: Dict[str, List[float]] = {k: [] for k in
+                                     ("decode", "preprocess", "tesseract", "ocr_cascade",
+                                      "parse_trade", "parse_wallet", "record_trade")}
+    acc = {"parse_ok": 0, "parse_total": 0, "ocr_ok": 0, "ocr_total": 0, "cascade_ok": 0, "cascade_total": 0}
+    ocr = ocr and _tesseract_available()
+
+    for slip, data in zip(slips, encoded):
+        img, t = _timed(decode_gray, data)
+        times["decode"].append(t)
+        proc, t = _timed(_preprocess, img)
+        times["preprocess"].append(t)
+
+        if slip.kind == "wallet":
+            parsed, t = _timed(parse_wallet_from_text, slip.text)
+            times["parse_wallet"].append(t)
+        else:
+            parsed, t = _timed(parse_trade_from_text, slip.text)
+            times["parse_trade"].append(t)
+        ok, total = slipgen.score(slip, parsed)
+        acc["parse_ok"] += ok
+        acc["parse_total"] += total
+
+        if ocr:
+            import pytesseract
+            text, t = _timed(lambda p: pytesseract.image_to_string(p, lang="tha+eng"), proc)
+            times["tesseract"].append(t)
+            cascade_text, t = _timed(_cascade, img, {})
+            times["ocr_cascade"].append(t)
+            if slip.ocr_comparable:
+                for key, txt in (("ocr", text), ("cascade", cascade_text)):
+                    parsed = parse_wallet_from_text(txt) if slip.kind == "wallet" else parse_trade_from_text(txt)
+                    ok, total = slipgen.score(slip, parsed)
+                    acc[f"{key}_ok"] += ok
+                    acc[f"{key}_total"] += total
+
+    # record_trade บน CSV ในโฟลเดอร์ชั่วคราว (ไม่แตะ data/ จริง)
+    from storage import TradeStorage, CSVBackend
+    from pnl import PnLEngine
+    tmp = tempfile.mkdtemp(prefix="bench-ledger-")
+    try:
+        engine = PnLEngine(TradeStorage(CSVBackend(tmp)))
+        trades = [s.truth for s in slips if s.kind != "wallet"]
+        for i in range(max(n, 50)):
+            trade = dict(trades[i % len(trades)], src_image_id=f"bench{i}", ts_iso="2024-01-01T00:00:00")
+            _, t = _timed(engine.record_trade, trade)
+            times["record_trade"].append(t)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    result = {
+        "n": n,
+        "seed": seed,
+        "stages": {k: _summary(v) for k, v in times.items() if v},
+        "accuracy": {
+            "parse": round(acc["parse_ok"] / acc["parse_total"], 4) if acc["parse_total"] else None,
+            "ocr": round(acc["ocr_ok"] / acc["ocr_total"], 4) if acc["ocr_total"] else None,
+            "ocr_cascade": round(acc["cascade_ok"] / acc["cascade_total"], 4) if acc["cascade_total"] else None,
+        },
+        "fonts": {"latin": slipgen.LATIN_FONT, "thai": slipgen.THAI_FONT},
+    }
+    if not ocr:
+        result["notes"] = ["tesseract ไม่พร้อมใช้งาน — ข้ามขั้น tesseract และความแม่นของ OCR"]
+    return result
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """คืนรายการปัญหา (ว่าง = ผ่าน)"""
+    problems = []
+    for stage, cur in result["stages"].items():
+        base = baseline.get("stages", {}).get(stage)
+        if not base:
+            continue
+        limit = base["median_ms"] * (1 + threshold)
+        if cur["median_ms"] > limit:
+            problems.append(f"{stage}: median {cur['median_ms']:.3f}ms > {limit:.3f}ms "
+                            f"(baseline {base['median_ms']:.3f}ms +{threshold:.0%})")
+    # ความแม่นเทียบได้เฉพาะเมื่อใช้ชุดสลิปเดียวกัน
+    same_set = (result["n"], result["seed"]) == (baseline.get("n"), baseline.get("seed"))
+    for key, cur in result["accuracy"].items() if same_set else ():
+        base = baseline.get("accuracy", {}).get(key)
+        if base is not None and cur is not None and cur < base:
+            problems.append(f"accuracy.{key}: {cur:.4f} < baseline {base:.4f}")
+    return problems
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--n", type=int, default=20, help="จำนวนสลิป")
+    ap.add_argument("--seed", type=int, default=1)
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--update-baseline", action="store_true")
+    ap.add_argument("--threshold", type=float, default=0.25, help="ยอมให้ช้าลงได้ไม่เกิน (สัดส่วน)")
+    ap.add_argument("--no-ocr", action="store_true", help="ข้ามขั้น tesseract")
+    ap.add_argument("--out", default=None, help="เขียนผลเป็น JSON ลงไฟล์")
+    args = ap.parse_args()
+
+    result = run(args.n, args.seed, ocr=not args.no_ocr)
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+    if args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"บันทึก baseline ที่ {args.baseline}", file=sys.stderr)
+        return
+    if not os.path.exists(args.baseline):
+        print("ยังไม่มี baseline — รันด้วย --update-baseline ก่อน", file=sys.stderr)
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    problems = compare(result, baseline, args.threshold)
+    for p in problems:
+        print("REGRESSION:", p, file=sys.stderr)
+    if problems:
+        sys.exit(1)
+    print("ผ่าน: ไม่มีขั้นไหนช้าลงเกิน threshold", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""เวลาเริ่มบอท: import main และเวลาจนตอบข้อความแรกหลังรีสตาร์ท (งบเวลาเป็น exit code)
+
+    python -m bench.startup                                   # import 5 รอบ + เริ่มบอทจริง 3 รอบ
+    python -m bench.startup --photo                           # วัดรูปแรกหลังเริ่มด้วย (ต้องมี tesseract)
+    python -m bench.startup --max-import-ms 800 --max-first-reply-ms 2500
+
+- import: `import main` ใน interpreter ใหม่ทุกรอบ (ค่ากลาง) และตรวจว่าไม่ได้โหลดโมดูลหนัก
+  (cv2, pytesseract, pandas, numpy, gspread) ใน process หลัก — โหลดเมื่อใช้จริงหรือใน worker ของ OCR pool
+- first reply: รัน `python main.py` เป็น process แยกกับ Bot API ปลอม (bench.fake_telegram) โดยมี /start และ
+  /status รอในคิวตั้งแต่ก่อนเริ่ม วัดเวลาตั้งแต่สั่งรันจนได้คำตอบแต่ละข้อความ
+  บอทรันในโฟลเดอร์ชั่วคราว (config ชี้ด้วย TRADEBOT_CONFIG_DIR) จึงไม่แตะ data/ จริง
+exit 1 ถ้าเกินงบ หรือโมดูลหนักถูก import ตอนเริ่ม
+"""
+import os
+import sys
+import glob
+import json
+import time
+import shutil
+import signal
+import argparse
+import tempfile
+import threading
+import statistics
+import subprocess
+from typing import Dict, List
+
+import yaml
+
+from bench.fake_telegram import FakeBotAPI
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("cv2", "pytesseract", "pandas", "numpy", "gspread")
+_PROBE = ("import sys, time, json; t = time.perf_counter(); import main; "
+          "print(json.dumps({'ms': (time.perf_counter() - t) * 1000, 'heavy': [m for m in %r if m in sys.modules]}))")
+
+def _workdir(workers: int) -> str:
+    tmp = tempfile.mkdtemp(prefix="startup_")
+    for path in glob.glob(os.path.join(ROOT, "*.yaml")):
+        shutil.copy(path, tmp)
+    with open(os.path.join(tmp, "config.yaml"), encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    cfg.setdefault("metrics", {}).update({"prometheus_port": 0, "profiler": False})
+    cfg["storage_backend"] = "csv"
+    cfg["use_google_sheets"] = False
+    if workers:
+        cfg.setdefault("ocr_pool", {})["workers"] = workers
+    with open(os.path.join(tmp, "config.yaml"), "w", encoding="utf-8") as f:
+        yaml.safe_dump(cfg, f, allow_unicode=True)
+    return tmp
+
+def _env(work: str, **extra) -> Dict[str, str]:
+    env = dict(os.environ, TRADEBOT_CONFIG_DIR=work, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    env.update(extra)
+    return env
+
+def measure_import(work: str) -> Dict:
+    out = subprocess.run([sys.executable, "-c", _PROBE % (HEAVY,)], cwd=work, env=_env(work),
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def _slip_jpeg() -> bytes:
+    from bench import slips as slipgen
+    return slipgen.generate(1, seed=5, kinds=["binance_spot"], langs=("en",))[0].encode("JPEG", quality=85)
+
+def measure_first_reply(work: str, photo: bytes = None, timeout: float = 60.0) -> Dict[str, float]:
+    """รันบอทเป็น process ใหม่ คืนเวลา (ms) จนได้คำตอบของ /start, /status (และรูปแรก)"""
+    got: Dict[int, float] = {}
+    done = threading.Event()
+    t0 = [0.0]
+    expect = 3 if photo else 2
+
+    def on_reply(method, msg):
+        chat = msg["chat"]["id"]
+        if chat not in got:
+            got[chat] = (time.perf_counter() - t0[0]) * 1000
+            if len(got) >= expect:
+                done.set()
+
+    api = FakeBotAPI(on_reply=on_reply).start()
+    # แต่ละข้อความใช้ chat ของตัวเอง — คำตอบแรกของแต่ละ chat คือคำตอบของข้อความนั้น
+    api.push_message(chat_id=1, text="/start")
+    api.push_message(chat_id=2, text="/status")
+    if photo:
+        api.push_message(chat_id=3, photo=photo)
+    shutil.rmtree(os.path.join(work, "data"), ignore_errors=True)
+    env = _env(work, TELEGRAM_BOT_TOKEN="1:FAKE", TELEGRAM_BASE_URL=api.base_url,
+               TELEGRAM_BASE_FILE_URL=api.base_file_url)
+    t0[0] = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(ROOT, "main.py")], cwd=work, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        if not done.wait(timeout):
+            raise RuntimeError(f"บอทไม่ตอบภายใน {timeout:.0f} วินาที")
+    finally:
+        proc.send_signal(signal.SIGINT)
+        try:
+            _, err = proc.communicate(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            _, err = proc.communicate()
+        api.stop()
+    if not got or proc.returncode not in (0, -signal.SIGINT):
+        sys.stderr.write(err[-3000:])
+    names = {1: "/start", 2: "/status", 3: "photo"}
+    return {names[c]: ms for c, ms in got.items()}
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    ap.add_argument("--import-runs", type=int, default=5)
+    ap.add_argument("--runs", type=int, default=3, help="จำนวนครั้งที่เริ่มบอทจริง")
+    ap.add_argument("--photo", action="store_true", help="ส่งรูปสลิปรอไว้ด้วย (OCR จริง ต้องมี tesseract)")
+    ap.add_argument("--workers", type=int, default=0, help="จำนวน OCR worker (0 = ตาม config)")
+    ap.add_argument("--max-import-ms", type=float, default=1000.0)
+    ap.add_argument("--max-first-reply-ms", type=float, default=3000.0, help="งบของ /start")
+    args = ap.parse_args()
+
+    work = _workdir(args.workers)
+    ok = True
+    try:
+        imports: List[Dict] = [measure_import(work) for _ in range(args.import_runs)]
+        imp = statistics.median(r["ms"] for r in imports)
+        heavy = sorted({m for r in imports for m in r["heavy"]})
+        print(f"import main: ค่ากลาง {imp:.0f} ms (ต่ำสุด {min(r['ms'] for r in imports):.0f} ms), "
+              f"โมดูลหนักที่โหลด: {', '.join(heavy) or '-'}")
+        if heavy:
+            print(f"ไม่ควร import {', '.join(heavy)} ตอนเริ่ม (ให้โหลดเมื่อใช้)")
+            ok = False
+        if imp > args.max_import_ms:
+            print(f"import เกินงบ {args.max_import_ms:.0f} ms")
+            ok = False
+
+        photo = _slip_jpeg() if args.photo else None
+        runs = [measure_first_reply(work, photo) for _ in range(args.runs)]
+        for name in ("/start", "/status", "photo"):
+            xs = [r[name] for r in runs if name in r]
+            if xs:
+                print(f"คำตอบแรก {name:<8} ค่ากลาง {statistics.median(xs):>6.0f} ms  (ทุกรอบ: "
+                      + ", ".join(f"{x:.0f}" for x in xs) + ")")
+        first = statistics.median(r["/start"] for r in runs)
+        if first > args.max_first_reply_ms:
+            print(f"/start ตอบช้ากว่างบ {args.max_first_reply_ms:.0f} ms")
+            ok = False
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+    if not ok:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+def _trie_pattern(words: List[str]) -> str:
+    """regex ของคีย์เวิร์ดทั้งหมดแบบแตก prefix ร่วมกัน (เช่น okx|okx pro → okx(?:\\ pro)?)
+
+    แต่ละตำแหน่งลองแค่กิ่งที่ตัวอักษรตรงกัน และ ? แบบ greedy ทำให้ได้คีย์เวิร์ดที่ยาวที่สุดก่อน
+    """
+    trie: Dict[str, dict] = {}
+    for w in words:
+        node = trie
+        for ch in w:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        end = "" in node
+        alts = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not alts:
+            return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        if end:
+            body = ("(?:" + body + ")" if len(alts) == 1 and len(body) > 1 else body) + "?"
+        return body
+
+    return build(trie)
+
+class KeywordAutomaton:
+    """หาคีย์เวิร์ดทุกตัวในข้อความด้วย regex ตัวเดียว (ไม่สนตัวพิมพ์เล็ก/ใหญ่) — สแกนใน C ของ re
+
+    ทุกตำแหน่งที่มีคีย์เวิร์ดขึ้นต้น ได้คีย์เวิร์ดที่ยาวที่สุดตรงนั้นแล้วนับคีย์เวิร์ดที่เป็น prefix ของมันด้วย
+    และค้นต่อจากตัวอักษรถัดไป (ไม่ข้ามทั้งคำ จึงเจอคีย์เวิร์ดที่ซ้อนกันด้วย) — ผลเท่ากับหาคีย์เวิร์ดทุกตัวทีละคำ
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = list(dict.fromkeys(k.lower() for k in keywords if k))
+        index = {kw: i for i, kw in enumerate(self.keywords)}
+        # คีย์เวิร์ด -> index ของตัวมันเองและทุกคีย์เวิร์ดที่เป็น prefix ของมัน
+        self._hits: Dict[str, Tuple[int, ...]] = {
+            kw: tuple(index[kw[:n]] for n in range(1, len(kw) + 1) if kw[:n] in index) for kw in self.keywords}
+        self._regex = re.compile(_trie_pattern(self.keywords)) if self.keywords else None
+
+    def find(self, text: str) -> Set[int]:
+        """index ของคีย์เวิร์ด (ตามลำดับใน self.keywords) ที่พบในข้อความ"""
+        found: Set[int] = set()
+        if self._regex is None:
+            return found
+        search, hits = self._regex.search, self._hits
+        text = text.lower()
+        m = search(text)
+        while m:
+            found.update(hits[m.group()])
+            m = search(text, m.start() + 1)
+        return found
+
+@dataclass
+class Classification:
+    exchange: str = "unknown"
+    slip_type: str = "spot"
+    scores: Dict[str, float] = field(default_factory=dict)
+    keywords: List[str] = field(default_factory=list)
+
+class SlipClassifier:
+    """ระบุ exchange และชนิดสลิปจากคีย์เวิร์ดทั้งหมดใน automaton เดียว
+
+    คะแนนของ exchange = ผลรวมน้ำหนักคีย์เวิร์ดที่พบ (ต่างตัวกัน) โดยคีย์เวิร์ดที่หลาย exchange ใช้ร่วมกัน
+    (เช่น "filled") ได้น้ำหนักหารตามจำนวนเจ้าของ และชื่อ exchange เองได้ name_weight
+    คะแนนเท่ากันเลือกตัวที่มาก่อนใน config; ชนิดสลิปเลือกตัวแรกใน slip_type_keywords ที่พบ ไม่งั้นเป็น default_type
+    """
+
+    def __init__(self, exchange_keywords: Dict[str, List[str]], slip_type_keywords: Dict[str, List[str]] = None,
+                 default_type: str = "spot", name_weight: float = 3.0):
+        self.exchanges = list(exchange_keywords or {})
+        self.slip_types = list(slip_type_keywords or {})
+        self.default_type = default_type
+        # keyword -> [("exchange", ชื่อ) | ("type", ชื่อ)]
+        owners: Dict[str, List[Tuple[str, str]]] = {}
+        for ex, keys in (exchange_keywords or {}).items():
+            for k in list(keys or []) + [ex]:
+                lst = owners.setdefault(k.lower(), [])
+                if ("exchange", ex) not in lst:
+                    lst.append(("exchange", ex))
+        for st, keys in (slip_type_keywords or {}).items():
+            for k in keys or []:
+                owners.setdefault(k.lower(), []).append(("type", st))
+        self.automaton = KeywordAutomaton(owners)
+        # ต่อคีย์เวิร์ด: ((exchange, น้ำหนัก), ...) และ (ชนิดสลิป, ...) — คำนวณไว้ก่อนเพื่อให้ classify เหลือแค่บวกเลข
+        self._weights: List[Tuple[Tuple[str, float], ...]] = []
+        self._types: List[Tuple[str, ...]] = []
+        for kw in self.automaton.keywords:
+            exs = [name for kind, name in owners[kw] if kind == "exchange"]
+            self._weights.append(tuple((ex, name_weight if kw == ex.lower() else 1.0 / len(exs)) for ex in exs))
+            self._types.append(tuple(name for kind, name in owners[kw] if kind == "type"))
+
+    def classify(self, text: str) -> Classification:
+        found = self.automaton.find(text or "")
+        scores: Dict[str, float] = {}
+        types: Set[str] = set()
+        for idx in found:
+            for ex, weight in self._weights[idx]:
+                scores[ex] = scores.get(ex, 0.0) + weight
+            types.update(self._types[idx])
+        exchange = "unknown"
+        best = 0.0
+        for ex in self.exchanges:
+            if scores.get(ex, 0.0) > best:
+                exchange, best = ex, scores[ex]
+        slip_type = self.default_type
+        if types:
+            slip_type = next(st for st in self.slip_types if st in types)
+        return Classification(exchange, slip_type, scores, [self.automaton.keywords[i] for i in found])
+
+class Router:
+    """เลือกชุด pattern family ตาม (exchange, ชนิดสลิป) จาก routes ใน parser_patterns.yaml
+
+    ลำดับการหา: routes[exchange][type] → routes[exchange]["*"] → routes["*"][type] → routes["*"]["*"]
+    ชื่อใน route เป็นได้ทั้งชื่อ family หรือชื่อชุดใน pattern_sets; ไม่มี routes เลย = ใช้ทุก family (None)
+    """
+
+    def __init__(self, routes: Dict[str, Dict[str, List[str]]] = None, pattern_sets: Dict[str, List[str]] = None):
+        self.routes = routes or {}
+        self.sets = pattern_sets or {}
+        self._cache: Dict[Tuple[str, str], Optional[frozenset]] = {}
+
+    def _expand(self, names: List[str]) -> frozenset:
+        out = set()
+        for n in names or []:
+            out.update(self.sets.get(n, [n]))
+        return frozenset(out)
+
+    def families(self, exchange: str, slip_type: str) -> Optional[frozenset]:
+        key = (exchange, slip_type)
+        if key not in self._cache:
+            found = None
+            for ex in (exchange, "*"):
+                by_type = self.routes.get(ex) or {}
+                for st in (slip_type, "*"):
+                    if st in by_type:
+                        found = self._expand(by_type[st])
+                        break
+                if found is not None:
+                    break
+            self._cache[key] = found
+        return self._cache[key]
+
+    def validate(self, known: Iterable[str]) -> None:
+        """ชื่อ family ที่ไม่มีอยู่จริงใน route = พิมพ์ผิด; raise ValueError ตอนโหลด ไม่ใช่ตอน parse"""
+        known = set(known)
+        for ex, by_type in self.routes.items():
+            for st, names in (by_type or {}).items():
+                bad = sorted(self._expand(names) - known)
+                if bad:
+                    raise ValueError(f"routes.{ex}.{st}: ไม่รู้จัก pattern {', '.join(bad)}")
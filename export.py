@@ -0,0 +1,195 @@
+"""ส่งออก trades / realized / positions จาก ledger เป็น CSV (gzip ได้) หรือ Parquet แบบ streaming
+
+อ่านจาก TradeStorage.iter_rows ทีละก้อน (CSV/SQLite/Sheets) แล้วเขียนต่อท้ายไฟล์ทันที —
+หน่วยความจำคงที่ไม่ว่า ledger จะมีพันแถวหรือสิบล้านแถว
+กรองตามช่วงวันที่ (ts_iso ของ trades/realized) และคู่เหรียญได้
+Parquet ต้องติดตั้ง pyarrow (ไม่บังคับ)
+
+    python export.py                                    # ทุกตาราง → exports/<ตาราง>.csv
+    python export.py --tables trades --since 2024-01-01 --until 2024-03-31 --pair BTC/USDT --gzip
+    python export.py --format parquet --out /tmp/ledger --user <chat_id>
+"""
+import os
+import csv
+import gzip
+import shutil
+import argparse
+import logging
+from datetime import date, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from storage import TradeStorage, TABLE_HEADERS, CFG
+
+logger = logging.getLogger("tradebot.export")
+
+TABLES = ("trades", "realized", "positions")
+FORMATS = ("csv", "parquet")
+# คอลัมน์ตัวเลข (Parquet เก็บเป็น float64, ที่เหลือเป็น string)
+NUMERIC = {"price", "qty", "fee", "gross_value", "position_qty", "avg_cost", "avg_cost_used", "sell_price",
+           "realized_pnl"}
+
+def _day_range(since: Optional[str], until: Optional[str]):
+    """YYYY-MM-DD หรือ YYYY-MM → (วันแรก, วันสุดท้าย) เป็นข้อความ YYYY-MM-DD (เทียบกับ ts_iso[:10] ได้ตรง ๆ)"""
+    def parse(s: Optional[str], end: bool) -> Optional[str]:
+        if not s:
+            return None
+        try:
+            if len(s) == 7:
+                d = date.fromisoformat(s + "-01")
+                if end:
+                    d = (d + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+            else:
+                d = date.fromisoformat(s)
+        except ValueError:
+            raise ValueError(f"วันที่ไม่ถูกต้อง: {s} (ใช้ YYYY-MM-DD หรือ YYYY-MM)")
+        return d.isoformat()
+    return parse(since, False), parse(until, True)
+
+def filtered(storage: TradeStorage, table: str, since: Optional[str] = None, until: Optional[str] = None,
+             pairs: Optional[Iterable[str]] = None, chunk_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+    """แถวของตารางทีละก้อนหลังกรอง (positions กรองแค่คู่เหรียญ — เป็นยอดคงเหลือ ไม่ใช่รายการตามเวลา)"""
+    lo, hi = _day_range(since, until)
+    if table == "positions":
+        lo = hi = None
+    want = {p.upper() for p in pairs} if pairs else None
+    for chunk in storage.iter_rows(table, chunk_size):
+        rows = [r for r in chunk
+                if (want is None or str(r.get("pair") or "").upper() in want)
+                and (lo is None or str(r.get("ts_iso") or "")[:10] >= lo)
+                and (hi is None or str(r.get("ts_iso") or "")[:10] <= hi)]
+        if rows:
+            yield rows
+
+def _cell(v):
+    return "" if v is None else v
+
+def _write_csv(chunks: Iterator[List[Dict[str, Any]]], headers: List[str], path: str, compress: bool) -> int:
+    n = 0
+    opener = gzip.open if compress else open
+    with opener(path, "wt", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(headers)
+        for rows in chunks:
+            w.writerows([_cell(r.get(h)) for h in headers] for r in rows)
+            n += len(rows)
+    return n
+
+def _num(v) -> Optional[float]:
+    if v is None or v == "":
+        return None
+    try:
+        return float(v)
+    except (TypeError, ValueError):
+        return None
+
+def _write_parquet(chunks: Iterator[List[Dict[str, Any]]], headers: List[str], path: str) -> int:
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("ส่งออก Parquet ต้องติดตั้ง pyarrow ก่อน (pip install pyarrow) หรือใช้ CSV")
+    schema = pa.schema([(h, pa.float64() if h in NUMERIC else pa.string()) for h in headers])
+    n = 0
+    # เขียนทีละ row group ต่อก้อน — ไม่ต้องถือทั้งตารางในหน่วยความจำ
+    with pq.ParquetWriter(path, schema, compression="zstd") as w:
+        for rows in chunks:
+            cols = [[_num(r.get(h)) for r in rows] if h in NUMERIC else
+                    [None if r.get(h) in (None, "") else str(r.get(h)) for r in rows] for h in headers]
+            w.write_table(pa.Table.from_arrays([pa.array(c, t.type) for c, t in zip(cols, schema)], schema=schema))
+            n += len(rows)
+    return n
+
+def gzip_file(path: str) -> str:
+    """บีบอัดไฟล์ที่เขียนเสร็จแล้วแบบ streaming (ใช้กับไฟล์ที่ใหญ่เกิน compress_mb) แล้วลบไฟล์เดิม"""
+    out = path + ".gz"
+    with open(path, "rb") as src, gzip.open(out, "wb") as dst:
+        shutil.copyfileobj(src, dst, 1 << 20)
+    os.remove(path)
+    return out
+
+def export_table(storage: TradeStorage, table: str, out_dir: str, fmt: str = "csv", compress: bool = False,
+                 since: Optional[str] = None, until: Optional[str] = None, pairs: Optional[Iterable[str]] = None,
+                 chunk_size: int = 10000, compress_over_mb: float = 0) -> Dict[str, Any]:
+    """เขียนตารางหนึ่งลง out_dir แล้วคืน {"table", "path", "rows", "bytes"}
+
+    compress_over_mb > 0: CSV ที่ใหญ่เกินนี้ถูก gzip ทีหลัง (ไฟล์เล็กเปิดใน Excel ได้เลย)
+    """
+    if table not in TABLES:
+        raise ValueError(f"ไม่รู้จักตาราง {table} (ใช้ {', '.join(TABLES)})")
+    if fmt not in FORMATS:
+        raise ValueError(f"ไม่รู้จักรูปแบบ {fmt} (ใช้ {', '.join(FORMATS)})")
+    os.makedirs(out_dir, exist_ok=True)
+    headers = TABLE_HEADERS[table]
+    chunks = filtered(storage, table, since, until, pairs, chunk_size)
+    if fmt == "parquet":
+        path = os.path.join(out_dir, f"{table}.parquet")
+        rows = _write_parquet(chunks, headers, path)
+    else:
+        path = os.path.join(out_dir, f"{table}.csv" + (".gz" if compress else ""))
+        rows = _write_csv(chunks, headers, path, compress)
+        if not compress and compress_over_mb and os.path.getsize(path) > compress_over_mb * 1024 * 1024:
+            path = gzip_file(path)
+    return {"table": table, "path": path, "rows": rows, "bytes": os.path.getsize(path)}
+
+def export(storage: TradeStorage, out_dir: str, tables: Iterable[str] = TABLES, fmt: str = "csv",
+           compress: bool = False, since: Optional[str] = None, until: Optional[str] = None,
+           pairs: Optional[Iterable[str]] = None, chunk_size: int = None,
+           compress_over_mb: float = None) -> List[Dict[str, Any]]:
+    ecfg = CFG.get("export") or {}
+    chunk_size = chunk_size or int(ecfg.get("chunk_rows", 10000))
+    if compress_over_mb is None:
+        compress_over_mb = float(ecfg.get("compress_mb", 0) or 0)
+    _day_range(since, until)   # ตรวจวันที่ก่อนเริ่มเขียนไฟล์
+    return [export_table(storage, t, out_dir, fmt, compress, since, until, pairs, chunk_size, compress_over_mb)
+            for t in tables]
+
+def parse_command(args: List[str]) -> Dict[str, Any]:
+    """อาร์กิวเมนต์ของ /export → kwargs ของ export()
+
+    /export [trades|realized|positions|all] [YYYY-MM|YYYY-MM-DD [ถึงวัน]] [คู่เหรียญ ...] [csv|parquet]
+    ใส่วันเดียว = เฉพาะวัน/เดือนนั้น, สองวัน = ช่วงตั้งแต่-ถึง (รวมทั้งสองวัน)
+    """
+    tables, dates, pairs, fmt = [], [], [], "csv"
+    for a in args:
+        low = a.lower()
+        if low in TABLES:
+            tables.append(low)
+        elif low == "all":
+            tables = list(TABLES)
+        elif low in FORMATS:
+            fmt = low
+        elif low[:1].isdigit():
+            dates.append(a)
+        else:
+            pairs.append(a.upper())
+    if len(dates) > 2:
+        raise ValueError("ใส่วันที่ได้ไม่เกินสองค่า (ตั้งแต่ ถึง)")
+    since = dates[0] if dates else None
+    until = dates[-1] if dates else None
+    _day_range(since, until)
+    return {"tables": tables or list(TABLES), "fmt": fmt, "since": since, "until": until, "pairs": pairs or None}
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="ส่งออก ledger เป็น CSV/Parquet")
+    ap.add_argument("--tables", default=",".join(TABLES), help="คั่นด้วย , (trades,realized,positions)")
+    ap.add_argument("--format", choices=FORMATS, default="csv")
+    ap.add_argument("--gzip", action="store_true", help="บีบอัด CSV เป็น .csv.gz")
+    ap.add_argument("--since", default=None, help="YYYY-MM-DD หรือ YYYY-MM (รวมวันนั้น)")
+    ap.add_argument("--until", default=None, help="YYYY-MM-DD หรือ YYYY-MM (รวมวันนั้น)")
+    ap.add_argument("--pair", action="append", default=None, help="กรองคู่เหรียญ (ใส่ซ้ำได้)")
+    ap.add_argument("--out", default="exports", help="โฟลเดอร์ปลายทาง")
+    ap.add_argument("--user", default=None, help="chat id ของ ledger ผู้ใช้ (ค่าเริ่มต้น: ledger รวมใน data/)")
+    args = ap.parse_args()
+    storage = TradeStorage(shard=args.user)
+    try:
+        for res in export(storage, args.out, [t.strip() for t in args.tables.split(",") if t.strip()],
+                          args.format, args.gzip, args.since, args.until, args.pair):
+            print(f"{res['table']}: {res['rows']} แถว → {res['path']} ({res['bytes'] / 1024:.1f} KB)")
+    except (ValueError, RuntimeError) as e:
+        ap.error(str(e))
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""นำเข้ารูปแคปหน้าจอทั้งโฟลเดอร์แบบออฟไลน์ (ไม่ผ่าน Telegram) โดยใช้ทุก core
+
+    python ingest.py <dir> [--workers N] [--chunk 32] [--dry-run] [--out results.jsonl]
+
+- ประมวลผลไฟล์ตามลำดับชื่อไฟล์ (decode → _preprocess → OCR → parse_from_text) ใน process pool
+  แล้วบันทึกลง TradeStorage/PnLEngine ตามลำดับเดิมทีละก้อน (หนึ่ง transaction ต่อก้อน)
+- checkpoint หลังแต่ละก้อน: รันซ้ำแล้วจะข้ามไฟล์ที่บันทึกไปแล้ว (ไฟล์ที่ error ไม่ถูก checkpoint จึงถูกลองใหม่)
+- --dry-run: ไม่บันทึก แค่พิมพ์ผลเป็น JSONL
+- ไฟล์ที่อ่าน/แยกข้อมูลไม่ได้จะถูกเขียนลงรายงาน error (JSONL)
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Iterator, Set
+
+from storage import DATA_DIR
+
+logger = logging.getLogger("tradebot.ingest")
+
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".webp", ".bmp", ".tif", ".tiff")
+
+def list_images(root: str) -> List[str]:
+    out = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            if name.lower().endswith(IMAGE_EXTS):
+                out.append(os.path.relpath(os.path.join(dirpath, name), root))
+    return sorted(out)
+
+def process_file(root: str, rel: str) -> Dict[str, Any]:
+    """ทำงานใน worker process — คืนผลเป็น dict ที่ pickle ได้เสมอ (ไม่โยน exception)"""
+    from ocr_engine import extract_text_timed
+    from parser_engine import parse_from_text, classify
+    t0 = time.perf_counter()
+    try:
+        with open(os.path.join(root, rel), "rb") as f:
+            data = f.read()
+        text, _, mem = extract_text_timed(data)
+        route = classify(text)
+        parsed = parse_from_text(text, route)
+        if parsed and parsed["kind"] == "trade":
+            parsed["data"]["exchange"] = route.exchange
+        return {"file": rel, "result": parsed, "text": text, "sec": time.perf_counter() - t0,
+                "peak_rss_mb": round(mem["peak_rss_mb"], 1)}
+    except Exception as e:
+        return {"file": rel, "error": f"{type(e).__name__}: {e}", "sec": time.perf_counter() - t0}
+
+def _process(args):
+    return process_file(*args)
+
+class Checkpoint:
+    """รายชื่อไฟล์ที่บันทึกแล้วต่อโฟลเดอร์ (เขียนแบบ atomic หลังแต่ละก้อน)"""
+
+    def __init__(self, path: str, root: str):
+        self.path = path
+        self.key = os.path.abspath(root)
+        self.all: Dict[str, List[str]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.all = json.load(f)
+        self.done = set(self.all.get(self.key, []))
+
+    def add(self, files: List[str]):
+        self.done.update(files)
+        self.all[self.key] = sorted(self.done)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.all, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+
+def iter_results(root: str, files: List[str], workers: int, chunk: int) -> Iterator[Dict[str, Any]]:
+    """ผลลัพธ์ตามลำดับไฟล์เดิม (executor.map รักษาลำดับ แต่ยังรันขนานเต็มทุก worker)"""
+    from ocr_engine import init_worker
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker) as ex:
+        yield from ex.map(_process, [(root, f) for f in files], chunksize=max(1, chunk // workers))
+
+def _trade_from_result(res: Dict[str, Any]) -> Dict[str, Any]:
+    trade = dict(res["result"]["data"])
+    trade["src_image_id"] = res["file"]
+    # ใช้เวลาบนสลิปถ้ามี เพื่อให้ลำดับเวลาใน ledger สะท้อนเวลาเทรดจริง
+    trade["ts_iso"] = (trade.get("time") or "").replace(" ", "T") or datetime.now(timezone.utc).isoformat()
+    trade["note"] = "ingest"
+    return trade
+
+def ingest(root: str, workers: int = 0, chunk: int = 32, dry_run: bool = False, out=None,
+           errors_path: str = None, checkpoint_path: str = None, user: str = None) -> Dict[str, Any]:
+    workers = workers or os.cpu_count() or 1
+    errors_path = errors_path or os.path.join(DATA_DIR, "ingest_errors.jsonl")
+    checkpoint_path = checkpoint_path or os.path.join(DATA_DIR, "ingest_checkpoint.json")
+
+    files = list_images(root)
+    ckpt = None if dry_run else Checkpoint(checkpoint_path, root)
+    if ckpt:
+        files = [f for f in files if f not in ckpt.done]
+    logger.info("พบ %d ไฟล์ที่ต้องประมวลผล (workers=%d)", len(files), workers)
+
+    pnl = None
+    if not dry_run:
+        from storage import TradeStorage
+        from pnl import PnLEngine
+        pnl = PnLEngine(TradeStorage(shard=user))
+
+    from pnl import missing_fields
+    stats = {"files": 0, "trades": 0, "wallets": 0, "errors": 0, "max_peak_rss_mb": 0.0}
+    t0 = time.perf_counter()
+    err_f = open(errors_path, "a", encoding="utf-8")
+
+    failed: Set[str] = set()   # ไฟล์ที่อ่าน/แยกข้อมูลไม่ได้ในก้อนปัจจุบัน
+
+    def report_error(rel: str, msg: str):
+        stats["errors"] += 1
+        failed.add(rel)
+        err_f.write(json.dumps({"file": rel, "error": msg}, ensure_ascii=False) + "\n")
+
+    def apply(batch: List[Dict[str, Any]]):
+        if dry_run:
+            return
+        trades = [_trade_from_result(r) for r in batch
+                  if r["file"] not in failed and r["result"] and r["result"]["kind"] == "trade"]
+        # หนึ่ง transaction ต่อก้อน: อ่าน position ครั้งเดียวต่อคู่ และเขียน trades / realized เป็นชุดเดียว
+        pnl.record_trades(trades)
+        ckpt.add([r["file"] for r in batch if r["file"] not in failed])
+        failed.clear()
+
+    batch: List[Dict[str, Any]] = []
+    try:
+        for res in iter_results(root, files, workers, chunk):
+            stats["files"] += 1
+            stats["max_peak_rss_mb"] = max(stats["max_peak_rss_mb"], res.get("peak_rss_mb", 0.0))
+            if res.get("error"):
+                report_error(res["file"], res["error"])
+            elif not res["result"]:
+                report_error(res["file"], "ไม่พบข้อมูล trade/wallet ในข้อความ OCR")
+            elif res["result"]["kind"] == "wallet":
+                stats["wallets"] += 1
+            else:
+                missing = missing_fields(res["result"]["data"])
+                if missing:
+                    report_error(res["file"], f"ข้อมูลไม่พอ: {', '.join(missing)}")
+                    res = {**res, "result": None}
+                else:
+                    stats["trades"] += 1
+            if out is not None:
+                out.write(json.dumps({k: v for k, v in res.items() if k != "text"}, ensure_ascii=False) + "\n")
+            batch.append(res)
+            if len(batch) >= chunk:
+                apply(batch)
+                batch = []
+                rate = stats["files"] / (time.perf_counter() - t0)
+                logger.info("%d/%d ไฟล์ (%.2f images/sec)", stats["files"], len(files), rate)
+        if batch:
+            apply(batch)
+    finally:
+        err_f.close()
+        if pnl:
+            pnl.storage.close()
+
+    elapsed = time.perf_counter() - t0
+    stats["seconds"] = round(elapsed, 3)
+    stats["images_per_sec"] = round(stats["files"] / elapsed, 3) if elapsed > 0 else 0.0
+    return stats
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="นำเข้ารูปแคปหน้าจอทั้งโฟลเดอร์")
+    ap.add_argument("dir")
+    ap.add_argument("--workers", type=int, default=0, help="0 = เท่าจำนวน core")
+    ap.add_argument("--chunk", type=int, default=32, help="จำนวนไฟล์ต่อการบันทึกหนึ่งครั้ง/checkpoint")
+    ap.add_argument("--dry-run", action="store_true", help="ไม่บันทึก แค่พิมพ์ผลเป็น JSONL")
+    ap.add_argument("--out", default=None, help="เขียนผล JSONL ลงไฟล์ (dry-run ค่าเริ่มต้นคือ stdout)")
+    ap.add_argument("--errors", default=None, help="ไฟล์รายงาน error (ค่าเริ่มต้น data/ingest_errors.jsonl)")
+    ap.add_argument("--checkpoint", default=None, help="ไฟล์ checkpoint (ค่าเริ่มต้น data/ingest_checkpoint.json)")
+    ap.add_argument("--user", default=None, help="chat id ของ ledger ผู้ใช้ที่จะบันทึกลง (ค่าเริ่มต้น: ledger รวมใน data/)")
+    args = ap.parse_args()
+
+    out = None
+    if args.out:
+        out = open(args.out, "w", encoding="utf-8")
+    elif args.dry_run:
+        out = sys.stdout
+    try:
+        stats = ingest(args.dir, args.workers, args.chunk, args.dry_run, out, args.errors, args.checkpoint, args.user)
+    finally:
+        if out is not None and out is not sys.stdout:
+            out.close()
+    print(json.dumps(stats, ensure_ascii=False), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,380 @@
+"""journal แบบ append-only ของดีลที่ยืนยันแล้ว — ตอบผู้ใช้ได้ทันทีที่ลงดิสก์ แล้วค่อยลง ledger เบื้องหลัง
+
+หนึ่งบรรทัด (JSONL) ต่อหนึ่งครั้งที่ยืนยัน: {"seq": 12, "ts": "...", "trades": [...]}
+
+- group commit: entry ที่เข้ามาระหว่างรอ fsync จะถูกเขียนรวมกันแล้ว fsync ครั้งเดียว
+  append() คืนเมื่อ entry ลงดิสก์แล้วเท่านั้น
+- applier แยกตาม shard (ledger ของผู้ใช้): แต่ละ shard มีคิวและ task ของตัวเอง หยิบ entry ตามลำดับ
+  ชุดละไม่เกิน max_apply_batch — shard ที่ storage ล่มรอ/ลองใหม่อยู่คนเดียว shard อื่นลงต่อได้ตามปกติ
+  task ของ shard จบเองเมื่อคิวว่าง (ไม่ค้าง task ไว้ทุกผู้ใช้)
+- error ที่ลองใหม่ได้ (transient(e) เป็นจริง เช่นดิสก์/เครือข่าย) รอแบบ backoff แล้วลองใหม่; error อื่นลองใหม่ก็ไม่ผ่าน
+  จึงลงทีละ entry เพื่อหาตัวที่เสีย แล้วข้าม entry นั้น (future ได้ ApplyFailed) — entry หลังจากนั้นไม่ค้าง
+- <path>.offset เก็บ seq/offset ของ entry แรกที่ยังไม่ลง (ทุก entry ก่อนหน้านั้นลงครบแล้ว)
+  และ seq ล่าสุดที่ลงแล้วของ shard ที่ลงล้ำหน้าจุดนั้นไป
+- เริ่มโปรแกรมใหม่: อ่านต่อจาก offset แล้วลง entry ที่ seq มากกว่าทั้งสองค่า (ชุดแรกส่งแบบ recovering=True
+  เพราะอาจลงไปแล้วบางส่วนก่อนโปรแกรมหยุด)
+- compact: เมื่อส่วนก่อน entry แรกที่ยังไม่ลงใหญ่เกิน compact_bytes จะเขียนไฟล์ใหม่ให้เหลือตั้งแต่ entry นั้น
+"""
+import os
+import json
+import asyncio
+import logging
+import threading
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger("tradebot.journal")
+
+def _key(shard: Optional[str]) -> str:
+    # key ของ shard ในไฟล์ offset (JSON key ต้องเป็นข้อความ)
+    return "" if shard is None else str(shard)
+
+_ALL = object()   # drain() ที่ไม่ระบุ shard = รอทุก shard
+
+class ApplyFailed(Exception):
+    """ลง entry นี้ไม่ได้และจะไม่ลองใหม่ (ข้ามไปแล้ว) — ข้อความคือสาเหตุ"""
+
+class _Entry:
+    __slots__ = ("seq", "shard", "trades", "start", "end", "applied")
+
+    def __init__(self, seq: int, shard: Optional[str], trades: List[Dict[str, Any]], start: int, end: int,
+                 applied: Optional[asyncio.Future]):
+        self.seq = seq
+        self.shard = shard
+        self.trades = trades
+        self.start = start        # offset (นับจากต้น journal ตั้งแต่สร้าง ไม่รีเซ็ตตอน compact) ของ entry นี้
+        self.end = end            # offset หลัง entry นี้
+        self.applied = applied    # future ของข้อความผลลัพธ์; None = entry ที่กู้มาตอนเริ่มโปรแกรม
+
+class TradeJournal:
+    def __init__(self, path: str = "data/journal.jsonl", commit_window_ms: float = 2.0,
+                 max_apply_batch: int = 64, compact_bytes: int = 8 * 1024 * 1024, fsync: bool = True,
+                 transient: Optional[Callable[[BaseException], bool]] = None):
+        self.path = path
+        self.offset_path = path + ".offset"
+        self.window = commit_window_ms / 1000.0
+        self.max_apply_batch = max(1, max_apply_batch)
+        self.compact_bytes = compact_bytes
+        self.fsync = fsync
+        self.transient = transient or (lambda e: isinstance(e, OSError))
+        self._lock = threading.Lock()       # กันเขียนกับ compact ชนกัน (ทั้งคู่ทำใน thread ของ executor)
+        self._file = None
+        self._base = 0            # offset ของไบต์แรกในไฟล์ปัจจุบัน (เพิ่มขึ้นทุกครั้งที่ compact)
+        self._size = 0            # offset หลังไบต์สุดท้ายที่เขียนแล้ว
+        self._seq = 0             # seq ล่าสุดที่ออกให้
+        self._applied = 0         # offset ของ entry แรกที่ยังไม่ลง storage (ก่อนหน้านี้ลงครบแล้ว)
+        self._applied_seq = 0     # seq ก่อน entry นั้น
+        self._end = 0             # offset/seq หลัง entry สุดท้ายที่ส่งให้ applier แล้ว
+        self._end_seq = 0
+        self._shard_seq: Dict[str, int] = {}       # seq ล่าสุดที่ลงแล้วต่อ shard (เฉพาะที่ล้ำหน้า _applied_seq)
+        self._recover_until = 0   # entry ที่ seq ไม่เกินนี้มาจากการกู้ตอนเริ่มโปรแกรม
+        self._pending: List[tuple] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._apply = None
+        self._unapplied: Dict[int, _Entry] = {}    # seq → entry ที่ส่งให้ applier แล้วแต่ยังไม่ลง (เรียงตาม seq)
+        self._queues: Dict[Optional[str], List[_Entry]] = {}
+        self._appliers: Dict[Optional[str], asyncio.Task] = {}
+        self._idle: Optional[asyncio.Event] = None
+        self._save_lock: Optional[asyncio.Lock] = None
+        self.commits = 0          # จำนวนครั้งที่ fsync (entry ต่อ commit = seq / commits)
+
+    @classmethod
+    def from_config(cls, cfg: dict, transient: Optional[Callable[[BaseException], bool]] = None
+                    ) -> Optional["TradeJournal"]:
+        c = cfg.get("journal") or {}
+        if not c.get("enabled", True):
+            return None
+        return cls(path=c.get("path", "data/journal.jsonl"),
+                   commit_window_ms=float(c.get("commit_window_ms", 2)),
+                   max_apply_batch=int(c.get("max_apply_batch", 64)),
+                   compact_bytes=int(float(c.get("compact_mb", 8)) * 1024 * 1024),
+                   fsync=bool(c.get("fsync", True)), transient=transient)
+
+    @property
+    def backlog(self) -> int:
+        """จำนวน entry ที่ยังไม่ลง storage (รวมที่รอ fsync)"""
+        return len(self._pending) + len(self._unapplied)
+
+    # ---------- ไฟล์ (ทำใน thread) ----------
+
+    def _read_offset(self) -> Dict[str, int]:
+        try:
+            with open(self.offset_path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except Exception:
+            logger.exception("อ่าน %s ไม่ได้ จะอ่าน journal ตั้งแต่ต้น", self.offset_path)
+            return {}
+
+    def _offset_state(self) -> Dict[str, Any]:
+        """สถานะที่จะบันทึก (สร้างใน event loop — ข้อมูลเหล่านี้ถูกแก้ใน loop เท่านั้น)"""
+        self._shard_seq = {k: v for k, v in self._shard_seq.items() if v > self._applied_seq}
+        return {"seq": self._applied_seq, "applied": self._applied, "shards": dict(self._shard_seq)}
+
+    def _save_offset(self, state: Dict[str, Any]) -> None:
+        tmp = self.offset_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"seq": state["seq"], "offset": state["applied"] - self._base, "base": self._base,
+                       "shards": state["shards"]}, f)
+            if self.fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, self.offset_path)
+
+    def _fsync_dir(self) -> None:
+        if not self.fsync:
+            return
+        fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _open(self) -> List[_Entry]:
+        """เปิด journal แล้วคืน entry ที่ยังไม่ได้ลง storage; ตัดบรรทัดท้ายที่เขียนไม่จบ (ยังไม่เคยตอบผู้ใช้) ทิ้ง"""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        state = self._read_offset()
+        self._applied_seq = self._seq = int(state.get("seq", 0))
+        self._base = int(state.get("base", 0))
+        self._shard_seq = {k: int(v) for k, v in (state.get("shards") or {}).items()}
+        start = int(state.get("offset", 0))
+        entries: List[_Entry] = []
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if start > size:
+            start = 0
+        with open(self.path, "a+b") as f:
+            f.seek(start)
+            pos = start
+            for line in f:
+                if not line.endswith(b"\n"):
+                    logger.warning("ตัดบรรทัดท้าย journal ที่เขียนไม่จบ (%d bytes)", len(line))
+                    f.truncate(pos)
+                    break
+                pos += len(line)
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    logger.error("ข้ามบรรทัดที่อ่านไม่ได้ใน journal ที่ offset %d", pos - len(line))
+                    continue
+                seq = int(rec["seq"])
+                self._seq = max(self._seq, seq)
+                shard = rec.get("shard")
+                if seq > self._applied_seq and seq > self._shard_seq.get(_key(shard), 0):
+                    entries.append(_Entry(seq, shard, rec["trades"], self._base + pos - len(line),
+                                          self._base + pos, None))
+            size = pos
+        self._applied = self._base + start
+        self._end = self._size = self._base + size
+        self._end_seq = self._seq
+        self._file = open(self.path, "ab")
+        self._fsync_dir()
+        return entries
+
+    def _write(self, lines: List[bytes]) -> int:
+        """เขียนหลายบรรทัดแล้ว fsync ครั้งเดียว; คืน offset ก่อนบรรทัดแรก"""
+        with self._lock:
+            start = self._size
+            try:
+                self._file.write(b"".join(lines))
+                self._file.flush()
+                if self.fsync:
+                    os.fsync(self._file.fileno())
+            except Exception:
+                # ไม่ให้เศษที่เขียนไม่ครบค้างกลางไฟล์ (entry เหล่านี้ไม่ถือว่าลงดิสก์)
+                try:
+                    self._file.truncate(start - self._base)
+                except OSError:
+                    pass
+                raise
+            self._size = start + sum(len(l) for l in lines)
+            return start
+
+    def _compact(self, state: Dict[str, Any]) -> None:
+        with self._lock:
+            keep = state["applied"] - self._base
+            if keep < self.compact_bytes:
+                return
+            self._file.close()
+            with open(self.path, "rb") as f:
+                f.seek(keep)
+                tail = f.read()
+            tmp = self.path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(tail)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            # บันทึก offset 0 ของไฟล์ใหม่ก่อนสลับ: ถ้าหยุดก่อน replace จะอ่านไฟล์เดิมจากต้นแล้วกรองด้วย seq
+            self._base = state["applied"]
+            self._save_offset(state)
+            os.replace(tmp, self.path)
+            self._fsync_dir()
+            self._file = open(self.path, "ab")
+            logger.info("compact journal: ตัด %d bytes เหลือ %d bytes", keep, len(tail))
+
+    # ---------- async API ----------
+
+    async def start(self, apply: Callable[[Optional[str], List[Dict[str, Any]], bool], Awaitable[List[str]]]) -> int:
+        """เปิด journal และเริ่มลง entry ที่ค้าง; coroutine apply(shard, trades, recovering) ลง ledger ของ shard นั้น
+        แล้วคืนข้อความต่อดีล — คืนจำนวน entry ที่กู้มาจากรอบก่อน"""
+        loop = asyncio.get_running_loop()
+        recovered = await loop.run_in_executor(None, self._open)
+        self._apply = apply
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._save_lock = asyncio.Lock()
+        self._recover_until = recovered[-1].seq if recovered else 0
+        if recovered:
+            logger.warning("กู้ %d entry จาก journal ที่ยังไม่ได้ลง storage", len(recovered))
+        for e in recovered:
+            self._dispatch(e)
+        return len(recovered)
+
+    async def append(self, trades: List[Dict[str, Any]], shard: Optional[str] = None) -> asyncio.Future:
+        """เขียนดีลของ shard หนึ่งลง journal; คืนเมื่อ fsync แล้ว เป็น future ของข้อความผลลัพธ์
+        (ได้เมื่อ applier ลง ledger แล้ว) — raise OSError ถ้าเขียนดิสก์ไม่ได้ (ถือว่ายังไม่ได้บันทึก)"""
+        loop = asyncio.get_running_loop()
+        self._seq += 1
+        rec = {"seq": self._seq, "ts": datetime.now(timezone.utc).isoformat(), "shard": shard, "trades": trades}
+        line = (json.dumps(rec, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+        durable, applied = loop.create_future(), loop.create_future()
+        self._pending.append((self._seq, shard, trades, line, durable, applied))
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+        await durable
+        return applied
+
+    async def _flush_loop(self) -> None:
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            if self.window:
+                await asyncio.sleep(self.window)
+            batch, self._pending = self._pending, []
+            try:
+                with metrics.timed("journal.fsync"):
+                    pos = await loop.run_in_executor(None, self._write, [b[3] for b in batch])
+            except Exception as e:
+                logger.exception("เขียน journal ไม่สำเร็จ")
+                for *_, durable, _ in batch:
+                    durable.set_exception(e if isinstance(e, OSError) else OSError(str(e)))
+                continue
+            self.commits += 1
+            metrics.get().record_max("journal_group_size", len(batch))
+            for seq, shard, trades, line, durable, applied in batch:
+                self._dispatch(_Entry(seq, shard, trades, pos, pos + len(line), applied))
+                pos += len(line)
+                durable.set_result(None)
+
+    def _dispatch(self, e: _Entry) -> None:
+        """ส่ง entry เข้าคิวของ shard (เริ่ม applier ของ shard ถ้ายังไม่มี)"""
+        self._unapplied[e.seq] = e
+        self._end, self._end_seq = e.end, e.seq
+        self._idle.clear()
+        queue = self._queues.get(e.shard)
+        if queue is None:
+            queue = self._queues[e.shard] = []
+            self._appliers[e.shard] = asyncio.create_task(self._apply_loop(e.shard, queue))
+        queue.append(e)
+
+    async def _apply_retry(self, shard: Optional[str], trades: List[Dict[str, Any]], recovering: bool) -> List[str]:
+        delay = 1.0
+        while True:
+            try:
+                with metrics.timed("journal.apply"):
+                    return await self._apply(shard, trades, recovering)
+            except Exception as e:
+                if not self.transient(e):
+                    raise
+                # storage ของ shard นี้ล่ม (เช่น Sheets ต่อไม่ได้): รอแล้วลองใหม่ — รอบต่อไปอาจลงไปแล้วบางส่วน
+                logger.exception("ลง ledger %s จาก journal ไม่สำเร็จ จะลองใหม่ใน %.0f วินาที", shard, delay)
+                metrics.get().error("journal.apply")
+                recovering = True
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 60.0)
+
+    async def _apply_shard(self, shard: Optional[str], entries: List[_Entry], recovering: bool = False) -> None:
+        trades = [t for e in entries for t in e.trades]
+        recovering = recovering or entries[0].seq <= self._recover_until
+        try:
+            msgs = await self._apply_retry(shard, trades, recovering)
+        except Exception as err:
+            if len(entries) > 1:
+                # ไม่รู้ว่า entry ไหนเสีย: ลงทีละ entry (ชุดนี้อาจลงไปแล้วบางส่วน จึงลงแบบ recovering)
+                for e in entries:
+                    await self._apply_shard(shard, [e], recovering=True)
+                return
+            self._fail(entries[0], err)
+            return
+        i = 0
+        for e in entries:
+            n = len(e.trades)
+            if e.applied is not None and not e.applied.done():
+                e.applied.set_result(msgs[i:i + n])
+            i += n
+
+    def _fail(self, e: _Entry, err: BaseException) -> None:
+        """ข้าม entry ที่ลงไม่ได้ถาวร (offset เลื่อนผ่านไปตามปกติ) — เก็บดีลไว้ใน log ให้แก้มือได้"""
+        logger.error("ข้าม entry seq %d ของ ledger %s ที่ลงไม่ได้ (%s: %s): %s", e.seq, e.shard,
+                     type(err).__name__, err, json.dumps(e.trades, ensure_ascii=False, default=str),
+                     exc_info=err)
+        metrics.get().error("journal.failed")
+        if e.applied is not None and not e.applied.done():
+            e.applied.set_exception(ApplyFailed(str(err) or type(err).__name__))
+
+    async def _apply_loop(self, shard: Optional[str], queue: List[_Entry]) -> None:
+        try:
+            while queue:
+                batch = queue[:self.max_apply_batch]
+                del queue[:len(batch)]
+                await self._apply_shard(shard, batch)
+                self._shard_seq[_key(shard)] = batch[-1].seq
+                for e in batch:
+                    del self._unapplied[e.seq]
+                await self._checkpoint()
+        finally:
+            # คิวว่างแล้ว (ไม่มี await ระหว่างเช็คกับลบ — _dispatch จะสร้าง task ใหม่ให้ entry ถัดไป)
+            self._queues.pop(shard, None)
+            self._appliers.pop(shard, None)
+            if not self._unapplied:
+                self._idle.set()
+
+    async def _checkpoint(self) -> None:
+        """เลื่อนจุดที่ลงครบแล้วไปที่ entry แรกที่ยังไม่ลง แล้วบันทึก offset (compact ถ้าถึงเกณฑ์)"""
+        loop = asyncio.get_running_loop()
+        async with self._save_lock:
+            first = next(iter(self._unapplied.values()), None)
+            if first is None:
+                self._applied, self._applied_seq = self._end, self._end_seq
+            else:
+                self._applied, self._applied_seq = first.start, first.seq - 1
+            state = self._offset_state()
+            try:
+                await loop.run_in_executor(None, self._save_offset, state)
+                if state["applied"] - self._base >= self.compact_bytes:
+                    await loop.run_in_executor(None, self._compact, state)
+            except Exception:
+                logger.exception("บันทึก offset ของ journal ไม่สำเร็จ")
+
+    async def drain(self, shard: Optional[str] = _ALL) -> None:
+        """รอจน entry ที่ append แล้วลง storage ครบ — ระบุ shard = รอเฉพาะของ shard นั้น
+        (เช่น /report ของผู้ใช้หนึ่งไม่ต้องรอ shard อื่นที่กำลังรอ storage กลับมา)"""
+        while self._flusher is not None and not self._flusher.done():
+            await self._flusher
+        if shard is _ALL:
+            while self._unapplied:
+                await self._idle.wait()
+            return
+        # task ของ shard จบเมื่อคิวของ shard ว่าง; รอแบบ wait (ผู้รอถูกยกเลิกแล้ว task ไม่ถูกยกเลิกตาม)
+        while shard in self._appliers:
+            await asyncio.wait([self._appliers[shard]])
+
+    async def close(self) -> None:
+        if self._apply is None:
+            return
+        await self.drain()
+        self._apply = None
+        with self._lock:
+            self._file.close()
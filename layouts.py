@@ -0,0 +1,456 @@
+"""แม่แบบ layout ของสลิป: ตำแหน่งช่องค่า (pair/side/price/qty/fee/time) ของหน้าจอที่รู้จัก
+
+ถ้ารูปใหม่ตรงกับแม่แบบ ocr_engine จะ OCR เฉพาะกล่องเล็ก ๆ เหล่านั้น (ช่องตัวเลขอ่านแบบ whitelist ตัวเลข)
+แทนการอ่านทั้งหน้าแล้วไล่ regex — ไม่ตรงแม่แบบไหนก็กลับไปใช้ทางเดิม (cascade)
+
+พิกัดทั้งหมดเป็นสัดส่วนของความกว้าง/สูงของภาพ [x0, y0, x1, y1] (0..1)
+แม่แบบมาได้สองทาง: ประกาศใน layouts.yaml หรือเรียนรู้จากสลิปที่ผู้ใช้ยืนยันแล้ว (เก็บเป็น JSON ใน learned_dir)
+
+    python layouts.py list
+    python layouts.py learn slip.png --trade '{"pair": "BTC/USDT", "side": "BUY", "price": 64850.2, "qty": 0.01}'
+    python layouts.py test slip.png
+"""
+import os
+import re
+import json
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import yaml
+
+from utils import config_path, LazyModule
+
+fuzz = LazyModule("rapidfuzz.fuzz")
+
+logger = logging.getLogger("tradebot.layouts")
+
+# ชื่อช่อง → ชนิดค่า; ช่อง number/time อ่านรวมกันด้วย whitelist ตัวเลข (DIGITS) ส่วนที่เหลืออ่านรวมกับ anchor
+FIELD_TYPES = {
+    "pair": "pair", "side": "side", "base": "asset", "quote": "asset", "fee_asset": "asset",
+    "price": "number", "qty": "number", "fee": "number", "total": "number", "time": "time",
+}
+DIGITS = "0123456789.,:-+ "
+_NUMERIC = ("number", "time")
+
+_NUM = re.compile(r"[+-]?\d[\d,]*(?:\.\d+)?")
+# ตัวเลขที่สลิปแสดงจริง: คั่นหลักพันครบทุกกลุ่ม หรือไม่คั่นเลย (อ่านได้ "1,23.4" = OCR พลาด)
+_WELL_FORMED = re.compile(r"\d{1,3}(?:,\d{3})+(?:\.\d+)?|\d+(?:\.\d+)?")
+_TIME = re.compile(r"(\d{4}-\d{2}-\d{2})\s*(\d{2}:\d{2}:\d{2})")
+_PAIR = re.compile(r"[A-Z0-9]{2,10}/[A-Z0-9]{2,10}")
+_ASSET = re.compile(r"[A-Z][A-Z0-9]{1,9}")
+_SIDES = {"buy": "BUY", "ซื้อ": "BUY", "sell": "SELL", "ขาย": "SELL"}
+_LABEL = re.compile(r"[^\W\d_]{3,}")
+
+Box = List[float]
+
+def _side(text: str) -> Optional[str]:
+    for word in text.lower().split():
+        side = _SIDES.get(word.strip(".,:()"))
+        if side:
+            return side
+    return None
+
+def read_value(kind: str, raw: str) -> Optional[str]:
+    """ตีความข้อความที่อ่านได้จากกล่องหนึ่งตามชนิดของช่อง; คืน None ถ้าอ่านไม่ได้"""
+    raw = (raw or "").strip()
+    if kind == "number":
+        m = _NUM.search(raw.replace(" ", ""))
+        return m.group(0).lstrip("+") if m else None
+    if kind == "time":
+        m = _TIME.search(raw)
+        return f"{m.group(1)} {m.group(2)}" if m else None
+    if kind == "pair":
+        m = _PAIR.search(raw.upper().replace(" ", ""))
+        return m.group(0) if m else None
+    if kind == "asset":
+        m = _ASSET.search(raw.upper().strip("()"))
+        return m.group(0) if m else None
+    if kind == "side":
+        return _side(raw)
+    return raw or None
+
+class Template:
+    def __init__(self, name: str, fields: Dict[str, Dict[str, Any]], anchors: List[Dict[str, Any]] = None,
+                 aspect: Optional[float] = None, exchange: str = "unknown", slip_type: str = "spot",
+                 const: Dict[str, Any] = None, rows: List[float] = None, lang: str = "eng", source: str = "yaml"):
+        self.name = name
+        self.fields = {k: {"type": FIELD_TYPES.get(k, "text"), **v} for k, v in (fields or {}).items()}
+        self.anchors = anchors or []
+        self.aspect = aspect
+        self.exchange = exchange
+        self.slip_type = slip_type
+        self.const = const or {}
+        self.rows = rows or []
+        self.lang = lang
+        self.source = source
+
+    @classmethod
+    def from_dict(cls, d: Dict[str, Any], source: str = "yaml") -> "Template":
+        return cls(d["name"], d.get("fields") or {}, d.get("anchors"), d.get("aspect"),
+                   d.get("exchange", "unknown"), d.get("slip_type", "spot"), d.get("const"),
+                   d.get("rows"), d.get("lang", "eng"), source)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "exchange": self.exchange, "slip_type": self.slip_type,
+                "aspect": self.aspect, "lang": self.lang, "rows": self.rows, "anchors": self.anchors,
+                "fields": {k: {"box": v["box"]} for k, v in self.fields.items()}, "const": self.const}
+
+    def text_fields(self) -> List[str]:
+        return [k for k, v in self.fields.items() if v["type"] not in _NUMERIC]
+
+    def digit_fields(self) -> List[str]:
+        return [k for k, v in self.fields.items() if v["type"] in _NUMERIC]
+
+    def boxes(self) -> List[Box]:
+        return [a["box"] for a in self.anchors] + [f["box"] for f in self.fields.values()]
+
+    def anchors_ok(self, texts: List[str], min_score: float) -> bool:
+        for anchor, text in zip(self.anchors, texts):
+            if fuzz.ratio(anchor["text"].lower(), (text or "").lower()) < min_score:
+                return False
+        return True
+
+    def values(self, raw: Dict[str, str]) -> Dict[str, str]:
+        out = {k: v for k, v in self.const.items() if v is not None}
+        for name, text in raw.items():
+            v = read_value(self.fields[name]["type"], text)
+            if v is not None:
+                out[name] = v
+        if "pair" not in out and out.get("base") and out.get("quote"):
+            out["pair"] = f"{out['base']}/{out['quote']}"
+        return out
+
+    def implausible(self, v: Dict[str, str], quotes=(), total_tol: float = 0.005) -> Optional[str]:
+        """ตรวจว่าค่าที่อ่านด้วยแม่แบบเป็นไปได้ก่อนเชื่อ (กล่องเล็กอ่านพลาดแล้วไม่มีบริบทให้ parser จับผิด)
+        คืนเหตุผลถ้าไม่ผ่าน หรือ None ถ้าใช้ได้
+
+        - ตัวเลขทุกช่องรูปแบบถูก และ price/qty มากกว่า 0
+        - เวลาเป็นวันเวลาที่มีจริง
+        - คู่เหรียญ base ≠ quote และ quote อยู่ใน quotes (ถ้ากำหนด)
+        - ถ้าแม่แบบมีช่อง total: price × qty ต้องใกล้ total (ต่างได้ไม่เกิน total_tol)
+        """
+        nums: Dict[str, float] = {}
+        for name in self.digit_fields():
+            if self.fields[name]["type"] != "number" or not v.get(name):
+                continue
+            raw = v[name].lstrip("-")
+            if not _WELL_FORMED.fullmatch(raw):
+                return f"{name} รูปแบบตัวเลขผิด ({v[name]})"
+            nums[name] = float(raw.replace(",", ""))
+        for name in ("price", "qty"):
+            if not nums.get(name):
+                return f"{name} ต้องมากกว่า 0"
+        if v.get("time"):
+            try:
+                datetime.strptime(v["time"], "%Y-%m-%d %H:%M:%S")
+            except ValueError:
+                return f"เวลาไม่มีจริง ({v['time']})"
+        base, _, quote = (v.get("pair") or "").partition("/")
+        if base == quote:
+            return f"คู่เหรียญผิด ({v.get('pair')})"
+        if quotes and quote not in quotes:
+            return f"ไม่รู้จัก quote {quote}"
+        if "total" in self.fields:
+            if "total" not in nums:
+                return "อ่านช่อง total ไม่ได้"
+            total = nums["total"]
+            if abs(nums["price"] * nums["qty"] - total) > total_tol * total + 0.01:
+                return f"price × qty ไม่ตรงกับ total ({nums['price']} × {nums['qty']} ≠ {total})"
+        return None
+
+    def to_text(self, v: Dict[str, str]) -> str:
+        """ข้อความรูปแบบมาตรฐานที่ parser อ่านได้แน่นอน — ส่งต่อเข้า parse ตามปกติเหมือนผล OCR ทั้งหน้า"""
+        lines = [self.exchange.title() if self.exchange != "unknown" else "",
+                 v.get("pair", ""), v.get("side", ""),
+                 f"Price {v['price']}" if v.get("price") else "",
+                 f"Qty {v['qty']}" if v.get("qty") else ""]
+        if v.get("fee"):
+            lines.append(f"Fee ({v['fee_asset']}) {v['fee']}" if v.get("fee_asset") else f"Fee {v['fee']}")
+        if v.get("time"):
+            lines.append(f"Time {v['time']}")
+        return "\n".join(l for l in lines if l) + "\n"
+
+    # ---------- จับคู่แบบไม่ต้อง OCR ----------
+
+    def structure_score(self, size: Tuple[int, int], rows: List[Tuple[int, int, int, int]], glyph: float,
+                        aspect_tol: float) -> float:
+        """0..1 จากรูปทรงภาพและแถวข้อความที่ _text_rows หาไว้แล้ว; 0 = ไม่ใช่ layout นี้แน่นอน"""
+        w, h = size
+        if self.aspect and abs(h / w - self.aspect) > aspect_tol * self.aspect:
+            return 0.0
+        centers = [((y0 + y1) / 2) / h for _, y0, _, y1 in rows]
+        tol = max(glyph, 1.0) * 0.6 / h
+        # ทุก anchor และทุกช่องต้องมีแถวข้อความอยู่ในกล่อง
+        for x0, y0, x1, y1 in self.boxes():
+            if not any(y0 - tol <= c <= y1 + tol for c in centers):
+                return 0.0
+        if not self.rows:
+            return 1.0
+        hit = sum(any(abs(r - c) <= tol for c in centers) for r in self.rows) / len(self.rows)
+        back = sum(any(abs(r - c) <= tol for r in self.rows) for c in centers) / max(len(centers), 1)
+        return min(hit, back)
+
+# ---------------- เรียนรู้จาก image_to_data ----------------
+
+def _as_float(text: str) -> Optional[float]:
+    m = _NUM.search(text.replace(" ", ""))
+    if not m:
+        return None
+    try:
+        return float(m.group(0).replace(",", "").lstrip("+"))
+    except ValueError:
+        return None
+
+def _same_number(a: Optional[float], b: float) -> bool:
+    return a is not None and abs(a - b) <= 1e-9 + 1e-6 * abs(b)
+
+def _union(words: List[Dict[str, Any]]) -> Tuple[float, float, float, float]:
+    return (min(w["x0"] for w in words), min(w["y0"] for w in words),
+            max(w["x1"] for w in words), max(w["y1"] for w in words))
+
+def learn(words: List[Dict[str, Any]], trade: Dict[str, Any], size: Tuple[int, int], glyph: float,
+          rows: List[Tuple[int, int, int, int]], exchange: str = "unknown", slip_type: str = "spot",
+          name: Optional[str] = None) -> Template:
+    """สร้างแม่แบบจากคำที่ OCR อ่านได้ (พิกัดบนภาพจริง + เลขแถว "line") ของสลิปที่ยืนยันค่าแล้ว
+
+    หาคำที่ตรงกับค่าจริงของแต่ละช่อง ขยายกล่องออกไปครึ่งทางถึงคำข้างเคียงในแถวเดียวกัน
+    (ค่าที่ยาวขึ้นในสลิปถัดไปยังอยู่ในกล่อง) และใช้ป้ายกำกับของแถว price/qty กับหัวเรื่องเป็น anchor
+    raise ValueError ถ้าหาช่องจำเป็น (pair, side, price, qty) ไม่เจอ
+    """
+    w, h = size
+    lines: Dict[int, List[Dict[str, Any]]] = {}
+    for wd in words:
+        lines.setdefault(wd["line"], []).append(wd)
+    for ws in lines.values():
+        ws.sort(key=lambda x: x["x0"])
+    used = set()
+    found: Dict[str, List[Dict[str, Any]]] = {}
+
+    def take(field, pick):
+        for ln in sorted(lines):
+            for i, wd in enumerate(lines[ln]):
+                if id(wd) not in used and pick(wd, ln, i):
+                    found[field] = [wd]
+                    used.add(id(wd))
+                    return wd
+        return None
+
+    # total = ยอดฝั่ง quote ที่สลิปแสดง (quote_amount) — ใช้ตรวจ price × qty ตอนอ่านด้วยแม่แบบ
+    for field, key in (("price", "price"), ("qty", "qty"), ("fee", "fee"), ("total", "quote_amount")):
+        if trade.get(key) not in (None, ""):
+            target = float(trade[key])
+            take(field, lambda wd, ln, i: _same_number(_as_float(wd["text"]), target))
+
+    t = trade.get("time")
+    if t:
+        day, _, clock = str(t).partition(" ")
+        for ln, ws in sorted(lines.items()):
+            for i in range(len(ws) - 1):
+                if ws[i]["text"].strip() == day and ws[i + 1]["text"].strip() == clock:
+                    found["time"] = [ws[i], ws[i + 1]]
+                    used.update((id(ws[i]), id(ws[i + 1])))
+                    break
+            if "time" in found:
+                break
+
+    pair = (trade.get("pair") or "").upper()
+    if not take("pair", lambda wd, ln, i: pair and pair in wd["text"].upper()) and "/" in pair:
+        # สลิปที่ไม่แสดงคู่เหรียญตรง ๆ (เช่น Convert): base อยู่ถัดจากจำนวน, quote อยู่ถัดจากราคา
+        base, quote = pair.split("/", 1)
+        for field, asset, near in (("base", base, "qty"), ("quote", quote, "price")):
+            anchor = found.get(near)
+            if anchor:
+                ln = anchor[0]["line"]
+                take(field, lambda wd, l, i, ln=ln, asset=asset, x=anchor[0]["x0"]:
+                     l == ln and wd["x0"] > x and wd["text"].upper().strip("()+") == asset)
+
+    side = trade.get("side")
+    const: Dict[str, Any] = {}
+    if not take("side", lambda wd, ln, i: _side(wd["text"]) == side):
+        if slip_type == "convert" and side:
+            const["side"] = side
+    fee_asset = (trade.get("fee_asset") or "").upper()
+    if fee_asset and "fee" in found:
+        ln = found["fee"][0]["line"]
+        take("fee_asset", lambda wd, l, i: l == ln and wd["text"].upper().strip("():") == fee_asset)
+
+    missing = [f for f in ("price", "qty") if f not in found]
+    if "pair" not in found and not ("base" in found and "quote" in found):
+        missing.append("pair")
+    if "side" not in found and "side" not in const:
+        missing.append("side")
+    if missing:
+        raise ValueError(f"หาตำแหน่งของ {', '.join(missing)} ในภาพไม่เจอ")
+
+    pad = glyph * 0.35
+
+    def field_box(group: List[Dict[str, Any]]) -> Box:
+        ws = lines[group[0]["line"]]
+        x0, y0, x1, y1 = _union(group)
+        _, ly0, _, ly1 = _union(ws)
+        ids = {id(g) for g in group}
+        left = [wd["x1"] for wd in ws if wd["x1"] <= x0 and id(wd) not in ids]
+        right = [wd["x0"] for wd in ws if wd["x0"] >= x1 and id(wd) not in ids]
+        bx0 = (max(left) + x0) / 2 if left else w * 0.01
+        bx1 = (min(right) + x1) / 2 if right else w * 0.99
+        return [round(bx0 / w, 4), round(max(0, ly0 - pad) / h, 4), round(bx1 / w, 4), round(min(h, ly1 + pad) / h, 4)]
+
+    fields = {k: {"box": field_box(v)} for k, v in found.items()}
+
+    anchors = []
+    anchor_lines = [found[f][0]["line"] for f in ("price", "qty")]
+    title = next((ln for ln in sorted(lines) if any(_LABEL.fullmatch(wd["text"]) and id(wd) not in used
+                                                   for wd in lines[ln])), None)
+    if title is not None and title not in anchor_lines:
+        anchor_lines.insert(0, title)
+    for ln in anchor_lines:
+        if ln == title:
+            label = [wd for wd in lines[ln] if id(wd) not in used and _LABEL.fullmatch(wd["text"].strip())]
+        else:
+            # แถวของช่อง: เอาเฉพาะป้ายช่วงต้นแถวก่อนถึงค่า (คำหลังค่ามักเป็นชื่อเหรียญที่เปลี่ยนไปทุกสลิป)
+            label = []
+            for wd in lines[ln]:
+                if id(wd) in used or not _LABEL.fullmatch(wd["text"].strip()):
+                    break
+                label.append(wd)
+        if not label:
+            continue
+        x0, y0, x1, y1 = _union(label)
+        anchors.append({"text": " ".join(wd["text"].strip() for wd in label),
+                        "box": [round(max(0, x0 - pad) / w, 4), round(max(0, y0 - pad) / h, 4),
+                                round(min(w, x1 + pad) / w, 4), round(min(h, y1 + pad) / h, 4)]})
+    if not anchors:
+        raise ValueError("ไม่พบข้อความกำกับที่ใช้เป็น anchor ได้")
+
+    lang = "eng" if all(a["text"].isascii() for a in anchors) else "tha+eng"
+    if name is None:
+        digest = hashlib.sha1(json.dumps([a["text"] for a in anchors] + [w, h]).encode()).hexdigest()[:8]
+        name = f"{exchange}-{slip_type}-{w}x{h}-{digest}"
+    return Template(name, fields, anchors, aspect=round(h / w, 4), exchange=exchange, slip_type=slip_type,
+                    const=const, rows=[round(((y0 + y1) / 2) / h, 4) for _, y0, _, y1 in rows],
+                    lang=lang, source="learned")
+
+# ---------------- รวมแม่แบบ ----------------
+
+class LayoutRegistry:
+    """แม่แบบจาก layouts.yaml + ที่เรียนรู้ไว้ใน learned_dir; โหลดใหม่เองเมื่อไฟล์เปลี่ยน (worker เห็นแม่แบบใหม่ทันที)"""
+
+    def __init__(self, path: str = "layouts.yaml", learned_dir: str = "data/layouts", max_candidates: int = 2,
+                 min_row_score: float = 0.8, anchor_score: float = 80.0, aspect_tol: float = 0.03,
+                 max_learned: int = 50, quotes=()):
+        self.path = path
+        self.learned_dir = learned_dir
+        self.max_candidates = max_candidates
+        self.min_row_score = min_row_score
+        self.anchor_score = anchor_score
+        self.aspect_tol = aspect_tol
+        self.max_learned = max_learned
+        self.quotes = frozenset(q.upper() for q in quotes)
+        self.templates: List[Template] = []
+        self._stamp = None
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> Optional["LayoutRegistry"]:
+        c = cfg.get("layouts") or {}
+        if not c.get("enabled", True):
+            return None
+        return cls(path=config_path(c.get("file", "layouts.yaml")), learned_dir=c.get("learned_dir", "data/layouts"),
+                   max_candidates=int(c.get("max_candidates", 2)), min_row_score=float(c.get("min_row_score", 0.8)),
+                   anchor_score=float(c.get("anchor_score", 80)), aspect_tol=float(c.get("aspect_tolerance", 0.03)),
+                   max_learned=int(c.get("max_learned", 50)), quotes=cfg.get("default_quote_assets") or ())
+
+    def _mtime(self, path: str) -> float:
+        try:
+            return os.stat(path).st_mtime
+        except OSError:
+            return 0.0
+
+    def refresh(self) -> "LayoutRegistry":
+        stamp = (self._mtime(self.path), self._mtime(self.learned_dir))
+        if stamp == self._stamp:
+            return self
+        templates = []
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                declared = (yaml.safe_load(f) or {}).get("templates") or []
+            templates += [Template.from_dict(d) for d in declared]
+        except FileNotFoundError:
+            pass
+        except Exception:
+            logger.exception("อ่าน %s ไม่สำเร็จ", self.path)
+        if os.path.isdir(self.learned_dir):
+            for name in sorted(os.listdir(self.learned_dir)):
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    with open(os.path.join(self.learned_dir, name), encoding="utf-8") as f:
+                        templates.append(Template.from_dict(json.load(f), source="learned"))
+                except Exception:
+                    logger.exception("อ่านแม่แบบ %s ไม่สำเร็จ", name)
+        self.templates = templates
+        self._stamp = stamp
+        return self
+
+    def candidates(self, size: Tuple[int, int], rows, glyph: float) -> List[Template]:
+        """แม่แบบที่รูปทรงและแถวข้อความเข้ากันได้ เรียงจากเข้ากันมากสุด (ไม่เกิน max_candidates)"""
+        if not rows:
+            return []
+        scored = []
+        for tpl in self.templates:
+            score = tpl.structure_score(size, rows, glyph, self.aspect_tol)
+            if score >= self.min_row_score:
+                scored.append((score, tpl))
+        scored.sort(key=lambda x: -x[0])
+        return [tpl for _, tpl in scored[:self.max_candidates]]
+
+    def save(self, tpl: Template) -> Optional[str]:
+        """เขียนแม่แบบที่เรียนรู้ลง learned_dir (เขียนไฟล์ชั่วคราวแล้ว rename); คืนพาธ หรือ None ถ้าเต็มโควตา"""
+        os.makedirs(self.learned_dir, exist_ok=True)
+        existing = [n for n in os.listdir(self.learned_dir) if n.endswith(".json")]
+        path = os.path.join(self.learned_dir, f"{tpl.name}.json")
+        if len(existing) >= self.max_learned and os.path.basename(path) not in existing:
+            logger.warning("แม่แบบที่เรียนรู้ครบ %d อันแล้ว ไม่บันทึก %s", self.max_learned, tpl.name)
+            return None
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(tpl.to_dict(), f, ensure_ascii=False, indent=1)
+        os.replace(tmp, path)
+        self._stamp = None
+        return path
+
+# ---------------- CLI ----------------
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="จัดการแม่แบบ layout ของสลิป")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list", help="แสดงแม่แบบทั้งหมด")
+    p = sub.add_parser("learn", help="เรียนรู้แม่แบบจากรูปสลิป + ค่าที่ถูกต้อง")
+    p.add_argument("image")
+    p.add_argument("--trade", required=True, help='JSON เช่น {"pair": "BTC/USDT", "side": "BUY", "price": 1, "qty": 2}')
+    p.add_argument("--name")
+    p = sub.add_parser("test", help="ลองอ่านรูปด้วยแม่แบบ (ไม่ fallback)")
+    p.add_argument("image")
+    args = ap.parse_args()
+
+    import ocr_engine
+    reg = ocr_engine.get_layouts()
+    if reg is None:
+        raise SystemExit("layouts ถูกปิดใน config.yaml")
+    if args.cmd == "list":
+        for tpl in reg.templates:
+            print(f"{tpl.name:<40} {tpl.source:<8} {tpl.exchange}/{tpl.slip_type} fields={','.join(tpl.fields)}")
+        return
+    with open(args.image, "rb") as f:
+        data = f.read()
+    if args.cmd == "learn":
+        print(ocr_engine.learn_layout(data, json.loads(args.trade), args.name))
+    else:
+        timings, info = {}, {}
+        text = ocr_engine.read_layout(data, timings, info)
+        print(json.dumps({"layout": info.get("layout"), "text": text, "timings": timings}, ensure_ascii=False, indent=1))
+
+if __name__ == "__main__":
+    main()
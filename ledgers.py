@@ -0,0 +1,159 @@
+"""ledger แยกตามผู้ใช้ (chat id) พร้อมล็อกต่อ ledger และค่าตั้งต่อผู้ใช้
+
+- แต่ละ chat มี TradeStorage/PnLEngine ของตัวเอง (data/users/<chat_id>/ หรือแท็บ Sheets *_<chat_id>)
+  เปิดเมื่อใช้ครั้งแรก (open() เปิด backend ใน thread) และปิดอันที่ไม่ได้ใช้นานที่สุดเมื่อเปิดไว้เกิน max_open
+  — ledger ที่ถูกปิดขณะที่ยังมีคนถือไว้ (ได้ led มาแล้วแต่ยังไม่ได้ lock) จะเปิด backend ใหม่ตอน run() ใต้ lock
+- ทุกการอ่าน/เขียน ledger ทำใต้ lock ของ ledger นั้น: ผู้ใช้ต่างกันบันทึกพร้อมกันได้ (ใน thread)
+  ส่วนดีลของผู้ใช้คนเดียวกันเรียงกันทีละรายการ (ไม่มี read-modify-write ของ position ซ้อนกัน)
+- ค่าตั้งต่อผู้ใช้ (เช่น auto_accept) เก็บใน settings.json ในโฟลเดอร์ของผู้ใช้
+- shard_by_chat: false = ทุก chat ใช้ ledger รวมใน data/ แบบเดิม (ล็อกเดียว) แต่ค่าตั้งยังแยกตามผู้ใช้
+"""
+import os
+import json
+import asyncio
+import logging
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from pnl import PnLEngine
+from storage import TradeStorage, open_backend, shard_dir
+
+logger = logging.getLogger("tradebot.ledgers")
+
+class UserLedger:
+    def __init__(self, key: Optional[str], storage: TradeStorage, shards: "LedgerShards" = None):
+        self.key = key
+        self.storage = storage
+        self.pnl = PnLEngine(storage)
+        self.lock = asyncio.Lock()
+        self.closed = False
+        self._shards = shards
+
+    async def run(self, fn, *args):
+        """เรียก fn(*args) ใน thread ใต้ lock ของ ledger นี้ (event loop ไม่ถูกบล็อกระหว่างเขียน ledger)"""
+        async with self.lock:
+            if self.closed:
+                # ถูก evict ระหว่างที่ผู้เรียกถือ led ไว้แต่ยังไม่ได้ lock — fn ผูกกับ self.storage / self.pnl อยู่แล้ว
+                # จึงเปิด backend ใหม่ให้ออบเจ็กต์เดิม แล้วนับกลับเข้าไปใน ledger ที่เปิดอยู่
+                self.storage.reopen(await asyncio.to_thread(open_backend, self._shards.cfg, self.key))
+                self.closed = False
+                self._shards._track(self)
+            return await asyncio.to_thread(fn, *args)
+
+class LedgerShards:
+    def __init__(self, cfg: dict, shard_by_chat: bool = True, max_open: int = 256,
+                 legacy_chat_id: Optional[str] = None, default_settings: Dict[str, Any] = None):
+        self.cfg = cfg
+        self.shard_by_chat = shard_by_chat
+        self.max_open = max(1, max_open)
+        self.legacy_chat_id = str(legacy_chat_id) if legacy_chat_id is not None else None
+        self.defaults = dict(default_settings or {})
+        self._open: "OrderedDict[Optional[str], UserLedger]" = OrderedDict()
+        self._opening: Dict[Optional[str], asyncio.Future] = {}
+        # ledger ทุกตัวที่ยังมีคนถืออยู่ (รวมที่ถูกปิดไปแล้ว) — หนึ่ง key มี UserLedger (และ lock) ได้ตัวเดียว
+        self._live: "weakref.WeakValueDictionary[Optional[str], UserLedger]" = weakref.WeakValueDictionary()
+        self._settings: Dict[str, Dict[str, Any]] = {}
+
+    @classmethod
+    def from_config(cls, cfg: dict, default_settings: Dict[str, Any] = None) -> "LedgerShards":
+        c = cfg.get("ledger") or {}
+        return cls(cfg, shard_by_chat=bool(c.get("shard_by_chat", True)), max_open=int(c.get("max_open", 256)),
+                   legacy_chat_id=c.get("legacy_chat_id"), default_settings=default_settings)
+
+    def key_for(self, chat_id) -> Optional[str]:
+        """chat id → ชื่อ ledger (None = ledger รวมใน data/)"""
+        if chat_id is None or not self.shard_by_chat or str(chat_id) == self.legacy_chat_id:
+            return None
+        return str(chat_id)
+
+    def get(self, chat_id) -> UserLedger:
+        key = self.key_for(chat_id)
+        led = self._open.get(key)
+        if led is not None:
+            self._open.move_to_end(key)
+            return led
+        led = self._live.get(key)
+        if led is None:
+            led = UserLedger(key, TradeStorage(open_backend(self.cfg, key), shard=key), self)
+        self._track(led)
+        return led
+
+    def _track(self, led: UserLedger) -> None:
+        """นับ led เป็น ledger ที่เปิดอยู่ (ตัวที่ถูกปิดไปแล้วจะเปิด backend ใหม่ตอน run())"""
+        self._live[led.key] = led
+        self._open[led.key] = led
+        self._open.move_to_end(led.key)
+        self._evict()
+
+    async def open(self, chat_id) -> UserLedger:
+        """เหมือน get แต่เปิด backend ของ ledger ที่ยังไม่เปิดใน thread
+        (Sheets: authorize + สร้างแท็บผ่านเครือข่าย, SQLite: สร้าง schema) — event loop ไม่ถูกบล็อก"""
+        key = self.key_for(chat_id)
+        if key not in self._open and key not in self._live:
+            fut = self._opening.get(key)
+            if fut is None:
+                fut = self._opening[key] = asyncio.ensure_future(asyncio.to_thread(open_backend, self.cfg, key))
+                fut.add_done_callback(lambda _: self._opening.pop(key, None))
+            backend = await asyncio.shield(fut)
+            if key not in self._open and key not in self._live:
+                self._track(UserLedger(key, TradeStorage(backend, shard=key), self))
+        return self.get(chat_id)
+
+    def _evict(self) -> None:
+        # ปิดเฉพาะ ledger ที่ไม่มีใครถือ lock อยู่ (ไม่ปิด backend ระหว่างที่อีก thread กำลังเขียน)
+        for key in list(self._open):
+            if len(self._open) <= self.max_open:
+                return
+            led = self._open[key]
+            if led.lock.locked():
+                continue
+            del self._open[key]
+            if led.closed:
+                continue   # ถูกปิดไปแล้วและยังไม่มีใคร run() (get() นับกลับเข้ามาเฉย ๆ)
+            led.closed = True
+            try:
+                led.storage.close()
+            except Exception:
+                logger.exception("ปิด ledger %s ไม่สำเร็จ", key)
+
+    def close(self) -> None:
+        for led in self._open.values():
+            if not led.closed:
+                led.closed = True
+                led.storage.close()
+        self._open.clear()
+
+    # ---------- ค่าตั้งต่อผู้ใช้ ----------
+
+    def _settings_path(self, chat_id) -> str:
+        return os.path.join(shard_dir(chat_id, self.cfg), "settings.json")
+
+    def _saved(self, chat_id) -> Dict[str, Any]:
+        key = str(chat_id)
+        if key not in self._settings:
+            saved = {}
+            try:
+                with open(self._settings_path(key), encoding="utf-8") as f:
+                    saved = json.load(f)
+            except FileNotFoundError:
+                pass
+            except Exception:
+                logger.exception("อ่านค่าตั้งของ %s ไม่ได้ ใช้ค่าเริ่มต้น", key)
+            self._settings[key] = saved
+        return self._settings[key]
+
+    def settings(self, chat_id) -> Dict[str, Any]:
+        """ค่าตั้งของผู้ใช้ = ค่าเริ่มต้นจาก config ทับด้วยค่าที่ผู้ใช้ตั้งเอง"""
+        return {**self.defaults, **self._saved(chat_id)}
+
+    def update_settings(self, chat_id, **values) -> Dict[str, Any]:
+        saved = self._saved(chat_id)
+        saved.update(values)
+        path = self._settings_path(chat_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(saved, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        return self.settings(chat_id)
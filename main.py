@@ -1,23 +1,45 @@
-import os, io, json, logging
+import os, json, shutil, logging, asyncio, tempfile, weakref
 from datetime import datetime, timezone
-from typing import Dict, Any
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 
 from telegram import Update
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
 
-from ocr_engine import extract_text_from_image
-from parser_engine import parse_trade_from_text, guess_exchange
-from storage import TradeStorage
-from pnl import PnLEngine
-from utils import parse_bool
+from ocr_engine import extract_text_timed, learn_layout, init_worker, ImageTooLarge, LIMITS
+from ocr_pool import OCRExecutor, OCRQueueFull, OCRTimeout
+from ocr_cache import OCRCache, sha256_bytes, image_dhash
+from parser_engine import parse_trade_from_text, classify, reload_patterns, patterns_version, registry, parse_time
+from pnl import missing_fields, accepted_msg, clean_trade
+from ledgers import LedgerShards
+from journal import TradeJournal, ApplyFailed
+from storage import is_transient
+from aggregates import format_report
+from export import export, parse_command as parse_export
+from album import AlbumCollector
+import metrics
+from utils import parse_bool, load_config, admin_ids
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("tradebot")
 
-AUTO_ACCEPT = parse_bool(os.getenv("AUTO_ACCEPT", "false"))
+CFG = load_config()
+# ค่าเริ่มต้นของผู้ใช้ที่ยังไม่เคยสั่ง /auto_on หรือ /auto_off
+AUTO_ACCEPT = parse_bool(os.getenv("AUTO_ACCEPT", str(CFG.get("auto_accept", False))))
 
-storage = TradeStorage()
-pnl = PnLEngine(storage)
+ledgers = LedgerShards.from_config(CFG, default_settings={"auto_accept": AUTO_ACCEPT})
+ocr_pool = OCRExecutor.from_config(CFG, initializer=init_worker)
+ocr_cache = OCRCache.from_config(CFG)
+metrics.get().gauge("ocr_pool_running", lambda: ocr_pool.running)
+metrics.get().gauge("ocr_pool_waiting", lambda: ocr_pool.waiting)
+journal = TradeJournal.from_config(CFG, transient=is_transient)
+if journal:
+    metrics.get().gauge("journal_backlog", lambda: journal.backlog)
+_layouts_cfg = CFG.get("layouts") or {}
+LEARN_LAYOUTS = bool(_layouts_cfg.get("enabled", True) and _layouts_cfg.get("learn", True))
+_background: set = set()
+# ลำดับของ update ในแชทเดียวกัน (ดูที่ _chat_lock)
+_chat_locks: "weakref.WeakValueDictionary[Any, asyncio.Lock]" = weakref.WeakValueDictionary()
 
 WELCOME_TH = (
     "สวัสดีค่ะ! ส่งรูปแคปตอนเทรดมาได้เลย เดี๋ยวฉันดึงข้อมูลและบันทึกให้\n"
@@ -25,25 +47,29 @@ WELCOME_TH = (
     "• /auto_on – บันทึกอัตโนมัติ ไม่ต้องยืนยัน\n"
     "• /auto_off – ปิดบันทึกอัตโนมัติ\n"
     "• /status – ดูสรุปสั้น ๆ\n"
+    "• /report [day|week|month|all] – สรุปกำไร/ขาดทุนต่อคู่ อัตราชนะ และค่าธรรมเนียม\n"
+    "• /export [trades|realized|positions|all] [YYYY-MM] [คู่] [csv|parquet] – ส่งออก ledger เป็นไฟล์\n"
+    "• /cache – ดูสถิติแคช OCR\n"
 )
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     await update.message.reply_text(WELCOME_TH)
 
+def _auto_accept(chat_id) -> bool:
+    return bool(ledgers.settings(chat_id).get("auto_accept"))
+
 async def auto_on(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global AUTO_ACCEPT
-    AUTO_ACCEPT = True
-    os.environ["AUTO_ACCEPT"] = "true"
+    # มีผลเฉพาะแชทนี้
+    ledgers.update_settings(update.effective_chat.id, auto_accept=True)
     await update.message.reply_text("เปิดโหมดบันทึกอัตโนมัติแล้ว ✅")
 
 async def auto_off(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    global AUTO_ACCEPT
-    AUTO_ACCEPT = False
-    os.environ["AUTO_ACCEPT"] = "false"
+    ledgers.update_settings(update.effective_chat.id, auto_accept=False)
     await update.message.reply_text("ปิดโหมดบันทึกอัตโนมัติแล้ว ✅")
 
 async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    pos = storage.get_all_positions()
+    led = await ledgers.open(update.effective_chat.id)
+    pos = await led.run(led.storage.get_all_positions)
     if not pos:
         await update.message.reply_text("ยังไม่มี position ในระบบค่ะ")
         return
@@ -58,6 +84,94 @@ async def status(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         lines.append(f"- {p.get('pair')}: qty={qty:.6f}, avg_cost={avg:.6f}")
     await update.message.reply_text("\n".join(lines))
 
+async def report(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/report [day|week|month|all|YYYY-MM|YYYY-MM-DD] — P&L ต่อคู่จากยอดสรุปที่อัปเดตทีละดีล"""
+    period = context.args[0].lower() if context.args else "month"
+    led = await ledgers.open(update.effective_chat.id)
+    if journal:
+        await journal.drain(led.key)   # รวมดีลของแชทนี้ที่ตอบรับไปแล้วแต่ยังค้างใน journal
+    try:
+        rep = await led.run(led.storage.report, period)
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_text(format_report(rep))
+
+async def export_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/export [ตาราง] [วันที่ [ถึงวันที่]] [คู่] [csv|parquet] — ส่ง trades/realized/positions เป็นไฟล์"""
+    try:
+        opts = parse_export(context.args or [])
+    except ValueError as e:
+        await update.message.reply_text(str(e))
+        return
+    led = await ledgers.open(update.effective_chat.id)
+    if journal:
+        await journal.drain(led.key)
+    max_bytes = float((CFG.get("export") or {}).get("max_send_mb", 50)) * 1024 * 1024
+    tmp = tempfile.mkdtemp(prefix="export_")
+    try:
+        # อ่าน/เขียนทีละก้อนใน thread ของ ledger (ดีลใหม่ของแชทนี้รอจนส่งออกเสร็จ — ไฟล์ตรงกับ ledger ณ เวลาเดียว)
+        files = await led.run(export, led.storage, tmp, opts["tables"], opts["fmt"], False,
+                              opts["since"], opts["until"], opts["pairs"])
+        for f in files:
+            name = os.path.basename(f["path"])
+            if f["bytes"] > max_bytes:
+                await update.message.reply_text(
+                    f"{name} ใหญ่เกินที่ส่งทาง Telegram ได้ ({f['bytes'] / 1048576:.1f} MB) — "
+                    "ลองกรองช่วงวันที่/คู่เหรียญ หรือใช้ python export.py บนเครื่องบอท")
+                continue
+            with open(f["path"], "rb") as fh:
+                await update.message.reply_document(fh, filename=name, caption=f"{f['table']}: {f['rows']} แถว")
+    except (ValueError, RuntimeError) as e:
+        await update.message.reply_text(str(e))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+async def cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not ocr_cache:
+        await update.message.reply_text("ปิดการใช้แคช OCR อยู่ค่ะ")
+        return
+    await update.message.reply_text(ocr_cache.stats_text())
+
+async def reload_patterns_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.effective_user.id not in admin_ids():
+        await update.message.reply_text("คำสั่งนี้สำหรับแอดมินเท่านั้นค่ะ")
+        return
+    try:
+        reg = reload_patterns()
+    except Exception as e:
+        logger.exception("โหลด parser_patterns.yaml ใหม่ไม่สำเร็จ")
+        await update.message.reply_text(f"โหลด pattern ใหม่ไม่สำเร็จ (ยังใช้ชุดเดิมอยู่): {e}")
+        return
+    await update.message.reply_text(f"โหลด pattern ใหม่แล้ว ✅ (version {reg.version})")
+
+async def metrics_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/metrics — latency p50/p95/p99 ต่อขั้น, งานที่กำลังรัน, error และ request ที่ช้าที่สุด (แอดมิน)"""
+    if update.effective_user.id not in admin_ids():
+        await update.message.reply_text("คำสั่งนี้สำหรับแอดมินเท่านั้นค่ะ")
+        return
+    await update.message.reply_text(metrics.get().summary_text())
+
+async def replay_cmd(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """/replay [average_cost|fifo] — คำนวณ positions/realized ใหม่จาก trades (แอดมิน)"""
+    if update.effective_user.id not in admin_ids():
+        await update.message.reply_text("คำสั่งนี้สำหรับแอดมินเท่านั้นค่ะ")
+        return
+    policy = context.args[0] if context.args else None
+    try:
+        led = await ledgers.open(update.effective_chat.id)
+        if journal:
+            # ให้ดีลของแชทนี้ที่ค้างใน journal ลงก่อน (ระหว่าง replay ดีลใหม่ของแชทนี้จะรอ lock ของ ledger)
+            await journal.drain(led.key)
+        from replay import replay   # pandas โหลดเฉพาะตอนมีคน replay
+        res = await led.run(replay, led.storage, policy)
+    except (ValueError, RuntimeError) as e:
+        await update.message.reply_text(str(e))
+        return
+    await update.message.reply_text(
+        f"replay ({res['policy']}) เสร็จแล้ว ✅\ntrades={res['trades']}, pairs={res['pairs']}, "
+        f"realized rows={res['realized_rows']}, realized P&L รวม={res['realized_pnl']:.6f}")
+
 def _format_preview(trade: Dict[str, Any]) -> str:
     kv = []
     for k in ["exchange","pair","side","price","qty","fee","fee_asset","time"]:
@@ -65,62 +179,398 @@ def _format_preview(trade: Dict[str, Any]) -> str:
             kv.append(f"{k}: {trade[k]}")
     return "พบข้อมูลต่อไปนี้ค่ะ:\n" + "\n".join(kv)
 
+def _parse_slip(text: str) -> Dict[str, Any]:
+    with metrics.timed("parse"):
+        route = classify(text)
+        trade = parse_trade_from_text(text, route)
+        trade["exchange"] = route.exchange
+    return trade
+
+def _reparse_if_stale(entry: Dict[str, Any]) -> Dict[str, Any]:
+    # ข้อความ OCR ใช้ต่อได้เสมอ แต่ผล parse ต้องมาจาก pattern ชุดปัจจุบัน
+    if entry.get("patterns") != patterns_version():
+        return {**entry, "trade": _parse_slip(entry["text"])}
+    return entry
+
+async def _read_slip(update: Update, photo,
+                     say: Optional[Callable[[str], Awaitable[Any]]] = None) -> Optional[Dict[str, Any]]:
+    """คืน {"text", "trade"} จากแคชหรือจาก OCR; คืน None ถ้าแจ้งผู้ใช้ไปแล้ว (คิวเต็ม/timeout/worker ตาย)
+    ถ้า OCR แล้วไม่ตรงแม่แบบ layout ใด จะมี "image" (ไบต์ของรูป) ไว้เรียนรู้แม่แบบหลังผู้ใช้ยืนยัน
+
+    say = ที่ส่งข้อความแจ้งปัญหา (ค่าเริ่มต้นตอบกลับทันที); ถ้าส่งมาจะไม่แจ้งลำดับคิว
+    """
+    notify_queue = say is None
+    say = say or update.message.reply_text
+    if ocr_cache:
+        hit = ocr_cache.get_by_file_id(photo.file_unique_id)
+        if hit:
+            return _reparse_if_stale(hit)
+    if photo.file_size and photo.file_size > float(LIMITS["max_bytes_mb"]) * 1024 * 1024:
+        await say(f"ไฟล์ใหญ่เกิน {LIMITS['max_bytes_mb']} MB ค่ะ ลองแคปเฉพาะส่วนรายละเอียดดีลแล้วส่งใหม่")
+        return None
+    with metrics.timed("download"):
+        bio = await photo.get_file()
+        # ใช้ bytearray ที่ดาวน์โหลดมาตรง ๆ (hash / dHash / ส่งเข้า worker ได้โดยไม่ต้อง copy เป็น bytes)
+        img_bytes = await bio.download_as_bytearray()
+
+    sha = dhash = None
+    near = []
+    if ocr_cache:
+        with metrics.timed("cache_lookup"):
+            sha = sha256_bytes(img_bytes)
+            hit = ocr_cache.get_by_sha256(sha)
+            if hit is None:
+                try:
+                    dhash = await asyncio.get_running_loop().run_in_executor(None, image_dhash, img_bytes)
+                except Exception:
+                    logger.exception("คำนวณ dHash ไม่ได้")
+                # dHash ใกล้กัน = แค่น่าจะส่งซ้ำ (สลิปแม่แบบเดียวกันต่างแค่ตัวเลขก็ใกล้กัน) — ยังต้อง OCR แล้วเทียบข้อความ
+                near = ocr_cache.near_dhash(dhash)
+        if hit:
+            ocr_cache.link_file_id(hit["sha256"], photo.file_unique_id)
+            return _reparse_if_stale(hit)
+
+    async def _notify_queued(position: int) -> None:
+        await update.message.reply_text(f"ตอนนี้มีรูปรอประมวลผลอยู่ค่ะ อยู่ในคิวลำดับที่ {position} ⏳")
+
+    try:
+        # "ocr" = เวลารวมรวมรอคิว; ocr.decode/preprocess/tesseract วัดใน worker
+        with metrics.timed("ocr"):
+            text, timings, mem = await ocr_pool.run(extract_text_timed, img_bytes, on_queued=_notify_queued if notify_queue else None)
+        for stage, sec in timings.items():
+            metrics.observe(f"ocr.{stage}", sec)
+        metrics.get().record_max("ocr_worker_peak_rss_mb", mem["peak_rss_mb"])
+    except ImageTooLarge as e:
+        await say(f"รูปใหญ่เกินไปค่ะ ({e}) ลองแคปเฉพาะส่วนรายละเอียดดีลแล้วส่งใหม่")
+        return None
+    except OCRQueueFull:
+        await say("ตอนนี้มีรูปรอคิวเยอะมาก กรุณาส่งใหม่อีกครั้งในสักครู่ค่ะ 🙏")
+        return None
+    except OCRTimeout:
+        await say("อ่านรูปนานเกินไป ลองครอปให้เหลือเฉพาะส่วนรายละเอียดดีลแล้วส่งใหม่ค่ะ")
+        return None
+    except BrokenProcessPool:
+        # worker ตายกลางงาน (เช่นหน่วยความจำไม่พอ) — ocr_pool สร้าง pool ใหม่แล้ว ส่งรูปเดิมซ้ำได้เลย
+        logger.exception("OCR worker ตายระหว่างอ่านรูป")
+        await say("ระบบอ่านรูปขัดข้องชั่วคราว กรุณาส่งรูปนี้อีกครั้งค่ะ 🙏")
+        return None
+    same = ocr_cache.confirm_near(near, text) if ocr_cache else None
+    trade = _reparse_if_stale(same)["trade"] if same else _parse_slip(text)
+    entry = {"text": text, "trade": trade}
+    if ocr_cache:
+        entry = ocr_cache.put(sha, text, trade, file_unique_id=photo.file_unique_id, dhash=dhash,
+                              patterns=patterns_version())
+    if LEARN_LAYOUTS and mem.get("layout") is None:
+        # ไม่เก็บรูปในแคช — แนบไปกับผลของรอบนี้เท่านั้น
+        entry = {**entry, "image": img_bytes}
+    return entry
+
+async def _learn_layout(image, trade: Dict[str, Any]) -> None:
+    fields = {k: trade.get(k) for k in ("exchange", "pair", "side", "price", "qty", "fee", "fee_asset", "time",
+                                        "quote_amount")}
+    try:
+        name = await ocr_pool.run(learn_layout, image, fields)
+    except ValueError as e:
+        logger.info("เรียนรู้ layout จากสลิปนี้ไม่ได้: %s", e)
+        return
+    except Exception:
+        logger.exception("เรียนรู้ layout ไม่สำเร็จ")
+        return
+    if name:
+        logger.info("เรียนรู้ layout ใหม่: %s", name)
+
+def _spawn(coro) -> None:
+    # เก็บ reference ของงานเบื้องหลังไว้จนเสร็จ (asyncio ถือแค่ weak reference)
+    task = asyncio.create_task(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+def _learn_later(image, trade: Dict[str, Any]) -> None:
+    """เรียนรู้แม่แบบจากสลิปที่ผู้ใช้ยืนยันแล้วเป็นงานเบื้องหลัง (ไม่ให้ผู้ใช้รอ)"""
+    if image is None or missing_fields(trade):
+        return
+    _spawn(_learn_layout(image, dict(trade)))
+
+def _single(msgs: List[str]) -> str:
+    return msgs[0]
+
+def _numbered(msgs: List[str]) -> str:
+    return "\n\n".join(f"#{i} {m}" for i, m in enumerate(msgs, 1))
+
+async def _show_applied(ack, applied: asyncio.Future, fmt: Callable[[List[str]], str]) -> None:
+    try:
+        try:
+            text = fmt(await applied)
+        except ApplyFailed as e:
+            # ลงไม่ได้ถาวร (journal ข้ามไปแล้ว) — บอกผู้ใช้แทนข้อความ "รับแล้ว" ที่ค้างอยู่
+            text = f"บันทึกไม่สำเร็จ ❌ ({e}) — ดีลนี้ไม่ถูกบันทึก กรุณาส่งรูปใหม่อีกครั้งค่ะ"
+        await ack.edit_text(text)
+    except asyncio.CancelledError:
+        pass
+    except Exception:
+        logger.exception("แก้ข้อความผลการบันทึกไม่สำเร็จ")
+
+async def _record_trades(message, trades: List[Dict[str, Any]], fmt: Callable[[List[str]], str] = _single) -> None:
+    """บันทึกดีลที่ยืนยันแล้วและตอบกลับ
+
+    มี journal: ตอบทันทีที่ดีลลง journal (fsync แล้ว) แล้วแก้ข้อความเดิมเป็นผล P&L เมื่อ applier ลง ledger เสร็จ
+    ไม่มี journal: ลง ledger ตรง ๆ แล้วตอบผลเลยแบบเดิม
+    """
+    led = await ledgers.open(message.chat_id)
+    if journal is None:
+        msgs = await led.run(led.pnl.record_trades, trades)
+        with metrics.timed("reply"):
+            await message.reply_text(fmt(msgs))
+        return
+    if all(missing_fields(t) for t in trades):
+        # ไม่มีดีลไหนบันทึกได้ ไม่ต้องลง journal
+        await message.reply_text(fmt([accepted_msg(t) for t in trades]))
+        return
+    try:
+        with metrics.timed("journal.append"):
+            applied = await journal.append(trades, led.key)
+    except OSError:
+        await message.reply_text("บันทึกไม่สำเร็จ (เขียนลงดิสก์ไม่ได้) กรุณาลองยืนยันอีกครั้งค่ะ")
+        return
+    with metrics.timed("reply"):
+        ack = await message.reply_text(fmt([accepted_msg(t) for t in trades]))
+    _spawn(_show_applied(ack, applied, fmt))
+
+def _chat_lock(chat_id) -> asyncio.Lock:
+    """lock ของแชท — รูป/อัลบั้ม/ข้อความยืนยันของแชทเดียวกันทำทีละอันตามลำดับที่เข้ามา
+    (concurrent_updates ให้แชทต่างกันทำพร้อมกันได้ แต่ในแชทเดียวกัน 'ok' ที่ส่งระหว่าง OCR
+    ต้องยืนยันดีลก่อนหน้า ไม่ใช่ดีลที่ยังอ่านไม่เสร็จ และดีลที่บันทึกอัตโนมัติต้องลง journal ตามลำดับ)
+    asyncio.Lock ปล่อยคิวตามลำดับที่รอ; ไม่มีใครถือ/รอแล้ว lock จะถูกเก็บกวาดเอง"""
+    lock = _chat_locks.get(chat_id)
+    if lock is None:
+        lock = _chat_locks[chat_id] = asyncio.Lock()
+    return lock
+
 async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if update.message and update.message.media_group_id:
+        # รูปในอัลบั้ม: รอรวมให้ครบแล้วประมวลผลทีเดียวใน _handle_album
+        albums.add(update, context)
+        return
+    chat_id = update.effective_chat.id if update.effective_chat else None
+    async with _chat_lock(chat_id):
+        with metrics.trace("photo", chat_id=chat_id):
+            await _handle_photo(update, context)
+
+async def _handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     photos = update.message.photo
     if not photos:
         await update.message.reply_text("ไม่พบรูปภาพค่ะ")
         return
     photo = photos[-1]
-    bio = await photo.get_file()
-    img_bytes = await bio.download_as_bytearray()
-    text = extract_text_from_image(io.BytesIO(img_bytes))
-    ex = guess_exchange(text)
-    trade = parse_trade_from_text(text)
-    trade["exchange"] = ex
+    slip = await _read_slip(update, photo)
+    if slip is None:
+        return
+    trade = dict(slip["trade"])
     trade["src_image_id"] = photo.file_unique_id
     trade["ts_iso"] = datetime.now(timezone.utc).isoformat()
 
-    if not AUTO_ACCEPT:
+    if not _auto_accept(update.effective_chat.id):
         preview = _format_preview(trade)
         preview += "\n\nพิมพ์ 'ok' เพื่อยืนยัน หรือส่งข้อความแก้ไขเป็น JSON (เช่น {\"price\": 0.123})"
-        await update.message.reply_text(preview)
+        with metrics.timed("reply"):
+            await update.message.reply_text(preview)
         context.user_data["pending_trade"] = trade
+        context.user_data["pending_trades"] = None
+        context.user_data["pending_image"] = slip.get("image")
     else:
-        result_msg = pnl.record_trade(trade)
-        await update.message.reply_text(result_msg)
+        await _record_trades(update.message, [trade])
+
+def _album_order(item) -> tuple:
+    # เรียงตามเวลาในสลิป (แปลงเป็น datetime ด้วยตัวอ่านเวลาของ parser — รูปแบบต่างกันก็เทียบกันได้);
+    # ดีลที่ไม่มีเวลา/อ่านเวลาไม่ได้ไว้ท้ายสุด และใช้ลำดับรูปในอัลบั้มเป็นตัวตัดสิน
+    index, trade = item
+    t = parse_time(trade.get("time"))
+    return (t is None, t or datetime.min, index)
+
+def _format_album_preview(trades: List[Dict[str, Any]]) -> str:
+    parts = []
+    for i, trade in enumerate(trades, 1):
+        kv = [f"{k}: {trade[k]}" for k in ["exchange","pair","side","price","qty","fee","fee_asset","time"]
+              if trade.get(k) is not None]
+        parts.append(f"#{i}\n" + "\n".join(kv))
+    return f"พบ {len(trades)} ดีลจากอัลบั้ม (เรียงตามเวลา):\n\n" + "\n\n".join(parts)
+
+async def _handle_album(updates: List[Update], context: ContextTypes.DEFAULT_TYPE) -> None:
+    first = updates[0]
+    chat_id = first.effective_chat.id if first.effective_chat else None
+    async with _chat_lock(chat_id):
+        await _process_album(updates, context)
+
+async def _process_album(updates: List[Update], context: ContextTypes.DEFAULT_TYPE) -> None:
+    first = updates[0]
+    with metrics.trace("album", chat_id=first.effective_chat.id if first.effective_chat else None,
+                       photos=len(updates)):
+        problems: List[str] = []
+
+        async def _read(i: int, upd: Update):
+            photo = upd.message.photo[-1]
+
+            async def _say(msg: str) -> None:
+                problems.append(f"รูปที่ {i}: {msg}")
+
+            slip = await _read_slip(upd, photo, say=_say)
+            if slip is None:
+                return None
+            trade = dict(slip["trade"])
+            trade["src_image_id"] = photo.file_unique_id
+            return trade
+
+        # OCR ทุกรูปพร้อมกัน (ocr_pool จำกัดจำนวนที่รันจริงเอง)
+        slips = await asyncio.gather(*(_read(i, u) for i, u in enumerate(updates, 1) if u.message.photo))
+        ts = datetime.now(timezone.utc).isoformat()
+        trades = [t for _, t in sorted(((i, t) for i, t in enumerate(slips) if t), key=_album_order)]
+        for t in trades:
+            t["ts_iso"] = ts
+
+        auto = _auto_accept(first.effective_chat.id)
+        lines: List[str] = []
+        if not trades:
+            lines.append("อ่านดีลจากอัลบั้มนี้ไม่ได้เลยค่ะ")
+        elif not auto:
+            lines.append(_format_album_preview(trades))
+            lines.append("พิมพ์ 'ok' เพื่อยืนยันทั้งหมด หรือส่งแก้ไขเป็น JSON โดยใช้เลขดีลเป็น key "
+                         "(เช่น {\"2\": {\"price\": 0.123}})")
+            context.user_data["pending_trades"] = trades
+            context.user_data["pending_trade"] = None
+            context.user_data["pending_image"] = None
+        if problems:
+            lines.append("\n".join(problems))
+        if trades and auto:
+            # ผลการบันทึกกับปัญหาของรูปอื่นอยู่ในข้อความเดียวกัน
+            await _record_trades(first.message, trades, lambda msgs: "\n\n".join([_numbered(msgs)] + lines))
+            return
+        with metrics.timed("reply"):
+            await first.message.reply_text("\n\n".join(lines))
+
+albums = AlbumCollector.from_config(CFG, _handle_album)
+
+def _patch_trades(trades: List[Dict[str, Any]], patch: Dict[str, Any]) -> None:
+    """แก้ดีลในอัลบั้มตาม {"เลขดีล": {field: value}}; เลขดีลผิดจะ raise ValueError"""
+    for key, fields in patch.items():
+        i = int(key)
+        if not 1 <= i <= len(trades) or not isinstance(fields, dict):
+            raise ValueError(key)
+        trades[i - 1].update(fields)
 
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    async with _chat_lock(update.effective_chat.id if update.effective_chat else None):
+        await _handle_text(update, context)
+
+async def _handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     txt = (update.message.text or "").strip()
     pending = context.user_data.get("pending_trade")
-    if pending:
-        if txt.lower() in ("ok","โอเค","ตกลง","yes","y"):
-            result_msg = pnl.record_trade(pending)
-            context.user_data["pending_trade"] = None
-            await update.message.reply_text(result_msg)
+    pending_many = context.user_data.get("pending_trades")
+    # แก้ค่าบนสำเนา แล้วตรวจ/แปลงชนิดก่อนลง journal — ค่าที่ใช้ไม่ได้ (เช่น price "abc") ถูกปฏิเสธตรงนี้
+    # ดีลที่รอยืนยันยังเป็นค่าเดิม ผู้ใช้ส่งแก้ใหม่ได้
+    if pending_many:
+        try:
+            trades = [dict(t) for t in pending_many]
+            if txt.lower() not in ("ok","โอเค","ตกลง","yes","y"):
+                _patch_trades(trades, json.loads(txt))
+            trades = [clean_trade(t) for t in trades]
+        except Exception:
+            await update.message.reply_text("ไม่เข้าใจข้อความค่ะ ถ้าต้องการยืนยันให้พิมพ์ 'ok' หรือส่งแก้ไขเป็น JSON เช่น {\"1\": {\"qty\": 2}}")
             return
+        context.user_data["pending_trades"] = None
+        await _record_trades(update.message, trades, _numbered)
+    elif pending:
         try:
-            patch = json.loads(txt)
-            pending.update(patch)
-            result_msg = pnl.record_trade(pending)
-            context.user_data["pending_trade"] = None
-            await update.message.reply_text(result_msg)
+            trade = dict(pending)
+            if txt.lower() not in ("ok","โอเค","ตกลง","yes","y"):
+                trade.update(json.loads(txt))
+            trade = clean_trade(trade)
         except Exception:
             await update.message.reply_text("ไม่เข้าใจข้อความค่ะ ถ้าต้องการยืนยันให้พิมพ์ 'ok' หรือส่งแก้ไขเป็น JSON")
+            return
+        context.user_data["pending_trade"] = None
+        _learn_later(context.user_data.pop("pending_image", None), trade)
+        await _record_trades(update.message, [trade])
     else:
         await update.message.reply_text("ส่งรูปแคปหน้าจอการเทรดมาได้เลยค่ะ (หรือใช้ /start)")
 
-def main():
-    token = os.getenv("TELEGRAM_BOT_TOKEN")
-    if not token:
-        logger.error("TELEGRAM_BOT_TOKEN ไม่ถูกตั้งค่า")
-        return
-    app = Application.builder().token(token).build()
+async def _apply_journal(shard: Optional[str], trades: List[Dict[str, Any]], recovering: bool) -> List[str]:
+    # shard ของ journal = ชื่อ ledger (chat id) ที่ LedgerShards ให้ไว้ตอน append
+    led = await ledgers.open(shard)
+    return await led.run(led.pnl.recover_trades if recovering else led.pnl.record_trades, trades)
+
+async def _warm_up() -> None:
+    """เตรียมของที่รูปแรกต้องใช้ไว้เบื้องหลัง ระหว่างที่บอทเริ่มรับ update แล้ว
+    (ถ้ามีรูปมาก่อนเสร็จ แต่ละอย่างจะโหลดเองตอนใช้ครั้งแรก)"""
+    try:
+        with metrics.timed("startup.warm"):
+            await asyncio.to_thread(registry)
+            if ocr_cache:
+                await asyncio.to_thread(ocr_cache.load)
+            if ocr_pool.prestart:
+                await ocr_pool.warm()
+    except Exception:
+        logger.exception("เตรียมระบบเบื้องหลังไม่สำเร็จ")
+
+async def _startup(app: Application) -> None:
+    if journal:
+        # ดีลที่ตอบผู้ใช้ไปแล้วแต่ยังไม่ลง ledger (โปรแกรมหยุดกลางคัน) จะถูกลงต่อเบื้องหลัง
+        await journal.start(_apply_journal)
+    _spawn(_warm_up())
+
+async def _shutdown(app: Application) -> None:
+    if journal:
+        await journal.close()
+    ocr_pool.shutdown()
+    ledgers.close()
+    metrics.get().close()
+
+async def _on_error(update: object, context: ContextTypes.DEFAULT_TYPE) -> None:
+    metrics.get().error("handler")
+    logger.error("handler ล้มเหลว", exc_info=context.error)
+
+def build_app(token: str, base_url: Optional[str] = None, base_file_url: Optional[str] = None,
+              concurrent_updates: Optional[int] = None) -> Application:
+    """สร้าง Application พร้อม handler ทั้งหมด
+
+    base_url / base_file_url = Bot API server อื่นแทน api.telegram.org (เช่น local Bot API server
+    หรือ Bot API ปลอมของ bench.bot_load) — ไม่ระบุ = ใช้ค่าใน config ส่วน telegram
+    """
+    tg = CFG.get("telegram") or {}
+    base_url = base_url or os.getenv("TELEGRAM_BASE_URL") or tg.get("base_url")
+    base_file_url = base_file_url or os.getenv("TELEGRAM_BASE_FILE_URL") or tg.get("base_file_url")
+    if concurrent_updates is None:
+        concurrent_updates = int(tg.get("concurrent_updates", 0))
+    builder = Application.builder().token(token).post_init(_startup).post_shutdown(_shutdown)
+    if base_url:
+        builder = builder.base_url(base_url)
+    if base_file_url:
+        builder = builder.base_file_url(base_file_url)
+    if concurrent_updates:
+        # ประมวลผลหลาย update พร้อมกัน (ไม่งั้นรูปของผู้ใช้คนหนึ่งต้องรอ OCR ของคนก่อนหน้าจบ)
+        builder = builder.concurrent_updates(concurrent_updates)
+    app = builder.build()
     app.add_handler(CommandHandler("start", start))
     app.add_handler(CommandHandler("auto_on", auto_on))
     app.add_handler(CommandHandler("auto_off", auto_off))
     app.add_handler(CommandHandler("status", status))
+    app.add_handler(CommandHandler("report", report))
+    app.add_handler(CommandHandler("export", export_cmd))
+    app.add_handler(CommandHandler("cache", cache_stats))
+    app.add_handler(CommandHandler("reload_patterns", reload_patterns_cmd))
+    app.add_handler(CommandHandler("replay", replay_cmd))
+    app.add_handler(CommandHandler("metrics", metrics_cmd))
     app.add_handler(MessageHandler(filters.PHOTO, handle_photo))
     app.add_handler(MessageHandler(filters.TEXT & (~filters.COMMAND), handle_text))
+    app.add_error_handler(_on_error)
+    return app
+
+def main():
+    token = os.getenv("TELEGRAM_BOT_TOKEN")
+    if not token:
+        logger.error("TELEGRAM_BOT_TOKEN ไม่ถูกตั้งค่า")
+        return
+    metrics.configure(CFG)
+    app = build_app(token)
     logger.info("Bot started.")
     app.run_polling()
 
@@ -0,0 +1,343 @@
+"""จับเวลาแต่ละขั้นของ pipeline (download → OCR → parse → บันทึก) แบบเบา ๆ
+
+    with metrics.trace("photo"):            # หนึ่ง request
+        with metrics.timed("download"):     # หนึ่งขั้น
+            ...
+
+- ต่อขั้น: histogram ของ latency (p50/p95/p99), จำนวนที่กำลังรัน (in-flight), จำนวน error
+- ดูได้ทาง /metrics (แอดมิน) และ Prometheus text format ที่ http://<host>:<port>/metrics
+- request ที่ช้ากว่า slow_ms จะถูกเก็บ (slowest N) และเขียนลง slow_log เป็น JSONL
+  ถ้าเปิด profiler จะแนบ stack ที่สุ่มเก็บจาก thread หลักระหว่าง request นั้นมาด้วย
+"""
+import sys
+import json
+import time
+import heapq
+import bisect
+import logging
+import threading
+import contextlib
+import contextvars
+from collections import deque, Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("tradebot.metrics")
+
+# ขอบ bucket (วินาที) ครอบตั้งแต่ regex ระดับ ms ไปจนถึง Tesseract หลายวินาที
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """bucket สะสมสำหรับ Prometheus + reservoir ล่าสุดสำหรับคำนวณ quantile"""
+
+    def __init__(self, reservoir: int = 2048):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=reservoir)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+        self.recent.append(seconds)
+
+    def quantiles(self, qs=QUANTILES) -> Dict[float, float]:
+        data = sorted(self.recent)
+        if not data:
+            return {q: 0.0 for q in qs}
+        return {q: data[min(len(data) - 1, int(q * len(data)))] for q in qs}
+
+class Trace:
+    """เวลาของแต่ละขั้นภายใน request เดียว"""
+
+    def __init__(self, name: str, labels: Dict[str, Any]):
+        self.name = name
+        self.labels = labels
+        self.start = time.perf_counter()
+        self.stages: List[Tuple[str, float]] = []
+        self.total = 0.0
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "labels": self.labels,
+            "total_ms": round(self.total * 1000, 3),
+            "stages": [[s, round(t * 1000, 3)] for s, t in self.stages],
+            "error": self.error,
+        }
+
+_current: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("metrics_trace", default=None)
+
+class StackSampler(threading.Thread):
+    """profiler แบบสุ่ม: เก็บ stack ของ thread เป้าหมาย (event loop) ทุก interval
+    แล้วให้ request ที่ช้าดึง stack ในช่วงเวลาของตัวเองไปสรุป"""
+
+    def __init__(self, thread_id: int, interval: float = 0.01, keep_sec: float = 120.0):
+        super().__init__(name="metrics-sampler", daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = deque(maxlen=max(1, int(keep_sec / interval)))
+        self._halt = threading.Event()
+
+    def run(self):
+        while not self._halt.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and len(stack) < 40:
+                code = frame.f_code
+                stack.append(f"{code.co_filename.rsplit('/', 1)[-1]}:{code.co_name}")
+                frame = frame.f_back
+            self.samples.append((time.perf_counter(), ";".join(reversed(stack))))
+
+    def collapse(self, start: float, end: float, top: int = 15) -> List[Tuple[str, int]]:
+        c = Counter(stack for t, stack in list(self.samples) if start <= t <= end)
+        return c.most_common(top)
+
+    def stop(self):
+        self._halt.set()
+
+class Metrics:
+    def __init__(self, enabled: bool = True, slow_ms: float = 5000.0, slow_keep: int = 20,
+                 slow_log: Optional[str] = None):
+        self.enabled = enabled
+        self.slow_ms = slow_ms
+        self.slow_keep = slow_keep
+        self.slow_log = slow_log
+        self.histograms: Dict[str, Histogram] = {}
+        self.inflight: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.gauges: Dict[str, Callable[[], float]] = {}
+        self.maxima: Dict[str, float] = {}
+        self.slowest: List[Tuple[float, int, Dict[str, Any]]] = []   # min-heap ของ request ที่ช้าที่สุด
+        self.sampler: Optional[StackSampler] = None
+        self.server: Optional[ThreadingHTTPServer] = None
+        self._seq = 0
+        self._lock = threading.Lock()
+
+    # ---------- บันทึก ----------
+
+    def observe(self, stage: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            h = self.histograms.get(stage)
+            if h is None:
+                h = self.histograms[stage] = Histogram()
+            h.observe(seconds)
+        tr = _current.get()
+        if tr is not None:
+            tr.stages.append((stage, seconds))
+
+    def error(self, stage: str):
+        with self._lock:
+            self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def gauge(self, name: str, fn: Callable[[], float]):
+        """ค่าที่อ่านตอน export (เช่น จำนวนงานในคิว OCR)"""
+        self.gauges[name] = fn
+
+    def record_max(self, name: str, value: float):
+        """เก็บค่าสูงสุดที่เคยเห็น (เช่น peak RSS ต่อรูปของ OCR worker) — export เป็น gauge <name>_max"""
+        with self._lock:
+            if value > self.maxima.get(name, float("-inf")):
+                self.maxima[name] = value
+
+    @contextlib.contextmanager
+    def timed(self, stage: str):
+        if not self.enabled:
+            yield
+            return
+        with self._lock:
+            self.inflight[stage] = self.inflight.get(stage, 0) + 1
+        t0 = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.error(stage)
+            raise
+        finally:
+            self.observe(stage, time.perf_counter() - t0)
+            with self._lock:
+                self.inflight[stage] -= 1
+
+    @contextlib.contextmanager
+    def trace(self, name: str, **labels):
+        """ครอบทั้ง request: เวลารวมถูกบันทึกเป็นขั้นชื่อ name และส่งต่อให้ slow log"""
+        if not self.enabled:
+            yield None
+            return
+        tr = Trace(name, labels)
+        with self.timed(name):
+            token = _current.set(tr)
+            try:
+                yield tr
+            except BaseException as e:
+                tr.error = f"{type(e).__name__}: {e}"
+                raise
+            finally:
+                _current.reset(token)
+                tr.total = time.perf_counter() - tr.start
+                self._finish(tr)
+
+    def _finish(self, tr: Trace):
+        ms = tr.total * 1000
+        if ms < self.slow_ms and len(self.slowest) >= self.slow_keep and ms <= self.slowest[0][0]:
+            return
+        rec = tr.to_dict()
+        rec["ts"] = datetime.now(timezone.utc).isoformat()
+        if self.sampler is not None and ms >= self.slow_ms:
+            rec["profile"] = self.sampler.collapse(tr.start, tr.start + tr.total)
+        with self._lock:
+            self._seq += 1
+            item = (ms, self._seq, rec)
+            if len(self.slowest) < self.slow_keep:
+                heapq.heappush(self.slowest, item)
+            else:
+                heapq.heappushpop(self.slowest, item)
+        if ms >= self.slow_ms and self.slow_log:
+            try:
+                with open(self.slow_log, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            except OSError:
+                logger.exception("เขียน slow log ไม่ได้")
+
+    # ---------- รายงาน ----------
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for name, h in sorted(self.histograms.items()):
+                q = h.quantiles()
+                stages[name] = {"count": h.count, "sum": h.sum, "buckets": list(h.counts),
+                                "p50": q[0.5], "p95": q[0.95], "p99": q[0.99],
+                                "inflight": self.inflight.get(name, 0), "errors": self.errors.get(name, 0)}
+            for name, n in self.errors.items():
+                stages.setdefault(name, {"count": 0, "sum": 0.0, "buckets": [0] * (len(BUCKETS) + 1),
+                                         "p50": 0.0, "p95": 0.0, "p99": 0.0, "inflight": 0, "errors": n})
+            slow = [rec for _, _, rec in sorted(self.slowest, reverse=True)]
+        gauges = {f"{name}_max": v for name, v in self.maxima.items()}
+        for name, fn in self.gauges.items():
+            try:
+                gauges[name] = float(fn())
+            except Exception:
+                pass
+        return {"stages": stages, "gauges": gauges, "slowest": slow}
+
+    def summary_text(self, slow: int = 3) -> str:
+        snap = self.snapshot()
+        if not snap["stages"]:
+            return "ยังไม่มีข้อมูล metrics ค่ะ"
+        lines = ["ขั้น: n | p50 / p95 / p99 (ms) | กำลังรัน | error"]
+        for name, s in snap["stages"].items():
+            lines.append(f"- {name}: {s['count']} | {s['p50'] * 1000:.1f} / {s['p95'] * 1000:.1f} / "
+                         f"{s['p99'] * 1000:.1f} | {s['inflight']} | {s['errors']}")
+        for name, v in snap["gauges"].items():
+            lines.append(f"- {name} = {v:g}")
+        if snap["slowest"][:slow]:
+            lines.append("request ที่ช้าที่สุด:")
+            for rec in snap["slowest"][:slow]:
+                top = ", ".join(f"{s}={ms:.0f}" for s, ms in sorted(rec["stages"], key=lambda x: -x[1])[:4])
+                lines.append(f"- {rec['name']} {rec['total_ms']:.0f}ms ({top})")
+        return "\n".join(lines)
+
+    def prometheus_text(self) -> str:
+        snap = self.snapshot()
+        out = ["# HELP tradebot_stage_seconds เวลาของแต่ละขั้นใน pipeline",
+               "# TYPE tradebot_stage_seconds histogram"]
+        for name, s in snap["stages"].items():
+            acc = 0
+            for le, n in zip(BUCKETS + ("+Inf",), s["buckets"]):
+                acc += n
+                out.append(f'tradebot_stage_seconds_bucket{{stage="{name}",le="{le}"}} {acc}')
+            out.append(f'tradebot_stage_seconds_sum{{stage="{name}"}} {s["sum"]:.6f}')
+            out.append(f'tradebot_stage_seconds_count{{stage="{name}"}} {s["count"]}')
+        out += ["# HELP tradebot_stage_quantile_seconds quantile จากตัวอย่างล่าสุด",
+                "# TYPE tradebot_stage_quantile_seconds gauge"]
+        for name, s in snap["stages"].items():
+            for q in QUANTILES:
+                out.append(f'tradebot_stage_quantile_seconds{{stage="{name}",quantile="{q}"}} {s[f"p{int(q * 100)}"]:.6f}')
+        out += ["# TYPE tradebot_stage_inflight gauge"]
+        out += [f'tradebot_stage_inflight{{stage="{n}"}} {s["inflight"]}' for n, s in snap["stages"].items()]
+        out += ["# TYPE tradebot_stage_errors_total counter"]
+        out += [f'tradebot_stage_errors_total{{stage="{n}"}} {s["errors"]}' for n, s in snap["stages"].items()]
+        for name, v in snap["gauges"].items():
+            out += [f"# TYPE tradebot_{name} gauge", f"tradebot_{name} {v:g}"]
+        return "\n".join(out) + "\n"
+
+    # ---------- endpoint / profiler ----------
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus_text().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+        logger.info("Prometheus metrics ที่ http://%s:%d/metrics", host, self.server.server_port)
+        return self.server
+
+    def start_profiler(self, interval: float = 0.01, thread_id: Optional[int] = None):
+        if self.sampler is None:
+            self.sampler = StackSampler(thread_id or threading.main_thread().ident, interval)
+            self.sampler.start()
+
+    def close(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler = None
+
+_METRICS = Metrics()
+
+def configure(cfg: dict) -> Metrics:
+    """ตั้งค่า instance กลางจาก config.yaml (ส่วน metrics) แล้วเปิด endpoint/profiler ตามที่ตั้งไว้"""
+    c = cfg.get("metrics") or {}
+    m = _METRICS
+    m.enabled = bool(c.get("enabled", True))
+    m.slow_ms = float(c.get("slow_ms", 5000))
+    m.slow_keep = int(c.get("slow_keep", 20))
+    m.slow_log = c.get("slow_log", "data/slow_requests.jsonl")
+    if not m.enabled:
+        return m
+    port = int(c.get("prometheus_port") or 0)
+    if port and m.server is None:
+        try:
+            m.serve(port, c.get("host", "127.0.0.1"))
+        except OSError:
+            logger.exception("เปิด metrics endpoint ที่พอร์ต %d ไม่ได้", port)
+    if c.get("profiler"):
+        m.start_profiler(float(c.get("profiler_interval_ms", 10)) / 1000)
+    return m
+
+def get() -> Metrics:
+    return _METRICS
+
+def timed(stage: str):
+    return _METRICS.timed(stage)
+
+def trace(name: str, **labels):
+    return _METRICS.trace(name, **labels)
+
+def observe(stage: str, seconds: float):
+    _METRICS.observe(stage, seconds)
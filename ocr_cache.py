@@ -0,0 +1,251 @@
+import os
+import io
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger("tradebot.ocr_cache")
+
+def sha256_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def image_dhash(data: bytes, size: int = 8) -> int:
+    """difference hash 64 บิต — ทนต่อการบีบอัดซ้ำ/ย่อขนาดของ Telegram"""
+    from PIL import Image
+    img = Image.open(io.BytesIO(data))
+    img.draft("L", (size * 8, size * 8))  # JPEG: ถอดรหัสแบบย่อ ไม่ต้อง decode เต็มภาพ
+    img = img.convert("L").resize((size + 1, size), Image.BILINEAR)
+    px = list(img.getdata())
+    h = 0
+    for row in range(size):
+        for col in range(size):
+            left = px[row * (size + 1) + col]
+            right = px[row * (size + 1) + col + 1]
+            h = (h << 1) | (1 if left > right else 0)
+    return h
+
+class OCRCache:
+    """แคชผล OCR + parse สองชั้น
+
+    - exact key: Telegram file_unique_id หรือ SHA-256 ของไฟล์ — เจอแล้วใช้ผลได้เลยไม่ต้อง OCR
+    - perceptual key: dHash (ระยะ Hamming ไม่เกิน phash_distance) — บอกได้แค่ว่า "น่าจะเป็นรูปเดิมที่ถูกบีบอัดซ้ำ"
+      สลิปแม่แบบเดียวกันที่ต่างกันแค่ตัวเลขมี dHash แทบเท่ากัน จึงต้อง OCR ใหม่แล้วเทียบข้อความก่อนเสมอ (confirm_near)
+
+    เก็บใน LRU ในหน่วยความจำ และเขียนลงดิสก์เป็นไฟล์ JSON ต่อรูปใต้ cache_dir
+    ถ้าขนาดรวมบนดิสก์เกิน max_disk_bytes จะลบไฟล์ที่ใช้ล่าสุดนานที่สุดก่อน
+    index บนดิสก์อ่านตอนใช้ครั้งแรก (หรือเรียก load() ล่วงหน้าใน thread) — สร้าง object ได้ทันทีแม้แคชมีหลายหมื่นไฟล์
+    """
+
+    def __init__(self, cache_dir: str = "data/ocr_cache", max_items: int = 512,
+                 max_disk_bytes: int = 200 * 1024 * 1024, phash_distance: int = 6):
+        self.cache_dir = cache_dir
+        self.max_items = max_items
+        self.max_disk_bytes = max_disk_bytes
+        self.phash_distance = phash_distance
+        self._mem: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._by_file_id: Dict[str, str] = {}
+        self._by_dhash: Dict[int, List[str]] = {}   # dHash เดียวกันมีได้หลายรูป (สลิปแม่แบบเดียวกัน)
+        self._shas = set()
+        self._disk_bytes = 0
+        self.stats = {"hit_file_id": 0, "hit_sha256": 0, "miss": 0, "dhash_same": 0, "dhash_diff": 0, "evicted": 0}
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, cfg: dict) -> Optional["OCRCache"]:
+        c = cfg.get("ocr_cache") or {}
+        if not c.get("enabled", True):
+            return None
+        return cls(
+            cache_dir=c.get("dir", "data/ocr_cache"),
+            max_items=int(c.get("max_items", 512)),
+            max_disk_bytes=int(float(c.get("max_disk_mb", 200)) * 1024 * 1024),
+            phash_distance=int(c.get("phash_distance", 6)),
+        )
+
+    # ---------- index บนดิสก์ ----------
+
+    def _path(self, sha: str) -> str:
+        return os.path.join(self.cache_dir, f"{sha}.json")
+
+    def load(self) -> "OCRCache":
+        """อ่าน index จากดิสก์ (ครั้งเดียว) — API ทุกตัวเรียกเองก่อนใช้"""
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load_index()
+                    self._loaded = True
+        return self
+
+    def _load_index(self):
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json"):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path, encoding="utf-8") as f:
+                    entry = json.load(f)
+            except Exception:
+                logger.warning("ลบไฟล์แคชที่เสีย: %s", path)
+                os.remove(path)
+                continue
+            sha = name[:-5]
+            self._index(sha, entry)
+            self._disk_bytes += os.path.getsize(path)
+
+    def _index(self, sha: str, entry: Dict[str, Any]):
+        self._shas.add(sha)
+        for fid in entry.get("file_ids") or []:
+            self._by_file_id[fid] = sha
+        if entry.get("dhash") is not None:
+            shas = self._by_dhash.setdefault(int(entry["dhash"]), [])
+            if sha not in shas:
+                shas.append(sha)
+
+    def _unindex(self, sha: str, entry: Dict[str, Any]):
+        self._shas.discard(sha)
+        for fid in entry.get("file_ids") or []:
+            if self._by_file_id.get(fid) == sha:
+                del self._by_file_id[fid]
+        if entry.get("dhash") is not None:
+            shas = self._by_dhash.get(int(entry["dhash"]), [])
+            if sha in shas:
+                shas.remove(sha)
+            if not shas:
+                self._by_dhash.pop(int(entry["dhash"]), None)
+
+    def _read(self, sha: str) -> Optional[Dict[str, Any]]:
+        if sha in self._mem:
+            self._mem.move_to_end(sha)
+            return self._mem[sha]
+        path = self._path(sha)
+        try:
+            with open(path, encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # ใช้ mtime เป็นเวลาใช้งานล่าสุดสำหรับ eviction
+        self._remember(sha, entry)
+        return entry
+
+    def _remember(self, sha: str, entry: Dict[str, Any]):
+        self._mem[sha] = entry
+        self._mem.move_to_end(sha)
+        while len(self._mem) > self.max_items:
+            self._mem.popitem(last=False)
+
+    def _write(self, sha: str, entry: Dict[str, Any]):
+        path = self._path(sha)
+        old = os.path.getsize(path) if os.path.exists(path) else 0
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp, path)
+        self._disk_bytes += os.path.getsize(path) - old
+        if self._disk_bytes > self.max_disk_bytes:
+            self._evict()
+
+    def _evict(self):
+        files: List[Tuple[float, str]] = []
+        for name in os.listdir(self.cache_dir):
+            if name.endswith(".json"):
+                path = os.path.join(self.cache_dir, name)
+                files.append((os.path.getmtime(path), path))
+        files.sort()
+        target = self.max_disk_bytes * 0.9
+        for _, path in files:
+            if self._disk_bytes <= target:
+                break
+            sha = os.path.basename(path)[:-5]
+            entry = self._mem.pop(sha, None)
+            if entry is None:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        entry = json.load(f)
+                except Exception:
+                    entry = {}
+            self._unindex(sha, entry)
+            self._disk_bytes -= os.path.getsize(path)
+            os.remove(path)
+            self.stats["evicted"] += 1
+
+    # ---------- API ----------
+
+    def get_by_file_id(self, file_unique_id: str) -> Optional[Dict[str, Any]]:
+        """เช็คก่อนดาวน์โหลด — ถ้าเจอไม่ต้องโหลดรูปเลย (ไม่นับ miss ถ้าไม่เจอ)"""
+        self.load()
+        sha = self._by_file_id.get(file_unique_id)
+        entry = self._read(sha) if sha else None
+        if entry is not None:
+            self.stats["hit_file_id"] += 1
+        return entry
+
+    def get_by_sha256(self, sha: str) -> Optional[Dict[str, Any]]:
+        """ไม่เจอ = miss (ต้อง OCR)"""
+        self.load()
+        entry = self._read(sha)
+        self.stats["hit_sha256" if entry is not None else "miss"] += 1
+        return entry
+
+    def near_dhash(self, dhash: Optional[int]) -> List[Dict[str, Any]]:
+        """entry ที่ dHash ห่างไม่เกิน phash_distance เรียงจากใกล้สุด — ห้ามใช้ผลแทน OCR ส่งต่อให้ confirm_near หลัง OCR"""
+        self.load()
+        if dhash is None:
+            return []
+        found = sorted(((h ^ dhash).bit_count(), sha) for h, shas in self._by_dhash.items() for sha in shas)
+        # ไม่ต้องอ่านทุกใบ — รูปที่ถูกส่งซ้ำจริงมักอยู่ในกลุ่มที่ใกล้สุด (ใช้แค่ประหยัดการ parse)
+        entries = (self._read(sha) for d, sha in found[:8] if d <= self.phash_distance)
+        return [e for e in entries if e is not None]
+
+    def confirm_near(self, near: List[Dict[str, Any]], text: str) -> Optional[Dict[str, Any]]:
+        """entry ใน near ที่ข้อความ OCR ตรงกับรูปใหม่ทุกตัว (รูปเดิมที่ถูกบีบอัดซ้ำ — ใช้ผล parse เดิมได้)
+        ไม่มีเลย = คนละสลิปที่หน้าตาเหมือนกัน คืน None"""
+        if not near:
+            return None
+        same = next((e for e in near if e.get("text") == text), None)
+        self.stats["dhash_same" if same is not None else "dhash_diff"] += 1
+        return same
+
+    def link_file_id(self, sha: str, file_unique_id: str):
+        """ผูก file_unique_id ใหม่เข้ากับ entry เดิม (รูปเดียวกันที่ถูกส่งซ้ำ)"""
+        self.load()
+        entry = self._read(sha)
+        if entry is None or file_unique_id in entry.get("file_ids", []):
+            return
+        entry.setdefault("file_ids", []).append(file_unique_id)
+        self._by_file_id[file_unique_id] = sha
+        self._write(sha, entry)
+
+    def put(self, sha: str, text: str, trade: Optional[Dict[str, Any]],
+            file_unique_id: Optional[str] = None, dhash: Optional[int] = None,
+            patterns: Optional[str] = None) -> Dict[str, Any]:
+        self.load()
+        entry = {
+            "sha256": sha,
+            "text": text,
+            "trade": trade,
+            "patterns": patterns,
+            "file_ids": [file_unique_id] if file_unique_id else [],
+            "dhash": dhash,
+        }
+        self._remember(sha, entry)
+        self._index(sha, entry)
+        self._write(sha, entry)
+        return entry
+
+    def stats_text(self) -> str:
+        self.load()
+        s = self.stats
+        hits = s["hit_file_id"] + s["hit_sha256"]
+        total = hits + s["miss"]
+        rate = (hits / total * 100) if total else 0.0
+        return (f"OCR cache: hit={hits} ({rate:.1f}%) "
+                f"[file_id={s['hit_file_id']}, sha256={s['hit_sha256']}], "
+                f"miss={s['miss']} [dHash ใกล้รูปเดิม: ข้อความตรง={s['dhash_same']}, ต่าง={s['dhash_diff']}], "
+                f"evicted={s['evicted']}, "
+                f"entries={len(self._shas)}, "
+                f"disk={self._disk_bytes / 1024 / 1024:.1f}MB")
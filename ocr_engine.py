@@ -1,27 +1,618 @@
+from __future__ import annotations
+
 import os
 import io
-import cv2
-import pytesseract
-import numpy as np
-from PIL import Image
+import time
+import queue
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+try:
+    import resource
+except ImportError:   # Windows
+    resource = None
+
+from utils import load_config, LazyModule
+from layouts import LayoutRegistry, DIGITS, learn as learn_template
+
+logger = logging.getLogger("tradebot.ocr")
+
+# import จริงเมื่อใช้ครั้งแรก (ใน worker ของ OCR pool) — process หลักของบอท import โมดูลนี้ได้เร็ว
+cv2 = LazyModule("cv2")
+np = LazyModule("numpy")
+pytesseract = LazyModule("pytesseract")
+Image = LazyModule("PIL.Image")
 
 TESSERACT_CMD = os.getenv("TESSERACT_CMD")
-if TESSERACT_CMD:
-    pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
 
-def _preprocess(img_bgr: np.ndarray) -> np.ndarray:
-    gray = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2GRAY)
+CFG = load_config()
+
+CASCADE = {
+    "enabled": True,
+    "target_line_px": 36,
+    "passes": ["fast", "thai", "upscale", "full"],
+    **(CFG.get("ocr_cascade") or {}),
+}
+
+LIMITS = {
+    "max_bytes_mb": 20,
+    "max_pixels": 40_000_000,
+    "decode_min_side": 1000,
+    **(CFG.get("image_limits") or {}),
+}
+
+class ImageTooLarge(ValueError):
+    """ไฟล์/จำนวนพิกเซลเกิน image_limits — ปฏิเสธก่อน decode เต็มภาพ"""
+
+# ชื่อ pass → (ตัวคูณขนาดจาก target_line_px, ภาษา); "full" คือ _preprocess ทั้งภาพแบบเดิม
+PASSES = {
+    "fast": (1.0, "eng"),
+    "thai": (1.0, "tha+eng"),
+    "upscale": (1.6, "tha+eng"),
+    "full": (None, "tha+eng"),
+}
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+# ---------------- decode ----------------
+
+def image_size(data: Buffer) -> Tuple[int, int]:
+    """(กว้าง, สูง) จาก header อย่างเดียว — อ่านแค่ส่วนต้นของไฟล์ ไม่ decode พิกเซล"""
+    mv = memoryview(data)
+    chunk = 64 * 1024
+    while True:
+        try:
+            with Image.open(io.BytesIO(mv[:chunk])) as im:
+                return im.size
+        except Exception:
+            # header ยาวกว่า chunk (เช่น EXIF ใหญ่) ขยายแล้วลองใหม่ จนถึงทั้งไฟล์
+            if chunk >= len(mv):
+                raise
+            chunk *= 4
+
+def _reduce_factor(w: int, h: int) -> int:
+    """ย่อตอน decode ได้กี่เท่า (1/2/4/8) โดยด้านสั้นยังเหลือไม่น้อยกว่า decode_min_side"""
+    min_side = int(LIMITS["decode_min_side"])
+    for f in (8, 4, 2):
+        if min(w, h) // f >= min_side:
+            return f
+    return 1
+
+_REDUCED = {1: "IMREAD_GRAYSCALE", 2: "IMREAD_REDUCED_GRAYSCALE_2",
+            4: "IMREAD_REDUCED_GRAYSCALE_4", 8: "IMREAD_REDUCED_GRAYSCALE_8"}
+
+def decode_gray(data: Buffer) -> np.ndarray:
+    """decode จาก buffer ที่ดาวน์โหลดมาเป็นภาพ grayscale ก้อนเดียว (ไม่ผ่าน RGB/BytesIO)
+
+    - ตรวจขนาดไฟล์และจำนวนพิกเซลจาก header ก่อน (ImageTooLarge ถ้าเกิน image_limits)
+    - ภาพใหญ่เกินจำเป็นจะ decode แบบย่อ (JPEG ย่อใน DCT ได้เลย ไม่ต้อง decode เต็มขนาด)
+    """
+    if len(data) > float(LIMITS["max_bytes_mb"]) * 1024 * 1024:
+        raise ImageTooLarge(f"ไฟล์ใหญ่เกิน {LIMITS['max_bytes_mb']} MB")
+    w, h = image_size(data)
+    if w * h > int(LIMITS["max_pixels"]):
+        raise ImageTooLarge(f"ภาพ {w}x{h} เกิน {int(LIMITS['max_pixels']):,} พิกเซล")
+    f = _reduce_factor(w, h)
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), getattr(cv2, _REDUCED[f]))
+    if gray is None:
+        # รูปแบบที่ OpenCV อ่านไม่ได้ (เช่น GIF) ใช้ PIL แทน — draft ให้ JPEG ย่อตอน decode เช่นกัน
+        with Image.open(io.BytesIO(data)) as im:
+            im.draft("L", (w // f, h // f))
+            gray = np.asarray(im.convert("L"))
+    return gray
+
+def _rss_kb(field: str) -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    if resource is not None and field == "VmHWM":
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return 0
+
+def _reset_peak_rss():
+    """รีเซ็ต VmHWM ของ process นี้ (Linux) ให้วัด peak ต่อรูปได้; ระบบอื่นจะได้ peak สะสมแทน"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+# ---------------- preprocess ----------------
+
+def _preprocess(img: np.ndarray) -> np.ndarray:
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
     gray = cv2.resize(gray, None, fx=1.5, fy=1.5, interpolation=cv2.INTER_LINEAR)
     thr = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C,
                                 cv2.THRESH_BINARY, 35, 10)
     return thr
 
-def extract_text_from_image(image_data: io.BytesIO) -> str:
-    image = Image.open(image_data).convert("RGB")
-    img = np.array(image)[:, :, ::-1]
-    proc = _preprocess(img)
+# ---------------- หาบริเวณตัวอักษร ----------------
+
+def _text_rows(gray: np.ndarray) -> Tuple[List[Tuple[int, int, int, int]], float]:
+    """หาแถวข้อความ (x0, y0, x1, y1) บนภาพ gray และความสูงตัวอักษรโดยประมาณ (พิกเซล)
+
+    ใช้ morphological gradient + Otsu แล้วปิดช่องแนวนอนให้ตัวอักษรติดกันเป็นคำ
+    กล่องที่สูงผิดปกติ (กราฟ/รูป) หรือโปร่งเกินไปจะถูกตัดทิ้ง แล้วรวมกล่องที่อยู่ระดับเดียวกันเป็นแถว
+    """
+    h, w = gray.shape
+    f = min(1.0, 800.0 / w)
+    small = cv2.resize(gray, None, fx=f, fy=f, interpolation=cv2.INTER_AREA) if f < 1 else gray
+    grad = cv2.morphologyEx(small, cv2.MORPH_GRADIENT, cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (3, 3)))
+    _, bw = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    bw = cv2.morphologyEx(bw, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (9, 1)))
+    n, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8)
+    sh = small.shape[0]
+    boxes = []
+    for x, y, bw_, bh, area in stats[1:]:
+        if bh < 5 or bh > 0.08 * sh or area < 0.2 * bw_ * bh:
+            continue
+        boxes.append((x, y, x + bw_, y + bh))
+    if not boxes:
+        return [], 0.0
+    glyph = float(np.median([b[3] - b[1] for b in boxes])) / f
+
+    rows: List[List[int]] = []
+    for x0, y0, x1, y1 in sorted(boxes, key=lambda b: (b[1] + b[3]) / 2):
+        cy = (y0 + y1) / 2
+        if rows and rows[-1][1] <= cy <= rows[-1][3]:
+            r = rows[-1]
+            r[0], r[1], r[2], r[3] = min(r[0], x0), min(r[1], y0), max(r[2], x1), max(r[3], y1)
+        else:
+            rows.append([x0, y0, x1, y1])
+    pad = int(glyph * 0.3)
+    out = []
+    for x0, y0, x1, y1 in rows:
+        out.append((max(0, int(x0 / f) - pad), max(0, int(y0 / f) - pad),
+                    min(w, int(x1 / f) + pad), min(h, int(y1 / f) + pad)))
+    return out, glyph
+
+def _strip_scale(glyph: float, target_px: float) -> float:
+    return float(np.clip(target_px / max(glyph, 1.0), 0.4, 4.0))
+
+def _binarize(crop: np.ndarray, scale: float) -> np.ndarray:
+    """ปรับขนาดแล้วทำเป็นตัวดำพื้นขาว (กลับสีให้ถ้าเป็นธีมมืด)"""
+    crop = cv2.resize(crop, None, fx=scale, fy=scale,
+                      interpolation=cv2.INTER_CUBIC if scale > 1 else cv2.INTER_AREA)
+    _, crop = cv2.threshold(crop, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    if np.count_nonzero(crop) < crop.size / 2:
+        crop = 255 - crop
+    return crop
+
+def _stack(parts: List[np.ndarray], gap: int) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+    """วางภาพย่อยเรียงลงมาเป็นภาพเดียว คืน (ภาพ, ช่วง y ของแต่ละชิ้นในภาพรวม)"""
+    width = max(p.shape[1] for p in parts) + 2 * gap
+    strip = np.full((sum(p.shape[0] + gap for p in parts) + gap, width), 255, np.uint8)
+    spans = []
+    y = gap
+    for p in parts:
+        strip[y:y + p.shape[0], gap:gap + p.shape[1]] = p
+        spans.append((y, y + p.shape[0]))
+        y += p.shape[0] + gap
+    return strip, spans
+
+def _row_strip(gray: np.ndarray, rows, glyph: float, target_px: float) -> np.ndarray:
+    """ตัดแต่ละแถวมาเรียงต่อกันเป็นภาพเดียว ปรับขนาดให้ตัวอักษรสูงราว target_px
+    และทำเป็นตัวดำพื้นขาวทีละแถว (รองรับธีมมืด)"""
+    scale = _strip_scale(glyph, target_px)
+    parts = [_binarize(gray[y0:y1, x0:x1], scale) for x0, y0, x1, y1 in rows if y1 > y0 and x1 > x0]
+    return _stack(parts, max(4, int(target_px * 0.5)))[0]
+
+# ---------------- OCR backends ----------------
+
+class OCRBackend:
+    """interface ของตัวอ่าน OCR — รับภาพ grayscale/binary (numpy uint8) คืนข้อความ
+
+    psm=None คือให้ Tesseract วิเคราะห์ layout เอง (ค่าเริ่มต้นของ tesseract = 3)
+    whitelist = ตัวอักษรที่ยอมให้อ่านได้ (เช่น เฉพาะตัวเลขสำหรับช่องราคา)
+    image_to_data คืนรายการคำ [{"text", "left", "top", "width", "height", "conf"}] พิกัดบนภาพที่ส่งเข้าไป
+    """
+    name = "base"
+
+    def image_to_string(self, img: np.ndarray, lang: str, psm: Optional[int] = None,
+                        whitelist: Optional[str] = None) -> str:
+        raise NotImplementedError
+
+    def image_to_data(self, img: np.ndarray, lang: str, psm: Optional[int] = None,
+                      whitelist: Optional[str] = None) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def warm(self, lang: str):
+        pass
+
+    def close(self):
+        pass
+
+class PytesseractBackend(OCRBackend):
+    """เรียกโปรแกรม tesseract ทีละรูป (เขียนไฟล์ชั่วคราว + โหลด traineddata ใหม่ทุกครั้ง)"""
+    name = "pytesseract"
+
+    def __init__(self):
+        self._langs: Optional[set] = None
+
+    def _lang(self, lang: str) -> Optional[str]:
+        # ตัดภาษาที่ไม่ได้ติดตั้งออกตั้งแต่แรก แทนการลองแล้วรันซ้ำทั้งรูปเมื่อ error
+        if self._langs is None:
+            if TESSERACT_CMD:
+                pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+            try:
+                self._langs = set(pytesseract.get_languages(config=""))
+            except Exception:
+                self._langs = set()
+        if not self._langs:
+            return lang
+        ok = [l for l in lang.split("+") if l in self._langs]
+        return "+".join(ok) or None
+
+    @staticmethod
+    def _config(psm, whitelist) -> str:
+        config = f"--psm {psm}" if psm is not None else ""
+        if whitelist:
+            config += f" -c tessedit_char_whitelist={whitelist.replace(' ', '')}"
+        return config
+
+    def image_to_string(self, img, lang, psm=None, whitelist=None):
+        return pytesseract.image_to_string(img, lang=self._lang(lang), config=self._config(psm, whitelist))
+
+    def image_to_data(self, img, lang, psm=None, whitelist=None):
+        d = pytesseract.image_to_data(img, lang=self._lang(lang), config=self._config(psm, whitelist),
+                                      output_type=pytesseract.Output.DICT)
+        return [{"text": t, "left": int(d["left"][i]), "top": int(d["top"][i]), "width": int(d["width"][i]),
+                 "height": int(d["height"][i]), "conf": float(d["conf"][i])}
+                for i, t in enumerate(d["text"]) if t and t.strip()]
+
+class TesserocrBackend(OCRBackend):
+    """ใช้ libtesseract ใน process เดียวกันผ่าน tesserocr: โหลดโมเดลครั้งเดียวต่อ handle
+    ส่งภาพเป็น buffer ในหน่วยความจำ และยืม/คืน handle ผ่านคิว (thread-safe)"""
+    name = "tesserocr"
+
+    def __init__(self, handles_per_lang: int = 1, tessdata: Optional[str] = None):
+        import tesserocr
+        self._tesserocr = tesserocr
+        self.handles_per_lang = max(1, handles_per_lang)
+        self.tessdata = tessdata
+        self._pools: Dict[str, "queue.Queue"] = {}
+        self._created: Dict[str, int] = {}
+        self._all = []
+        self._lock = threading.Lock()
+
+    def _new_api(self, lang: str):
+        kw = {"lang": lang}
+        if self.tessdata:
+            kw["path"] = self.tessdata
+        api = self._tesserocr.PyTessBaseAPI(**kw)
+        with self._lock:
+            self._all.append(api)
+        return api
+
+    def _acquire(self, lang: str):
+        with self._lock:
+            pool = self._pools.setdefault(lang, queue.Queue())
+            try:
+                return pool.get_nowait()
+            except queue.Empty:
+                pass
+            if self._created.get(lang, 0) < self.handles_per_lang:
+                self._created[lang] = self._created.get(lang, 0) + 1
+                create = True
+            else:
+                create = False
+        if create:
+            try:
+                return self._new_api(lang)
+            except Exception:
+                with self._lock:
+                    self._created[lang] -= 1
+                raise
+        return pool.get()
+
+    def _release(self, lang: str, api):
+        self._pools[lang].put(api)
+
+    def warm(self, lang: str):
+        self._release(lang, self._acquire(lang))
+
+    def _run(self, img, lang, psm, whitelist, read: Callable):
+        img = np.ascontiguousarray(img)
+        api = self._acquire(lang)
+        try:
+            api.SetPageSegMode(3 if psm is None else psm)
+            if whitelist:
+                api.SetVariable("tessedit_char_whitelist", whitelist)
+            h, w = img.shape[:2]
+            bpp = 1 if img.ndim == 2 else img.shape[2]
+            api.SetImageBytes(img.tobytes(), w, h, bpp, w * bpp)
+            return read(api)
+        finally:
+            if whitelist:
+                api.SetVariable("tessedit_char_whitelist", "")
+            api.Clear()
+            self._release(lang, api)
+
+    def image_to_string(self, img, lang, psm=None, whitelist=None):
+        return self._run(img, lang, psm, whitelist, lambda api: api.GetUTF8Text())
+
+    def image_to_data(self, img, lang, psm=None, whitelist=None):
+        level = self._tesserocr.RIL.WORD
+
+        def read(api):
+            api.Recognize()
+            words = []
+            for r in self._tesserocr.iterate_level(api.GetIterator(), level):
+                text = r.GetUTF8Text(level)
+                box = r.BoundingBox(level)
+                if text and text.strip() and box:
+                    x0, y0, x1, y1 = box
+                    words.append({"text": text, "left": x0, "top": y0, "width": x1 - x0,
+                                  "height": y1 - y0, "conf": float(r.Confidence(level))})
+            return words
+        return self._run(img, lang, psm, whitelist, read)
+
+    def close(self):
+        with self._lock:
+            for api in self._all:
+                api.End()
+            self._all.clear()
+            self._pools.clear()
+            self._created.clear()
+
+def open_backend(cfg: dict = None) -> OCRBackend:
+    """เลือก backend จาก config: ocr_backend = auto | tesserocr | pytesseract
+    (auto ใช้ tesserocr ถ้าติดตั้งไว้ ไม่งั้นใช้ pytesseract)"""
+    cfg = CFG if cfg is None else cfg
+    kind = cfg.get("ocr_backend", "auto")
+    if kind in ("auto", "tesserocr"):
+        try:
+            return TesserocrBackend(int(cfg.get("ocr_handles_per_lang", 1)), os.getenv("TESSDATA_PREFIX"))
+        except ImportError:
+            if kind == "tesserocr":
+                logger.warning("ไม่พบ tesserocr — ใช้ pytesseract แทน")
+    return PytesseractBackend()
+
+_BACKEND: Optional[OCRBackend] = None
+_FALLBACK = PytesseractBackend()
+
+def get_backend() -> OCRBackend:
+    """backend ของ process นี้ (สร้างครั้งแรกที่เรียก แล้วใช้ต่อตลอดอายุ worker)"""
+    global _BACKEND
+    if _BACKEND is None:
+        _BACKEND = open_backend()
+    return _BACKEND
+
+def _call(method: str, *args):
+    backend = get_backend()
+    if isinstance(backend, PytesseractBackend):
+        return getattr(backend, method)(*args)
     try:
-        text = pytesseract.image_to_string(proc, lang="tha+eng")
+        return getattr(backend, method)(*args)
     except Exception:
-        text = pytesseract.image_to_string(proc)
+        logger.exception("%s อ่านภาพไม่สำเร็จ ใช้ pytesseract แทนสำหรับรูปนี้", backend.name)
+        return getattr(_FALLBACK, method)(*args)
+
+def _ocr(img: np.ndarray, lang: str, psm: Optional[int] = None, whitelist: Optional[str] = None) -> str:
+    return _call("image_to_string", img, lang, psm, whitelist)
+
+def _ocr_data(img: np.ndarray, lang: str, psm: Optional[int] = None,
+              whitelist: Optional[str] = None) -> List[Dict[str, Any]]:
+    return _call("image_to_data", img, lang, psm, whitelist)
+
+def _shortfall(text: str) -> int:
+    """จำนวนฟิลด์จำเป็นที่ยังขาด (0 = ใช้ได้เลย)
+    หน้า wallet (ไม่มีฟิลด์ trade เลยแต่อ่านแถวเหรียญได้หลายแถว) ถือว่าครบ"""
+    from parser_engine import parse_trade_from_text, parse_wallet_from_text
+    from pnl import REQUIRED_FIELDS, missing_fields
+    missing = len(missing_fields(parse_trade_from_text(text)))
+    if missing == len(REQUIRED_FIELDS):
+        wallet = parse_wallet_from_text(text)
+        if wallet and len(wallet["assets"]) >= 2:
+            return 0
+    return missing
+
+def _cascade(img: np.ndarray, timings: Dict[str, float],
+             shortfall: Callable[[str], int] = _shortfall, found_rows=None) -> str:
+    """ไล่ pass จากถูกไปแพง หยุดทันทีที่ได้ pair/side/price/qty ครบ; ถ้าไม่ครบเลยคืนผลที่ขาดน้อยที่สุด
+    found_rows = ผล _text_rows ที่หาไว้แล้ว (ตอนลองแม่แบบ layout) จะได้ไม่ต้องหาซ้ำ"""
+    t0 = time.perf_counter()
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    rows, glyph = found_rows if found_rows is not None else _text_rows(gray)
+    timings["preprocess"] = timings.get("preprocess", 0.0) + time.perf_counter() - t0
+    timings.setdefault("tesseract", 0.0)
+    target = float(CASCADE["target_line_px"])
+
+    best: Optional[Tuple[int, str]] = None
+    for name in CASCADE["passes"]:
+        scale, lang = PASSES[name]
+        t = time.perf_counter()
+        if scale is None:
+            proc = _preprocess(gray)
+        elif rows:
+            proc = _row_strip(gray, rows, glyph, target * scale)
+        else:
+            continue
+        timings["preprocess"] += time.perf_counter() - t
+        t = time.perf_counter()
+        # แถวถูกเรียงเป็นบล็อกเดียวแล้ว ใช้ psm 6 ข้ามการวิเคราะห์ layout ของทั้งหน้า
+        text = _ocr(proc, lang, 6 if scale is not None else None)
+        dt = time.perf_counter() - t
+        timings["tesseract"] += dt
+        timings[f"tesseract.{name}"] = dt
+        missing = shortfall(text)
+        if best is None or missing < best[0]:
+            best = (missing, text)
+        if missing == 0:
+            break
+    return best[1] if best else ""
+
+# ---------------- แม่แบบ layout ----------------
+
+_LAYOUTS: Optional[LayoutRegistry] = None
+_LAYOUTS_LOADED = False
+
+def get_layouts() -> Optional[LayoutRegistry]:
+    """แม่แบบของ process นี้ (None ถ้าปิดใน config) — เช็กไฟล์ใหม่ทุกครั้งที่เรียก (แค่ stat)"""
+    global _LAYOUTS, _LAYOUTS_LOADED
+    if not _LAYOUTS_LOADED:
+        _LAYOUTS = LayoutRegistry.from_config(CFG)
+        _LAYOUTS_LOADED = True
+    return _LAYOUTS.refresh() if _LAYOUTS else None
+
+def _read_boxes(gray: np.ndarray, boxes: List[Tuple[int, int, int, int]], glyph: float, lang: str,
+                whitelist: Optional[str] = None) -> List[str]:
+    """OCR หลายกล่องในครั้งเดียว: ครอปมาเรียงเป็นแถบเดียว อ่านแบบ image_to_data
+    แล้วแจกคำกลับให้กล่องตามตำแหน่ง y — คืนข้อความของแต่ละกล่องตามลำดับ"""
+    target = float(CASCADE["target_line_px"])
+    scale = _strip_scale(glyph, target)
+    parts = []
+    for x0, y0, x1, y1 in boxes:
+        crop = gray[y0:y1, x0:x1]
+        parts.append(_binarize(crop, scale) if crop.size else np.full((4, 4), 255, np.uint8))
+    strip, spans = _stack(parts, max(4, int(target * 0.5)))
+    texts: List[List[Tuple[int, str]]] = [[] for _ in boxes]
+    for wd in _ocr_data(strip, lang, 6, whitelist):
+        cy = wd["top"] + wd["height"] / 2
+        i = min(range(len(spans)), key=lambda k: abs((spans[k][0] + spans[k][1]) / 2 - cy))
+        texts[i].append((wd["left"], wd["text"].strip()))
+    return [" ".join(t for _, t in sorted(ws)) for ws in texts]
+
+def _page_words(gray: np.ndarray, rows, glyph: float, lang: str) -> List[Dict[str, Any]]:
+    """คำทั้งหมดบนภาพจากแถบแถวข้อความ พร้อมพิกัดบนภาพจริง (x0, y0, x1, y1) และเลขแถว line"""
+    target = float(CASCADE["target_line_px"])
+    scale = _strip_scale(glyph, target)
+    gap = max(4, int(target * 0.5))
+    rows = [r for r in rows if r[3] > r[1] and r[2] > r[0]]
+    strip, spans = _stack([_binarize(gray[y0:y1, x0:x1], scale) for x0, y0, x1, y1 in rows], gap)
+    words = []
+    for wd in _ocr_data(strip, lang, 6):
+        cy = wd["top"] + wd["height"] / 2
+        i = min(range(len(spans)), key=lambda k: abs((spans[k][0] + spans[k][1]) / 2 - cy))
+        x0, y0 = rows[i][0], rows[i][1]
+        words.append({"text": wd["text"].strip(), "line": i, "conf": wd["conf"],
+                      "x0": x0 + (wd["left"] - gap) / scale, "y0": y0 + (wd["top"] - spans[i][0]) / scale,
+                      "x1": x0 + (wd["left"] + wd["width"] - gap) / scale,
+                      "y1": y0 + (wd["top"] + wd["height"] - spans[i][0]) / scale})
+    return words
+
+def _layout_pass(gray: np.ndarray, found_rows, timings: Dict[str, float], info: Dict[str, Any],
+                 shortfall: Callable[[str], int] = _shortfall) -> Optional[str]:
+    """ลองอ่านด้วยแม่แบบที่ตรงกับภาพ: OCR เฉพาะ anchor + ช่องค่า (ช่องตัวเลขใช้ whitelist)
+    คืนข้อความมาตรฐานของแม่แบบ หรือ None ถ้าไม่มีแม่แบบไหนใช้ได้หรือค่าที่อ่านไม่ผ่าน Template.implausible
+    (ให้ไปทาง cascade)"""
+    reg = get_layouts()
+    if not reg or not reg.templates:
+        return None
+    rows, glyph = found_rows
+    h, w = gray.shape[:2]
+
+    def px(box):
+        x0, y0, x1, y1 = box
+        return (max(0, int(x0 * w)), max(0, int(y0 * h)), min(w, int(round(x1 * w))), min(h, int(round(y1 * h))))
+
+    for tpl in reg.candidates((w, h), rows, glyph):
+        t = time.perf_counter()
+        text_names = tpl.text_fields()
+        texts = _read_boxes(gray, [px(a["box"]) for a in tpl.anchors] + [px(tpl.fields[k]["box"]) for k in text_names],
+                            glyph, tpl.lang)
+        ok = tpl.anchors_ok(texts[:len(tpl.anchors)], reg.anchor_score)
+        raw = dict(zip(text_names, texts[len(tpl.anchors):]))
+        if ok and tpl.digit_fields():
+            digit_names = tpl.digit_fields()
+            raw.update(zip(digit_names, _read_boxes(gray, [px(tpl.fields[k]["box"]) for k in digit_names],
+                                                     glyph, "eng", DIGITS)))
+        dt = time.perf_counter() - t
+        timings["tesseract"] = timings.get("tesseract", 0.0) + dt
+        timings["tesseract.layout"] = timings.get("tesseract.layout", 0.0) + dt
+        if not ok:
+            continue
+        values = tpl.values(raw)
+        text = tpl.to_text(values)
+        if shortfall(text) != 0:
+            continue
+        # ครบแล้วแต่ค่าอาจอ่านพลาด (จุดทศนิยมหาย, ตัวเลขเพี้ยน) — ไม่ผ่านก็ไปทาง cascade ที่อ่านทั้งหน้า
+        reason = tpl.implausible(values, reg.quotes)
+        if reason:
+            logger.info("ไม่ใช้ผลจากแม่แบบ %s: %s", tpl.name, reason)
+            info["layout_rejected"] = reason
+            continue
+        info["layout"] = tpl.name
+        return text
+    return None
+
+def read_layout(data: Buffer, timings: Optional[Dict[str, float]] = None,
+                info: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """อ่านด้วยแม่แบบอย่างเดียว (ไม่ fallback) — ใช้ทดสอบแม่แบบ"""
+    timings = {} if timings is None else timings
+    gray = decode_gray(data)
+    return _layout_pass(gray, _text_rows(gray), timings, {} if info is None else info)
+
+def learn_layout(data: Buffer, trade: Dict[str, Any], name: Optional[str] = None) -> Optional[str]:
+    """เรียนรู้แม่แบบจากรูป + ค่าที่ผู้ใช้ยืนยันแล้ว แล้วบันทึกลง learned_dir; คืนชื่อแม่แบบ
+    (None ถ้าปิด layouts หรือโควตาเต็ม) — raise ValueError ถ้าหาตำแหน่งช่องจำเป็นไม่เจอ"""
+    from parser_engine import classify
+    reg = get_layouts()
+    if reg is None:
+        return None
+    gray = decode_gray(data)
+    rows, glyph = _text_rows(gray)
+    if not rows:
+        raise ValueError("ไม่พบแถวข้อความในภาพ")
+    words = _page_words(gray, rows, glyph, "tha+eng")
+    route = classify(" ".join(wd["text"] for wd in words))
+    tpl = learn_template(words, trade, (gray.shape[1], gray.shape[0]), glyph, rows,
+                         exchange=trade.get("exchange") or route.exchange, slip_type=route.slip_type, name=name)
+    return tpl.name if reg.save(tpl) else None
+
+def _extract(data: Buffer, timings: Optional[Dict[str, float]] = None,
+             info: Optional[Dict[str, Any]] = None) -> str:
+    timings = {} if timings is None else timings
+    info = {} if info is None else info
+    t0 = time.perf_counter()
+    gray = decode_gray(data)
+    timings["decode"] = time.perf_counter() - t0
+    if CASCADE.get("enabled", True):
+        t0 = time.perf_counter()
+        found_rows = _text_rows(gray)
+        timings["preprocess"] = time.perf_counter() - t0
+        text = _layout_pass(gray, found_rows, timings, info)
+        if text is not None:
+            return text
+        return _cascade(gray, timings, found_rows=found_rows)
+    t1 = time.perf_counter()
+    proc = _preprocess(gray)
+    t2 = time.perf_counter()
+    text = _ocr(proc, "tha+eng")
+    timings.update({"preprocess": t2 - t1, "tesseract": time.perf_counter() - t2})
     return text
+
+def extract_text_from_image(image_data: io.BytesIO) -> str:
+    return _extract(image_data.getbuffer())
+
+def init_worker():
+    """ใช้เป็น initializer ของ process pool: ให้ 1 process ใช้ 1 core
+    (ไม่งั้น Tesseract/OpenCV จะแตก thread ซ้อนกันจนช้าลงเมื่อรันหลาย worker)"""
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    cv2.setNumThreads(1)
+    # โหลดโมเดลของ pass แรกไว้ก่อน งานแรกของ worker จะได้ไม่ต้องรอ
+    try:
+        get_backend().warm(PASSES[CASCADE["passes"][0]][1] if CASCADE.get("enabled", True) else "tha+eng")
+    except Exception:
+        logger.exception("เตรียม OCR backend ไม่สำเร็จ")
+
+def extract_text_from_bytes(data: Buffer) -> str:
+    """ใช้ใน worker process ของ OCR pool (bytes ส่งข้าม process ได้ ต่างจาก BytesIO)"""
+    return _extract(data)
+
+def extract_text_timed(data: Buffer) -> Tuple[str, Dict[str, float], Dict[str, Any]]:
+    """เหมือน extract_text_from_bytes แต่คืนเวลาของแต่ละขั้น (decode/preprocess/tesseract)
+    และหน่วยความจำของ worker ระหว่างอ่านรูปนี้ (peak_rss_mb) กับชื่อแม่แบบ layout ที่ใช้ (layout, None = ทาง cascade)
+    — ส่งกลับให้ process หลักบันทึก"""
+    timings: Dict[str, float] = {}
+    info: Dict[str, Any] = {}
+    _reset_peak_rss()
+    text = _extract(data, timings, info)
+    mem = {"peak_rss_mb": _rss_kb("VmHWM") / 1024, "rss_mb": _rss_kb("VmRSS") / 1024,
+           "layout": info.get("layout")}
+    return text, timings, mem
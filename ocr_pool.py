@@ -0,0 +1,176 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, Optional, Set
+
+logger = logging.getLogger("tradebot.ocr_pool")
+
+class OCRQueueFull(Exception):
+    """คิว OCR เต็ม (เกิน max_queue) — ให้ผู้ใช้ส่งใหม่ภายหลัง"""
+
+class OCRTimeout(Exception):
+    """งาน OCR ใช้เวลานานเกิน timeout_sec"""
+
+def _consume(fut: asyncio.Future) -> None:
+    # ผลของงานที่ไม่มีใครรอแล้ว (timeout/ถูกยกเลิก) — อ่าน exception ทิ้ง ไม่ให้ asyncio เตือน "never retrieved"
+    if not fut.cancelled():
+        fut.exception()
+
+def _terminate(pool: ProcessPoolExecutor) -> None:
+    """ฆ่า process ทั้งหมดของ pool (ProcessPoolExecutor ไม่มีวิธียกเลิกงานที่รันอยู่) แล้วปิด pool"""
+    for proc in list((getattr(pool, "_processes", None) or {}).values()):
+        if proc.is_alive():
+            proc.terminate()
+    pool.shutdown(wait=False, cancel_futures=True)
+
+class OCRExecutor:
+    """รัน OCR ใน ProcessPoolExecutor เพื่อไม่ให้ block event loop ของบอท
+
+    - จำนวนงานที่รันพร้อมกัน = workers (ค่าเริ่มต้นเท่าจำนวน core)
+    - งานที่รอคิวได้ไม่เกิน max_queue งาน เกินนั้นจะ raise OCRQueueFull
+    - timeout นับเฉพาะตอนรันจริง ไม่นับเวลารอคิว; งานที่เกิน timeout ทำให้ pool ถูกเปลี่ยนใหม่
+      และ process ของ pool เดิม (รวมตัวที่ค้าง) ถูกฆ่าเมื่องานอื่นใน pool นั้นจบ
+    """
+
+    def __init__(self, workers: int = 0, max_queue: int = 32, timeout: float = 30.0,
+                 initializer: Optional[Callable[[], None]] = None, prestart: bool = True):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.initializer = initializer
+        self.prestart = prestart
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._running = 0
+        self._waiting = 0
+        self._inflight: Dict[ProcessPoolExecutor, Set[Future]] = {}   # งานที่ส่งเข้าแต่ละ pool แล้วยังไม่จบ
+        self._retiring: Dict[ProcessPoolExecutor, asyncio.Future] = {}  # pool เก่าที่รอฆ่า process
+
+    @classmethod
+    def from_config(cls, cfg: dict, initializer: Optional[Callable[[], None]] = None) -> "OCRExecutor":
+        c = cfg.get("ocr_pool") or {}
+        return cls(
+            workers=int(c.get("workers") or 0),
+            max_queue=int(c.get("max_queue", 32)),
+            timeout=float(c.get("timeout_sec", 30)),
+            initializer=initializer,
+            prestart=bool(c.get("prestart", True)),
+        )
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    @property
+    def waiting(self) -> int:
+        return self._waiting
+
+    def _ensure_started(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+
+    async def warm(self) -> None:
+        """เริ่ม worker ทุกตัว (fork + initializer โหลดโมเดล) ล่วงหน้า — รูปแรกจะได้ไม่ต้องรอ worker เริ่ม"""
+        self._ensure_started()
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self._pool, os.getpid) for _ in range(self.workers)))
+
+    async def run(self, fn: Callable[..., Any], *args,
+                  on_queued: Optional[Callable[[int], Awaitable[None]]] = None) -> Any:
+        """ส่งงานเข้า pool แล้วรอผล; ถ้าต้องรอคิวจะเรียก on_queued(ลำดับคิว) ก่อน"""
+        self._ensure_started()
+        queued = False
+        if self._slots.locked():
+            if self._waiting >= self.max_queue:
+                raise OCRQueueFull()
+            self._waiting += 1
+            queued = True
+            if on_queued:
+                await on_queued(self._waiting)
+        try:
+            await self._slots.acquire()
+        finally:
+            if queued:
+                self._waiting -= 1
+        slots = self._slots
+        self._running += 1
+        release = True
+        pool = self._pool
+        try:
+            cfut = pool.submit(fn, *args)
+            self._inflight.setdefault(pool, set()).add(cfut)
+            cfut.add_done_callback(lambda f, pool=pool: self._inflight.get(pool, set()).discard(f))
+            result = asyncio.wrap_future(cfut)
+            try:
+                return await asyncio.wait_for(asyncio.shield(result), self.timeout)
+            except asyncio.TimeoutError:
+                # ยกเลิกงานที่รันอยู่ใน process ไม่ได้ — เลิกใช้ pool นี้แล้วฆ่า worker ของมัน (แบบเดียวกับตอน pool พัง)
+                # ไม่งั้น worker ที่ค้าง (เช่น tesseract วนไม่จบกับภาพแปลก ๆ) จะกิน slot ไปตลอด
+                if not cfut.cancel():
+                    result.add_done_callback(_consume)
+                    self._recycle(pool, "OCR เกิน timeout", hung=cfut)
+                raise OCRTimeout(f"OCR เกิน {self.timeout:.0f} วินาที")
+            except asyncio.CancelledError:
+                # ผู้รอถูกยกเลิก (เช่นบอทหยุด) แต่งานยังรันอยู่ — คืน slot ตอนงานจบจริง
+                if not cfut.cancel():
+                    release = False
+                    result.add_done_callback(_consume)
+                    cfut.add_done_callback(self._release_later(slots))
+                raise
+        except BrokenProcessPool:
+            self._recycle(pool, "OCR worker ตาย")
+            raise
+        finally:
+            if release:
+                self._done(slots)
+
+    def _recycle(self, pool: ProcessPoolExecutor, reason: str, hung: Optional[Future] = None) -> None:
+        """เลิกใช้ pool นี้: งานใหม่ไปลง pool ใหม่ทันที, งานอื่นที่ยังรันอยู่ใน pool เดิมรันต่อจนจบ
+        (ไม่เกิน timeout) แล้วจึงฆ่า process ทั้งหมดของ pool เดิม (รวมตัวที่ค้าง)"""
+        if self._pool is not pool:
+            return   # มีงานอื่นเปลี่ยน pool ไปแล้ว
+        logger.error("%s สร้าง OCR pool ใหม่", reason)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer)
+        others = [asyncio.wrap_future(f) for f in list(self._inflight.pop(pool, ())) if f is not hung and not f.done()]
+        for fut in others:
+            fut.add_done_callback(_consume)
+        task = asyncio.ensure_future(self._retire(pool, others))
+        self._retiring[pool] = task
+        task.add_done_callback(lambda _: self._retiring.pop(pool, None))
+
+    async def _retire(self, pool: ProcessPoolExecutor, others) -> None:
+        try:
+            if others:
+                await asyncio.wait(others, timeout=self.timeout)
+        finally:
+            _terminate(pool)
+
+    def _done(self, slots: asyncio.Semaphore) -> None:
+        self._running -= 1
+        slots.release()
+
+    def _release_later(self, slots: asyncio.Semaphore) -> Callable[[Any], None]:
+        """callback ของ future ใน pool (เรียกจาก thread ของ pool) — คืน slot ใน event loop"""
+        loop = asyncio.get_running_loop()
+
+        def callback(_):
+            try:
+                loop.call_soon_threadsafe(self._done, slots)
+            except RuntimeError:
+                pass  # loop ปิดไปแล้ว (บอทหยุด)
+        return callback
+
+    def shutdown(self, wait: bool = True):
+        for pool, task in list(self._retiring.items()):
+            task.cancel()
+            _terminate(pool)
+        self._retiring.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=wait, cancel_futures=True)
+            self._pool = None
+        self._inflight.clear()
+        self._slots = None
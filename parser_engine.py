@@ -1,33 +1,103 @@
 import re
+import hashlib
 import yaml
-from typing import Dict, Any
-
-# โหลด patterns และ config
-with open("parser_patterns.yaml", "r", encoding="utf-8") as f:
-    PAT = yaml.safe_load(f)
-
-try:
-    with open("config.yaml", "r", encoding="utf-8") as f:
-        CFG = yaml.safe_load(f)
-except FileNotFoundError:
-    CFG = {}
-
-def _first_match(patterns, text, group_name):
-    """คืนค่ากลุ่มที่ต้องการจากลิสต์เรกซ์เพรสชันแรกที่เจอ"""
-    for pat in (patterns or []):
-        m = re.search(pat, text, flags=re.IGNORECASE | re.MULTILINE)
-        if m and group_name in (m.groupdict() or {}):
-            g = m.group(group_name)
-            if g is not None and g != "":
-                return str(g).strip()
-    return None
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+from classifier import SlipClassifier, Router, Classification
+from utils import load_config, config_path
+
+PATTERNS_PATH = "parser_patterns.yaml"
+_FLAGS = re.IGNORECASE | re.MULTILINE
+
+CFG = load_config()
+
+class PatternRegistry:
+    """pattern ทั้งหมดจาก parser_patterns.yaml คอมไพล์ไว้ครั้งเดียวต่อไฟล์"""
+
+    def __init__(self, raw: Dict[str, Any], version: str = ""):
+        self.raw = raw or {}
+        self.version = version
+        self.families: Dict[str, List[re.Pattern]] = {
+            name: [re.compile(p, _FLAGS) for p in pats]
+            for name, pats in self.raw.items() if isinstance(pats, list)
+        }
+        # wallet อ่านทีละบรรทัด ไม่ใช้ MULTILINE
+        self.wallet_rows = [re.compile(p, re.IGNORECASE) for p in (self.raw.get("wallet_row_patterns") or [])]
+        self.classifier = SlipClassifier(CFG.get("exchange_keywords") or {}, self.raw.get("slip_type_keywords") or {})
+        self.router = Router(self.raw.get("routes"), self.raw.get("pattern_sets"))
+        self.router.validate(self.families)
+
+    @classmethod
+    def load(cls, path: str = PATTERNS_PATH) -> "PatternRegistry":
+        with open(config_path(path), "rb") as f:
+            data = f.read()
+        return cls(yaml.safe_load(data.decode("utf-8")), version=hashlib.sha1(data).hexdigest()[:12])
+
+    def classify(self, text: str) -> Classification:
+        return self.classifier.classify(text)
+
+    def scan(self, text: str, route: Classification = None) -> "SlipMatches":
+        families = self.router.families(route.exchange, route.slip_type) if route else None
+        return SlipMatches(self, text, families)
+
+class SlipMatches:
+    """ผลการสแกนข้อความหนึ่งสลิป — แต่ละ pattern ถูก search ครั้งเดียว แล้วทุกฟิลด์ใช้ผลร่วมกัน
+    families = family ที่ route อนุญาต (None = ทุก family); family อื่นถือว่าไม่พบโดยไม่ search"""
+
+    def __init__(self, registry: PatternRegistry, text: str, families: Optional[frozenset] = None):
+        self._reg = registry
+        self._text = text
+        self._allowed = families
+        self._groups: Dict[str, Dict[str, str]] = {}
+
+    def groups(self, family: str) -> Dict[str, str]:
+        """named group ทั้งหมดของ family; แต่ละกลุ่มเอาค่าจาก pattern แรกที่จับได้ (ไม่ว่าง)"""
+        out = self._groups.get(family)
+        if out is None:
+            out = {}
+            if self._allowed is not None and family not in self._allowed:
+                self._groups[family] = out
+                return out
+            for rx in self._reg.families.get(family, ()):
+                m = rx.search(self._text)
+                if not m:
+                    continue
+                for k, v in m.groupdict().items():
+                    if v is not None and v != "" and k not in out:
+                        out[k] = str(v).strip()
+            self._groups[family] = out
+        return out
+
+    def get(self, family: str, group_name: str) -> Optional[str]:
+        return self.groups(family).get(group_name)
+
+_REGISTRY: Optional[PatternRegistry] = None
+
+def registry() -> PatternRegistry:
+    """ชุด pattern ปัจจุบัน — คอมไพล์ครั้งแรกที่ใช้ (import parser_engine เองไม่ต้องอ่าน yaml)"""
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = PatternRegistry.load(PATTERNS_PATH)
+    return _REGISTRY
+
+def reload_patterns(path: str = None) -> PatternRegistry:
+    """โหลด parser_patterns.yaml ใหม่ระหว่างรัน — คอมไพล์เสร็จก่อนแล้วค่อยสลับ
+    ถ้าไฟล์ใหม่มี regex ผิดจะ raise ออกไปและยังใช้ชุดเดิมต่อ"""
+    global _REGISTRY
+    reg = PatternRegistry.load(path or PATTERNS_PATH)
+    _REGISTRY = reg
+    return reg
+
+def patterns_version() -> str:
+    return registry().version
+
+def classify(text: str) -> Classification:
+    """exchange + ชนิดสลิป (อ่านข้อความรอบเดียว) — ส่งต่อให้ parse_trade_from_text เพื่อใช้ pattern เฉพาะ route"""
+    return registry().classify(text)
 
 def guess_exchange(text: str) -> str:
-    t = text.lower()
-    for ex, keys in (CFG.get("exchange_keywords") or {}).items():
-        if any(k.lower() in t for k in keys):
-            return ex
-    return "unknown"
+    return registry().classify(text).exchange
 
 def _normalize_pair(text_pair: str, base_only: str = None, quote: str = None):
     if text_pair:
@@ -41,6 +111,23 @@ def _normalize_pair(text_pair: str, base_only: str = None, quote: str = None):
         return f"{base_only.upper()}/USDT"
     return None
 
+_TIME = re.compile(r"(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})[T\s]+(\d{1,2}):(\d{2})(?::(\d{2}))?")
+
+def parse_time(text) -> Optional[datetime]:
+    """เวลาในสลิป/ที่ผู้ใช้แก้ (เช่น 2024-01-05 09:30:00, 2024/1/5 9:30, ISO) → datetime; None ถ้าอ่านไม่ได้"""
+    m = _TIME.search(str(text or ""))
+    if not m:
+        return None
+    try:
+        return datetime(*(int(g or 0) for g in m.groups()))
+    except ValueError:
+        return None
+
+def normalize_time(text) -> Optional[str]:
+    """เวลาในรูปแบบเดียวกันทุกสลิป (YYYY-MM-DD HH:MM:SS); อ่านไม่ได้คืนข้อความเดิม"""
+    dt = parse_time(text)
+    return dt.strftime("%Y-%m-%d %H:%M:%S") if dt else text
+
 def _num(x):
     if x is None:
         return None
@@ -51,24 +138,27 @@ def _num(x):
 
 # ---------------- Trade parser ----------------
 
-def parse_trade_from_text(text: str) -> Dict[str, Any] | None:
-    """พยายามตีความเป็น “trade” ก่อน ถ้าได้จะคืน dict ของ trade"""
+def parse_trade_from_text(text: str, route: Classification = None) -> Dict[str, Any] | None:
+    """พยายามตีความเป็น “trade” ก่อน ถ้าได้จะคืน dict ของ trade
+    route = ผลจาก classify(text); ถ้าไม่ส่งมาจะ classify ให้เอง"""
+    reg = registry()
+    m = reg.scan(text, route or reg.classify(text))
 
     # ----- 1) Binance Convert slips -----
-    qty       = _first_match(PAT.get("convert_receive_patterns", []), text, "qty")
-    base      = _first_match(PAT.get("convert_receive_patterns", []), text, "base")
+    qty       = m.get("convert_receive_patterns", "qty")
+    base      = m.get("convert_receive_patterns", "base")
 
-    inv_p     = _first_match(PAT.get("convert_inverse_price_patterns", []), text, "price")
-    inv_q     = _first_match(PAT.get("convert_inverse_price_patterns", []), text, "quote")
+    inv_p     = m.get("convert_inverse_price_patterns", "price")
+    inv_q     = m.get("convert_inverse_price_patterns", "quote")
 
-    dir_units = _first_match(PAT.get("convert_direct_price_patterns", []), text, "units")  # units BASE per 1 QUOTE
-    dir_quote = _first_match(PAT.get("convert_direct_price_patterns", []), text, "quote")
+    dir_units = m.get("convert_direct_price_patterns", "units")  # units BASE per 1 QUOTE
+    dir_quote = m.get("convert_direct_price_patterns", "quote")
 
-    tx_quote  = _first_match(PAT.get("convert_tx_amount_patterns", []), text, "quote")
-    from_amt  = _first_match(PAT.get("convert_from_amount_patterns", []), text, "amount")
-    from_q    = _first_match(PAT.get("convert_from_amount_patterns", []), text, "quote")
+    tx_quote  = m.get("convert_tx_amount_patterns", "quote")
+    from_amt  = m.get("convert_from_amount_patterns", "amount")
+    from_q    = m.get("convert_from_amount_patterns", "quote")
 
-    ttime     = _first_match(PAT.get("time_patterns", []), text, "time")
+    ttime     = normalize_time(m.get("time_patterns", "time"))
 
     # Inverse line: "Inverse Price 1 CRV = 0.00000741 BTC"
     if qty and base and (inv_p and (inv_q or tx_quote)):
@@ -104,17 +194,17 @@ def parse_trade_from_text(text: str) -> Dict[str, Any] | None:
         }
 
     # ----- 2) Generic single filled slips (เช่น SOL/BTC Spot) -----
-    pair       = _first_match(PAT.get("pair_patterns", []), text, "pair")
-    base_only  = _first_match(PAT.get("pair_patterns", []), text, "base")
-    side_raw   = _first_match(PAT.get("side_patterns", []), text, "side")
-    price      = _first_match(PAT.get("price_patterns", []), text, "price")
-    qty_val    = _first_match(PAT.get("qty_patterns", []), text, "qty")
-    fee        = _first_match(PAT.get("fee_patterns", []), text, "fee")
-    fee_asset  = _first_match(PAT.get("fee_patterns", []), text, "fee_asset")
-    ttime      = ttime or _first_match(PAT.get("time_patterns", []), text, "time")
-
-    total_amt  = _first_match(PAT.get("total_patterns", []), text, "total")
-    total_q    = _first_match(PAT.get("total_quote_patterns", []), text, "quote")
+    pair       = m.get("pair_patterns", "pair")
+    base_only  = m.get("pair_patterns", "base")
+    side_raw   = m.get("side_patterns", "side")
+    price      = m.get("price_patterns", "price")
+    qty_val    = m.get("qty_patterns", "qty")
+    fee        = m.get("fee_patterns", "fee")
+    fee_asset  = m.get("fee_patterns", "fee_asset")
+    ttime      = ttime or m.get("time_patterns", "time")
+
+    total_amt  = m.get("total_patterns", "total")
+    total_q    = m.get("total_quote_patterns", "quote")
 
     side = None
     if side_raw:
@@ -143,9 +233,10 @@ def parse_trade_from_text(text: str) -> Dict[str, Any] | None:
 def parse_wallet_from_text(text: str):
     """อ่านหน้า Wallet list ถ้าพบอย่างน้อย 1 บรรทัด ให้คืนรายการ"""
     assets = []
+    rows = registry().wallet_rows
     for line in [l.strip() for l in text.splitlines()]:
-        for pat in (PAT.get("wallet_row_patterns", []) or []):
-            m = re.search(pat, line, flags=re.IGNORECASE)
+        for rx in rows:
+            m = rx.search(line)
             if m:
                 sym = (m.group("asset") or "").upper()
                 qty = _num(m.group("qty"))
@@ -159,8 +250,8 @@ def parse_wallet_from_text(text: str):
 
 # ---------------- Entry point ----------------
 
-def parse_from_text(text: str):
-    trade = parse_trade_from_text(text)
+def parse_from_text(text: str, route: Classification = None):
+    trade = parse_trade_from_text(text, route)
     if trade:
         return {"kind": "trade", "data": trade}
     wallet = parse_wallet_from_text(text)
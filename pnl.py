@@ -1,44 +1,165 @@
+import math
+import metrics
 from storage import TradeStorage
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
+
+REQUIRED_FIELDS = ["pair","side","price","qty"]
+INVALID_SIDE = "Side ไม่ถูกต้อง (ควรเป็น BUY/SELL)"
+ALREADY_RECORDED = "ดีลนี้ถูกบันทึกไว้แล้ว"
+
+def missing_fields(trade: Dict[str, Any]) -> List[str]:
+    return [k for k in REQUIRED_FIELDS if not trade.get(k)]
+
+_SIDES = {"BUY": "BUY", "ซื้อ": "BUY", "SELL": "SELL", "ขาย": "SELL"}
+
+def clean_trade(trade: Dict[str, Any]) -> Dict[str, Any]:
+    """ตรวจและแปลงค่าที่ผู้ใช้แก้มา (JSON) ก่อนลง journal: pair เป็นตัวพิมพ์ใหญ่, side เป็น BUY/SELL,
+    price/qty เป็นเลขมากกว่า 0, fee เป็นเลขไม่ติดลบ — ช่องที่ยังว่างปล่อยไว้ (ตอบ "ข้อมูลไม่พอ" ตามเดิม)
+    raise ValueError ถ้าค่าใช้ไม่ได้ (ลงไปแล้ว applier จะลงไม่ได้ตลอดไป)"""
+    out = dict(trade)
+    if out.get("pair"):
+        if not isinstance(out["pair"], str):
+            raise ValueError(f"pair ไม่ถูกต้อง: {out['pair']!r}")
+        out["pair"] = out["pair"].strip().upper().replace(" ", "")
+    if out.get("side"):
+        side = _SIDES.get(str(out["side"]).strip().upper())
+        if side is None:
+            raise ValueError(INVALID_SIDE)
+        out["side"] = side
+    for k in ("price", "qty", "fee"):
+        v = out.get(k)
+        if v is None or v == "":
+            continue
+        if isinstance(v, bool):
+            raise ValueError(f"{k} ต้องเป็นตัวเลข: {v!r}")
+        try:
+            num = float(str(v).replace(",", ""))
+        except ValueError:
+            raise ValueError(f"{k} ต้องเป็นตัวเลข: {v!r}") from None
+        if not math.isfinite(num) or num < 0 or (k != "fee" and num == 0):
+            raise ValueError(f"{k} ต้องมากกว่า 0: {v!r}" if k != "fee" else f"fee ติดลบไม่ได้: {v!r}")
+        out[k] = num
+    return out
+
+def _missing_msg(missing: List[str]) -> str:
+    return f"ข้อมูลไม่พอ: {', '.join(missing)} — โปรดพิมพ์แก้ไขเป็น JSON แล้วพิมพ์ 'ok' อีกครั้ง"
+
+
+def accepted_msg(trade: Dict[str, Any]) -> str:
+    """ข้อความตอบทันทีเมื่อดีลลง journal แล้ว (ผลจริงตามมาเมื่อ ledger อัปเดตเสร็จ)"""
+    missing = missing_fields(trade)
+    if missing:
+        return _missing_msg(missing)
+    return f"รับ {trade['side']} {trade['pair']} qty={trade['qty']} ที่ {trade['price']} แล้ว ✅ กำลังอัปเดต position…"
 
 class PnLEngine:
     def __init__(self, storage: TradeStorage):
         self.storage = storage
 
-    def record_trade(self, trade: Dict[str, Any]) -> str:
-        required = ["pair","side","price","qty"]
-        missing = [k for k in required if not trade.get(k)]
-        if missing:
-            return f"ข้อมูลไม่พอ: {', '.join(missing)} — โปรดพิมพ์แก้ไขเป็น JSON แล้วพิมพ์ 'ok' อีกครั้ง"
-
+    @staticmethod
+    def _apply(trade: Dict[str, Any], position_qty: float, avg_cost: float
+               ) -> Optional[Tuple[float, float, Optional[Dict[str, Any]], str]]:
+        """คำนวณผลของดีลเดียวบน position (ยังไม่เขียน storage)
+        คืน (qty ใหม่, avg_cost ใหม่, realized หรือ None, ข้อความตอบกลับ) หรือ None ถ้า side ไม่ถูกต้อง"""
         pair = trade["pair"]
         side = trade["side"]
         price = float(trade["price"])
         qty = float(trade["qty"])
         fee = float(trade.get("fee") or 0.0)
 
-        self.storage.record_trade(trade)
-
-        pos = self.storage.get_position(pair)
-        position_qty = float(pos.get("position_qty") or 0.0)
-        avg_cost = float(pos.get("avg_cost") or 0.0)
-
         if side == "BUY":
             new_qty = position_qty + qty
             new_avg = ((position_qty * avg_cost) + (qty * price)) / new_qty if new_qty > 0 else price
-            self.storage.upsert_position(pair, new_qty, new_avg)
-            return f"บันทึก BUY {pair} qty={qty} ที่ {price} สำเร็จ ✅\nposition: qty={new_qty:.6f}, avg_cost={new_avg:.6f}"
+            return new_qty, new_avg, None, f"บันทึก BUY {pair} qty={qty} ที่ {price} สำเร็จ ✅\nposition: qty={new_qty:.6f}, avg_cost={new_avg:.6f}"
 
-        elif side == "SELL":
+        if side == "SELL":
             sell_qty = min(qty, position_qty)
             realized = (price - avg_cost) * sell_qty - fee
-            self.storage.record_realized(pair, sell_qty, avg_cost, price, fee, realized, trade.get("src_image_id"))
             new_qty = position_qty - sell_qty
             new_avg = avg_cost if new_qty > 0 else 0.0
-            self.storage.upsert_position(pair, new_qty, new_avg)
             extra = ""
             if qty > position_qty:
                 extra = f"\n*หมายเหตุ*: ปริมาณขาย ({qty}) > position ({position_qty}), ระบบตัดขายเท่าที่มีคือ {sell_qty}"
-            return f"บันทึก SELL {pair} qty={sell_qty} ที่ {price} สำเร็จ ✅\nrealized P&L = {realized:.6f}{extra}\nposition: qty={new_qty:.6f}, avg_cost={new_avg:.6f}"
+            row = {"pair": pair, "qty": sell_qty, "avg_cost_used": avg_cost, "sell_price": price, "fee": fee,
+                   "pnl": realized, "src_image_id": trade.get("src_image_id"), "ts_iso": trade.get("ts_iso")}
+            return new_qty, new_avg, row, f"บันทึก SELL {pair} qty={sell_qty} ที่ {price} สำเร็จ ✅\nrealized P&L = {realized:.6f}{extra}\nposition: qty={new_qty:.6f}, avg_cost={new_avg:.6f}"
+
+        return None
+
+    def record_trade(self, trade: Dict[str, Any]) -> str:
+        with metrics.timed("record_trade"):
+            return self._record_trade(trade)
+
+    def _record_trade(self, trade: Dict[str, Any]) -> str:
+        missing = missing_fields(trade)
+        if missing:
+            return _missing_msg(missing)
+
+        pair = trade["pair"]
+        # trade, realized และ position ต้องลงพร้อมกัน (backend ที่รองรับจะทำใน transaction เดียว)
+        with self.storage.transaction():
+            self.storage.record_trade(trade)
+
+            pos = self.storage.get_position(pair)
+            res = self._apply(trade, float(pos.get("position_qty") or 0.0), float(pos.get("avg_cost") or 0.0))
+            if res is None:
+                return INVALID_SIDE
+            new_qty, new_avg, realized, msg = res
+            if realized:
+                r = realized
+                self.storage.record_realized(pair, r["qty"], r["avg_cost_used"], r["sell_price"], r["fee"], r["pnl"], r["src_image_id"],
+                                             ts_iso=r["ts_iso"])
+            self.storage.upsert_position(pair, new_qty, new_avg)
+            return msg
+
+    def record_trades(self, trades: List[Dict[str, Any]]) -> List[str]:
+        """บันทึกหลายดีลตามลำดับที่ให้มา (เช่น อัลบั้มรูปที่เรียงตามเวลาแล้ว) ใน transaction เดียว
+
+        อ่าน position ครั้งเดียวต่อคู่ คำนวณต่อกันในหน่วยความจำ แล้วเขียน trades / realized
+        เป็นชุดเดียว และ upsert position ครั้งเดียวต่อคู่; คืนข้อความตอบกลับของแต่ละดีลตามลำดับเดิม
+        """
+        with metrics.timed("record_trades"):
+            msgs: List[str] = []
+            accepted: List[Dict[str, Any]] = []
+            realized_rows: List[Dict[str, Any]] = []
+            positions: Dict[str, Tuple[float, float]] = {}
+            with self.storage.transaction():
+                for trade in trades:
+                    missing = missing_fields(trade)
+                    if missing:
+                        msgs.append(_missing_msg(missing))
+                        continue
+                    # เหมือน record_trade: ดีลที่ side ผิดก็ยังถูกบันทึกลง trades
+                    accepted.append(trade)
+                    pair = trade["pair"]
+                    if pair not in positions:
+                        pos = self.storage.get_position(pair)
+                        positions[pair] = (float(pos.get("position_qty") or 0.0), float(pos.get("avg_cost") or 0.0))
+                    res = self._apply(trade, *positions[pair])
+                    if res is None:
+                        msgs.append(INVALID_SIDE)
+                        continue
+                    new_qty, new_avg, realized, msg = res
+                    positions[pair] = (new_qty, new_avg)
+                    if realized:
+                        realized_rows.append(realized)
+                    msgs.append(msg)
+                self.storage.record_trades(accepted)
+                if realized_rows:
+                    self.storage.record_realized_rows(realized_rows)
+                for pair, (qty, avg) in positions.items():
+                    self.storage.upsert_position(pair, qty, avg)
+            return msgs
+
+    def recover_trades(self, trades: List[Dict[str, Any]]) -> List[str]:
+        """เหมือน record_trades แต่ข้ามดีลที่อยู่ใน trades แล้ว (ลงไปก่อนโปรแกรมหยุดกลางคัน)
 
-        return "Side ไม่ถูกต้อง (ควรเป็น BUY/SELL)"
+        ถ้าเจอดีลแบบนั้น position/realized ของรอบก่อนอาจลงไม่ครบ จึงคำนวณใหม่ทั้งหมดจาก trades ด้วย replay
+        """
+        done = self.storage.recorded(trades)
+        msgs = iter(self.record_trades([t for t, d in zip(trades, done) if not d]))
+        out = [ALREADY_RECORDED if d else next(msgs) for d in done]
+        if any(done):
+            from replay import replay
+            replay(self.storage)
+        return out
@@ -0,0 +1,242 @@
+"""คำนวณ positions และ realized P&L ใหม่ทั้งหมดจาก trades (เช่น หลังแก้ trades.csv หรือแก้ผล OCR ผิด)
+
+ทำงานเป็นคอลัมน์ด้วย pandas/NumPy ทีละทุกคู่เหรียญพร้อมกัน แทนการเรียก record_trade ทีละแถว
+รองรับ cost_policy: average_cost (เหมือน PnLEngine) และ fifo
+
+    python replay.py [--policy fifo] [--dry-run]
+"""
+import os
+import argparse
+import logging
+from datetime import datetime, timezone
+from typing import Dict, Any, Tuple
+
+import numpy as np
+import pandas as pd
+
+from storage import TradeStorage, CSVBackend, TRADE_HEADERS, CFG
+
+logger = logging.getLogger("tradebot.replay")
+
+POLICIES = ("average_cost", "fifo")
+
+# ช่วงของ log(ตัวคูณ) ต่อบล็อก — กัน exp() overflow/underflow เมื่อ position เปิดค้างนานมาก
+_LOG_BLOCK = 500.0
+
+def load_trades(storage: TradeStorage, chunk_size: int = 200_000) -> pd.DataFrame:
+    """โหลด trades ตามลำดับที่บันทึก (ลำดับนี้คือลำดับที่ PnLEngine ใช้คำนวณจริง)"""
+    be = storage.backend
+    if isinstance(be, CSVBackend):
+        path = be._path("trades.csv")
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=TRADE_HEADERS)
+        df = pd.read_csv(path, dtype=str, keep_default_na=False)
+    else:
+        frames = [pd.DataFrame.from_records(c, columns=TRADE_HEADERS) for c in be.iter_rows("trades", chunk_size)]
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=TRADE_HEADERS)
+    return df
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    out = pd.DataFrame({
+        "ts_iso": df["ts_iso"].fillna("").astype(str).to_numpy(),
+        "pair": df["pair"].fillna("").astype(str).to_numpy(),
+        "side": df["side"].fillna("").astype(str).str.upper().to_numpy(),
+        "price": pd.to_numeric(df["price"], errors="coerce").to_numpy(),
+        "qty": pd.to_numeric(df["qty"], errors="coerce").to_numpy(),
+        "fee": pd.to_numeric(df["fee"], errors="coerce").fillna(0.0).to_numpy(),
+        "src_image_id": df["src_image_id"].to_numpy(),
+    })
+    # แถวที่ record_trade จะไม่นำไปคิด position
+    ok = out["side"].isin(["BUY", "SELL"]) & (out["price"] > 0) & (out["qty"] > 0) & (out["pair"] != "")
+    dropped = int((~ok).sum())
+    if dropped:
+        logger.warning("ข้าม %d แถวที่ข้อมูลไม่ครบ/side ไม่ถูกต้อง", dropped)
+    out = out[ok].reset_index(drop=True)
+    # เรียงตามคู่เหรียญ แต่คงลำดับเดิมภายในคู่ (stable) — ทุกการคำนวณข้างล่างเป็นแบบ grouped
+    out["seq"] = np.arange(len(out))
+    return out.sort_values(["pair", "seq"], kind="stable").reset_index(drop=True)
+
+def _positions_path(t: pd.DataFrame) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """position หลังแต่ละแถว (SELL เกิน position ถูกตัดเหลือเท่าที่มี เหมือน PnLEngine)
+
+    Q_t = max(0, Q_{t-1} + s_t) เขียนแบบไม่วนลูปได้เป็น Q_t = S_t - min(0, min_{j<=t} S_j)
+    โดย S คือผลรวมสะสมของปริมาณ (BUY บวก, SELL ลบ) ภายในคู่เดียวกัน
+    """
+    is_buy = (t["side"] == "BUY").to_numpy()
+    signed = np.where(is_buy, t["qty"].to_numpy(), -t["qty"].to_numpy())
+    g = t.groupby("pair", sort=False)
+    S = pd.Series(signed).groupby(t["pair"].to_numpy(), sort=False).cumsum().to_numpy()
+    m = np.minimum(pd.Series(S).groupby(t["pair"].to_numpy(), sort=False).cummin().to_numpy(), 0.0)
+    Q = S - m
+    Q[np.abs(Q) <= 1e-12 * (np.abs(S) + np.abs(m) + 1.0)] = 0.0
+    first = (g.cumcount() == 0).to_numpy()
+    Q_prev = np.empty_like(Q)
+    Q_prev[1:] = Q[:-1]
+    Q_prev[first] = 0.0
+    return is_buy, Q, Q_prev
+
+def _average_cost(t: pd.DataFrame, is_buy, Q, Q_prev) -> Tuple[np.ndarray, np.ndarray]:
+    """avg_cost หลังแต่ละแถว และ avg_cost ที่ใช้คิดกำไรของแถวนั้น
+
+    BUY: avg = a*avg_prev + b  โดย a = Q_prev/Q, b = qty*price/Q ; SELL: a = 1, b = 0
+    เป็น linear recurrence — แก้ได้ด้วย cumulative product/sum ภายในช่วงที่ position ไม่เคยแตะศูนย์
+    """
+    n = len(t)
+    price = t["price"].to_numpy()
+    qty = t["qty"].to_numpy()
+    pair = t["pair"].to_numpy()
+    first = np.r_[True, pair[1:] != pair[:-1]]
+
+    # ช่วง (segment) ใหม่เริ่มที่ BUY ที่เปิดจาก position ศูนย์ — avg เริ่มที่ราคาซื้อ
+    starts = is_buy & (Q_prev == 0.0)
+    a = np.ones(n)
+    b = np.zeros(n)
+    buy_cont = is_buy & ~starts
+    a[buy_cont] = Q_prev[buy_cont] / Q[buy_cont]
+    b[is_buy] = qty[is_buy] * price[is_buy] / Q[is_buy]
+    a[starts] = 1.0  # ไม่พึ่งค่าก่อนหน้า (ตัดด้วย segment แทน)
+
+    seg = np.cumsum(starts | first)
+    loga = np.log(a)
+    L = pd.Series(loga).groupby(seg).cumsum().to_numpy()
+    # แบ่ง segment เป็นบล็อกที่ log ลดลงไม่เกิน _LOG_BLOCK เพื่อให้ exp() อยู่ในช่วงที่ปลอดภัย
+    blk_in_seg = np.floor(-L / _LOG_BLOCK).astype(np.int64)
+    blk = np.cumsum(np.r_[True, (seg[1:] != seg[:-1]) | (blk_in_seg[1:] != blk_in_seg[:-1])])
+    blk_first = np.r_[True, blk[1:] != blk[:-1]]
+    R = pd.Series(np.where(blk_first, L, np.nan)).ffill().to_numpy()
+    partial = np.exp(L - R) * pd.Series(b * np.exp(R - L)).groupby(blk).cumsum().to_numpy()
+    avg = partial
+
+    # บล็อกที่ไม่ใช่บล็อกแรกของ segment ต้องรับค่า avg ต่อจากบล็อกก่อนหน้า (มีน้อยมาก จึงวนลูปได้)
+    carry_blocks = np.flatnonzero(blk_first & (blk_in_seg > 0) & ~(starts | first))
+    if len(carry_blocks):
+        bounds = np.r_[np.flatnonzero(blk_first), n]
+        block_end = {s: e for s, e in zip(bounds[:-1], bounds[1:])}
+        for s in carry_blocks:
+            e = block_end[s]
+            prev_avg = avg[s - 1]
+            avg[s:e] = avg[s:e] + np.exp(L[s:e] - L[s - 1]) * prev_avg
+
+    # ก่อนมี BUY แรกของคู่ (SELL ตอน position ศูนย์) avg = 0
+    seen_buy = pd.Series(is_buy.astype(np.int64)).groupby(pair, sort=False).cumsum().to_numpy() > 0
+    avg = np.where(seen_buy, avg, 0.0)
+    avg_used = np.empty(n)
+    avg_used[1:] = avg[:-1]
+    avg_used[first] = 0.0
+    # position ถูกขายหมดแล้ว avg ที่แสดง = 0 (เหมือน PnLEngine)
+    avg_after = np.where(Q > 0, avg, 0.0)
+    avg_used = np.where(Q_prev > 0, avg_used, 0.0)
+    return avg_after, avg_used
+
+def _fifo(t: pd.DataFrame, is_buy, Q, Q_prev) -> Tuple[np.ndarray, np.ndarray]:
+    """FIFO: วางทุก lot ที่ซื้อบนแกนปริมาณสะสม แล้วต้นทุนของการขายแต่ละครั้ง = พื้นที่ใต้กราฟราคา
+    ระหว่างปริมาณขายสะสมก่อนและหลังขาย (หาด้วย searchsorted ทีเดียวทุกคู่)"""
+    n = len(t)
+    price = t["price"].to_numpy()
+    qty = t["qty"].to_numpy()
+    pair = t["pair"].to_numpy()
+    first = np.r_[True, pair[1:] != pair[:-1]]
+
+    buy_q = np.where(is_buy, qty, 0.0)
+    sell_q = np.where(is_buy, 0.0, Q_prev - Q)
+    # แกนรวมทุกคู่ต่อกัน (คู่เรียงติดกันอยู่แล้ว) จึงค้นหาได้ด้วย searchsorted ครั้งเดียว
+    CB = np.cumsum(buy_q)
+    base = pd.Series(np.where(first, CB - buy_q, np.nan)).ffill().to_numpy()
+    CS = pd.Series(sell_q).groupby(pair, sort=False).cumsum().to_numpy()
+
+    lot_end = CB[is_buy]
+    lot_price = price[is_buy]
+    lot_cost_end = np.cumsum(qty[is_buy] * lot_price)
+
+    def F(x):
+        i = np.searchsorted(lot_end, x, side="left")
+        i = np.clip(i, 0, len(lot_end) - 1)
+        prev_end = np.where(i > 0, lot_end[i - 1], 0.0)
+        prev_cost = np.where(i > 0, lot_cost_end[i - 1], 0.0)
+        return prev_cost + (x - prev_end) * lot_price[i]
+
+    if not len(lot_end):
+        return np.zeros(n), np.zeros(n)
+    bought = CB  # ปริมาณซื้อสะสมจนถึงแถวนี้ (รวม offset ของคู่)
+    x1 = np.minimum(base + CS, bought)
+    x0 = np.minimum(base + CS - sell_q, x1)
+    cost = F(x1) - F(x0)
+    avg_used = np.where(sell_q > 0, cost / np.where(sell_q > 0, sell_q, 1.0), 0.0)
+    held_cost = F(bought) - F(np.minimum(base + CS, bought))
+    avg_after = np.where(Q > 0, held_cost / np.where(Q > 0, Q, 1.0), 0.0)
+    return avg_after, avg_used
+
+def replay_frame(df: pd.DataFrame, policy: str = "average_cost") -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """คืน (positions, realized) จาก DataFrame ของ trades"""
+    if policy not in POLICIES:
+        raise ValueError(f"cost_policy ไม่รู้จัก: {policy} (ใช้ได้: {', '.join(POLICIES)})")
+    t = _prepare(df)
+    if t.empty:
+        return (pd.DataFrame(columns=["pair", "position_qty", "avg_cost"]),
+                pd.DataFrame(columns=["ts_iso", "pair", "qty", "avg_cost_used", "sell_price", "fee", "realized_pnl", "src_image_id", "seq"]))
+    is_buy, Q, Q_prev = _positions_path(t)
+    if policy == "fifo":
+        avg_after, avg_used = _fifo(t, is_buy, Q, Q_prev)
+    else:
+        avg_after, avg_used = _average_cost(t, is_buy, Q, Q_prev)
+
+    sells = ~is_buy
+    sell_qty = (Q_prev - Q)[sells]
+    price = t["price"].to_numpy()[sells]
+    fee = t["fee"].to_numpy()[sells]
+    used = avg_used[sells]
+    realized = pd.DataFrame({
+        "ts_iso": t["ts_iso"].to_numpy()[sells],
+        "pair": t["pair"].to_numpy()[sells],
+        "qty": sell_qty,
+        "avg_cost_used": used,
+        "sell_price": price,
+        "fee": fee,
+        "realized_pnl": (price - used) * sell_qty - fee,
+        "src_image_id": t["src_image_id"].to_numpy()[sells],
+        "seq": t["seq"].to_numpy()[sells],
+    }).sort_values("seq", kind="stable")
+
+    last = np.r_[t["pair"].to_numpy()[1:] != t["pair"].to_numpy()[:-1], True]
+    positions = pd.DataFrame({
+        "pair": t["pair"].to_numpy()[last],
+        "position_qty": Q[last],
+        "avg_cost": avg_after[last],
+    })
+    return positions, realized
+
+def replay(storage: TradeStorage, policy: str = None, dry_run: bool = False) -> Dict[str, Any]:
+    """อ่าน trades จาก storage แล้วเขียน positions/realized ใหม่ทั้งหมดกลับลง storage"""
+    policy = policy or CFG.get("cost_policy", "average_cost")
+    df = load_trades(storage)
+    positions, realized = replay_frame(df, policy)
+    if not dry_run:
+        ts = datetime.now(timezone.utc).isoformat()
+        note = f"replay:{policy}"
+        # positions กับ realized ต้องเปลี่ยนพร้อมกัน — ล้มกลางทาง (SQLite) จะไม่เหลือ positions ใหม่คู่กับ realized เก่า
+        with storage.transaction():
+            storage.replace_positions([[p, float(q), float(a), ts] for p, q, a in
+                                       positions[["pair", "position_qty", "avg_cost"]].itertuples(index=False)])
+            storage.replace_realized([
+                [r.ts_iso, r.pair, float(r.qty), float(r.avg_cost_used), float(r.sell_price), float(r.fee),
+                 float(r.realized_pnl), note, (r.src_image_id or None)]
+                for r in realized.itertuples(index=False)
+            ])
+    return {"policy": policy, "trades": len(df), "pairs": len(positions), "realized_rows": len(realized),
+            "realized_pnl": float(realized["realized_pnl"].sum()) if len(realized) else 0.0}
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    ap = argparse.ArgumentParser(description="คำนวณ positions/realized ใหม่จาก trades")
+    ap.add_argument("--policy", choices=POLICIES, default=None, help="ค่าเริ่มต้น: cost_policy ใน config.yaml")
+    ap.add_argument("--dry-run", action="store_true", help="คำนวณอย่างเดียว ไม่เขียนทับ")
+    ap.add_argument("--user", default=None, help="chat id ของ ledger ผู้ใช้ (ค่าเริ่มต้น: ledger รวมใน data/)")
+    args = ap.parse_args()
+    storage = TradeStorage(shard=args.user)
+    try:
+        print(replay(storage, args.policy, args.dry_run))
+    finally:
+        storage.close()
+
+if __name__ == "__main__":
+    main()
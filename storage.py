@@ -1,57 +1,292 @@
 import os
 import csv
-import gspread
-from google.oauth2.service_account import Credentials
-from typing import List, Any
+import sys
+import contextlib
+from typing import List, Any, Dict, Iterator, Optional
 from datetime import datetime, timezone
-import yaml
 
-with open("config.yaml", "r", encoding="utf-8") as f:
-    CFG = yaml.safe_load(f)
+import metrics
+from aggregates import PnLAggregates
+from utils import load_config
 
-SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
-SHEETS_JSON = os.getenv("GOOGLE_SHEETS_JSON")
+CFG = load_config()
 
 DATA_DIR = "data"
 os.makedirs(DATA_DIR, exist_ok=True)
 
-def _open_sheet():
-    if not (CFG.get("use_google_sheets") and SHEET_ID and SHEETS_JSON and os.path.exists(SHEETS_JSON)):
-        return None
-    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
-    creds = Credentials.from_service_account_file(SHEETS_JSON, scopes=scopes)
-    client = gspread.authorize(creds)
-    return client.open_by_key(SHEET_ID)
+TRADE_HEADERS = ["ts_iso","exchange","pair","side","price","qty","fee","fee_asset","gross_value","note","src_image_id"]
+POSITION_HEADERS = ["pair","position_qty","avg_cost","updated_at"]
+REALIZED_HEADERS = ["ts_iso","pair","qty","avg_cost_used","sell_price","fee","realized_pnl","note","src_image_id"]
 
 def _append_csv(path: str, headers: List[str], row: List[Any]):
+    _append_csv_rows(path, headers, [row])
+
+def _append_csv_rows(path: str, headers: List[str], rows: List[List[Any]]):
     exists = os.path.exists(path)
     with open(path, "a", newline="", encoding="utf-8") as f:
         w = csv.writer(f)
         if not exists:
             w.writerow(headers)
-        w.writerow(row)
+        w.writerows(rows)
+
+def _empty_position(pair: str) -> Dict[str, Any]:
+    return {"pair": pair, "position_qty": 0.0, "avg_cost": 0.0}
+
+# ---------------- Backends ----------------
+
+class StorageBackend:
+    """interface ของที่เก็บข้อมูล — TradeStorage สร้างแถวแล้วส่งต่อมาที่นี่
+
+    backend ใหม่ต้องมีทุกเมธอดด้านล่าง; transaction() ใช้ครอบ read-modify-write
+    ของ PnLEngine ให้ trade, realized และ position ถูกเขียนพร้อมกัน (ถ้า backend รองรับ)
+    """
+    name = "base"
+
+    def append_trade(self, row: List[Any]):
+        raise NotImplementedError
+
+    def append_realized(self, row: List[Any]):
+        raise NotImplementedError
+
+    def append_trades(self, rows: List[List[Any]]):
+        """เพิ่มหลายแถวในครั้งเดียว (backend ที่เขียนเป็นชุดได้ควร override)"""
+        for row in rows:
+            self.append_trade(row)
+
+    def append_realized_rows(self, rows: List[List[Any]]):
+        for row in rows:
+            self.append_realized(row)
+
+    def upsert_position(self, pair: str, position_qty: float, avg_cost: float, ts: str):
+        raise NotImplementedError
+
+    def get_position(self, pair: str) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def get_all_positions(self) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def iter_rows(self, table: str, chunk_size: int = 10000) -> Iterator[List[Dict[str, Any]]]:
+        """อ่านตาราง (trades | realized | positions) ทีละก้อน"""
+        raise NotImplementedError
+
+    def count_rows(self, table: str) -> int:
+        """จำนวนแถวของตาราง (backend ที่นับได้เร็วกว่าการอ่านทั้งตารางควร override)"""
+        return sum(len(chunk) for chunk in self.iter_rows(table))
+
+    def replace_positions(self, rows: List[List[Any]]):
+        """เขียนทับตาราง positions ทั้งหมด (ใช้ตอน replay)"""
+        raise NotImplementedError
+
+    def replace_realized(self, rows: List[List[Any]]):
+        """เขียนทับตาราง realized ทั้งหมด (ใช้ตอน replay)"""
+        raise NotImplementedError
+
+    def transaction(self):
+        return contextlib.nullcontext()
+
+    def state_dir(self) -> str:
+        """โฟลเดอร์ไฟล์ประกอบของ ledger นี้ในเครื่อง (เช่น ยอดสรุปของ /report)"""
+        return DATA_DIR
+
+    def close(self):
+        pass
+
+TABLE_HEADERS = {"trades": TRADE_HEADERS, "realized": REALIZED_HEADERS, "positions": POSITION_HEADERS}
+
+def _chunks(items, size: int):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+class CSVBackend(StorageBackend):
+    name = "csv"
+
+    def __init__(self, data_dir: str = DATA_DIR):
+        self.data_dir = data_dir
+        os.makedirs(data_dir, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.data_dir, name)
+
+    def state_dir(self) -> str:
+        return self.data_dir
+
+    def append_trade(self, row):
+        _append_csv(self._path("trades.csv"), TRADE_HEADERS, row)
+
+    def append_realized(self, row):
+        _append_csv(self._path("realized.csv"), REALIZED_HEADERS, row)
+
+    def append_trades(self, rows):
+        if rows:
+            _append_csv_rows(self._path("trades.csv"), TRADE_HEADERS, rows)
+
+    def append_realized_rows(self, rows):
+        if rows:
+            _append_csv_rows(self._path("realized.csv"), REALIZED_HEADERS, rows)
+
+    def upsert_position(self, pair, position_qty, avg_cost, ts):
+        path = self._path("positions.csv")
+        rows = []
+        if os.path.exists(path):
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                rows = list(reader)
+        updated = False
+        for r in rows:
+            if r["pair"] == pair:
+                r["position_qty"] = str(position_qty)
+                r["avg_cost"] = str(avg_cost)
+                r["updated_at"] = ts
+                updated = True
+        if not updated:
+            rows.append({"pair": pair, "position_qty": str(position_qty), "avg_cost": str(avg_cost), "updated_at": ts})
+        # เขียนไฟล์ชั่วคราวแล้ว rename — หยุดกลางคันจะไม่เหลือ positions.csv ที่เขียนไม่ครบ
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.DictWriter(f, fieldnames=POSITION_HEADERS)
+            w.writeheader()
+            for r in rows:
+                w.writerow(r)
+        os.replace(tmp, path)
+
+    def get_position(self, pair):
+        path = self._path("positions.csv")
+        if not os.path.exists(path):
+            return _empty_position(pair)
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            for rec in reader:
+                if rec.get("pair") == pair:
+                    return {
+                        "pair": pair,
+                        "position_qty": float(rec.get("position_qty") or 0),
+                        "avg_cost": float(rec.get("avg_cost") or 0),
+                    }
+        return _empty_position(pair)
+
+    def get_all_positions(self):
+        path = self._path("positions.csv")
+        if not os.path.exists(path):
+            return []
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            return list(reader)
+
+    def iter_rows(self, table, chunk_size=10000):
+        path = self._path(f"{table}.csv")
+        if not os.path.exists(path):
+            return
+        with open(path, newline="", encoding="utf-8") as f:
+            chunk = []
+            for rec in csv.DictReader(f):
+                chunk.append(rec)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+    def count_rows(self, table):
+        path = self._path(f"{table}.csv")
+        if not os.path.exists(path):
+            return 0
+        with open(path, newline="", encoding="utf-8") as f:
+            # นับแบบเดียวกับ DictReader ของ iter_rows (ข้ามหัวตารางและบรรทัดว่าง, ช่องที่มีขึ้นบรรทัดใหม่นับเป็นแถวเดียว)
+            return max(sum(1 for row in csv.reader(f) if row) - 1, 0)
+
+    def _rewrite(self, name: str, headers: List[str], rows: List[List[Any]]):
+        path = self._path(name)
+        tmp = path + ".tmp"
+        with open(tmp, "w", newline="", encoding="utf-8") as f:
+            w = csv.writer(f)
+            w.writerow(headers)
+            w.writerows(rows)
+        os.replace(tmp, path)
+
+    def replace_positions(self, rows):
+        self._rewrite("positions.csv", POSITION_HEADERS, rows)
+
+    def replace_realized(self, rows):
+        self._rewrite("realized.csv", REALIZED_HEADERS, rows)
+
+def shard_dir(shard: str, cfg: Dict[str, Any] = None) -> str:
+    """โฟลเดอร์ของ ledger ย่อย (เช่น chat id ของผู้ใช้): <ledger.users_dir>/<shard>"""
+    cfg = CFG if cfg is None else cfg
+    return os.path.join((cfg.get("ledger") or {}).get("users_dir", os.path.join(DATA_DIR, "users")), str(shard))
+
+def open_backend(cfg: Dict[str, Any] = None, shard: Optional[str] = None) -> StorageBackend:
+    """เลือก backend จาก config: storage_backend = csv | sqlite | sheets
+    (ถ้าไม่ระบุ ใช้ sheets เมื่อ use_google_sheets เปิดและตั้งค่าครบ ไม่งั้นใช้ csv)
+
+    shard = ledger ย่อยของผู้ใช้หนึ่งคน: CSV/SQLite อยู่ใน shard_dir(shard), Sheets ใช้แท็บ trades_<shard> ฯลฯ
+    ไม่ระบุ = ledger รวมใน data/ แบบเดิม
+    """
+    cfg = CFG if cfg is None else cfg
+    data_dir = DATA_DIR if shard is None else shard_dir(shard, cfg)
+    kind = cfg.get("storage_backend")
+    if kind is None:
+        kind = "sheets" if cfg.get("use_google_sheets") else "csv"
+    if kind == "sqlite":
+        from storage_sqlite import SQLiteBackend
+        if shard is None:
+            return SQLiteBackend(cfg.get("sqlite_path", os.path.join(DATA_DIR, "ledger.db")))
+        return SQLiteBackend(os.path.join(data_dir, "ledger.db"))
+    if kind == "sheets":
+        from storage_sheets import SheetsBackend
+        backend = SheetsBackend.from_config(cfg, shard)
+        if backend:
+            return backend
+    return CSVBackend(data_dir)
+
+class PendingWrites(RuntimeError):
+    """backend ยังส่งแถวที่ค้างไม่ได้ (เช่น Sheets ติด backoff) — อ่านทั้งตารางตอนนี้จะได้ข้อมูลไม่ครบ ให้ลองใหม่ภายหลัง"""
+
+def is_transient(e: BaseException) -> bool:
+    """error ของ storage ที่รอแล้วลองใหม่อาจผ่าน: ดิสก์/เครือข่าย (OSError), SQLite ติดล็อก, Sheets API, แถวที่ยังส่งไม่ได้
+    อย่างอื่น (เช่น ValueError จากค่าในดีล) ลองใหม่กี่ครั้งก็ไม่ผ่าน"""
+    if isinstance(e, (OSError, TimeoutError, PendingWrites)):
+        return True
+    sqlite3 = sys.modules.get("sqlite3")
+    if sqlite3 is not None and isinstance(e, sqlite3.OperationalError):
+        return True
+    # เช็กผ่าน sys.modules: ไม่ import gspread ถ้าไม่ได้ใช้ Sheets
+    gspread = sys.modules.get("gspread")
+    return gspread is not None and isinstance(e, gspread.exceptions.APIError)
+
+# ---------------- Facade ----------------
 
 class TradeStorage:
-    def __init__(self):
-        self.sheet = _open_sheet()
-        self.trades_name = CFG.get("trades_sheet_name", "trades")
-        self.pos_name = CFG.get("positions_sheet_name", "positions")
-        self.real_name = CFG.get("realized_sheet_name", "realized")
-        if self.sheet:
-            import gspread
-            for name, headers in [
-                (self.trades_name, ["ts_iso","exchange","pair","side","price","qty","fee","fee_asset","gross_value","note","src_image_id"]),
-                (self.pos_name, ["pair","position_qty","avg_cost","updated_at"]),
-                (self.real_name, ["ts_iso","pair","qty","avg_cost_used","sell_price","fee","realized_pnl","note","src_image_id"]),
-            ]:
-                try:
-                    ws = self.sheet.worksheet(name)
-                except gspread.WorksheetNotFound:
-                    ws = self.sheet.add_worksheet(title=name, rows=1000, cols=20)
-                    ws.append_row(headers)
+    def __init__(self, backend: StorageBackend = None, shard: Optional[str] = None):
+        self.shard = shard
+        self.backend = backend or open_backend(shard=shard)
+        self.aggregates = PnLAggregates.from_config(CFG, self.backend.state_dir())
 
-    def record_trade(self, trade):
-        row = [
+    def _aggregates(self) -> Optional[PnLAggregates]:
+        # ยอดสรุปที่อ่านจากดิสก์ต้องนับแถวเท่ากับ ledger — ไม่ตรงเมื่อ ledger มีข้อมูลก่อนมียอดสรุป, โปรแกรมหยุด
+        # ก่อน flush หรือ transaction ของ CSV ล้มหลังเขียนไปบางแถว: สร้างใหม่จากประวัติก่อนเขียนดีลใหม่
+        agg = self.aggregates
+        if agg is not None and not agg.loaded:
+            if not agg.ready or agg.counts != self._row_counts():
+                self.rebuild_aggregates()
+        return agg
+
+    def _row_counts(self) -> Dict[str, int]:
+        with metrics.timed("storage.count_rows"):
+            return {"trades": self.backend.count_rows("trades"), "realized": self.backend.count_rows("realized")}
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ครอบการเขียนหลายขั้นให้เป็นหน่วยเดียว (SQLite: BEGIN IMMEDIATE ... COMMIT)
+        ยอดสรุปของ /report ถูกเขียนครั้งเดียวหลัง commit และถูกทิ้งถ้า transaction ล้ม"""
+        agg = self._aggregates()
+        with agg.batch() if agg else contextlib.nullcontext():
+            with self.backend.transaction():
+                yield
+
+    @staticmethod
+    def _trade_row(trade) -> List[Any]:
+        return [
             trade.get("ts_iso"),
             trade.get("exchange"),
             trade.get("pair"),
@@ -64,96 +299,116 @@ class TradeStorage:
             trade.get("note"),
             trade.get("src_image_id"),
         ]
-        if self.sheet:
-            ws = self.sheet.worksheet(self.trades_name)
-            ws.append_row(row)
-        else:
-            _append_csv(os.path.join(DATA_DIR, "trades.csv"),
-                        ["ts_iso","exchange","pair","side","price","qty","fee","fee_asset","gross_value","note","src_image_id"],
-                        row)
+
+    def record_trade(self, trade):
+        row = self._trade_row(trade)
+        # ใน transaction เสมอ: ยอดสรุป flush ครั้งเดียวตอนจบ transaction นอกสุด (ไม่ใช่ทุกดีล) และทิ้งถ้าเขียน ledger ไม่สำเร็จ
+        with self.transaction():
+            with metrics.timed("storage.append_trade"):
+                self.backend.append_trade(row)
+            if self.aggregates:
+                self.aggregates.add_trade(trade.get("ts_iso"), trade.get("pair"), trade.get("price"), trade.get("qty"), trade.get("fee"))
+
+    @staticmethod
+    def _trade_key(ts_iso, pair, src_image_id) -> tuple:
+        return (str(ts_iso or ""), str(pair or ""), str(src_image_id or ""))
+
+    def recorded(self, trades: List[Dict[str, Any]]) -> List[bool]:
+        """ดีลไหนอยู่ในตาราง trades แล้วบ้าง (เทียบ ts_iso + pair + src_image_id) — อ่านทั้งตาราง ใช้ตอนกู้ journal เท่านั้น"""
+        want = {self._trade_key(t.get("ts_iso"), t.get("pair"), t.get("src_image_id")) for t in trades}
+        found = set()
+        for chunk in self.iter_rows("trades"):
+            for r in chunk:
+                k = self._trade_key(r.get("ts_iso"), r.get("pair"), r.get("src_image_id"))
+                if k in want:
+                    found.add(k)
+        return [self._trade_key(t.get("ts_iso"), t.get("pair"), t.get("src_image_id")) in found for t in trades]
+
+    def record_trades(self, trades: List[Dict[str, Any]]):
+        """บันทึกหลายดีลในการเขียนครั้งเดียว (ใช้กับอัลบั้มรูป)"""
+        rows = [self._trade_row(t) for t in trades]
+        with self.transaction():
+            with metrics.timed("storage.append_trades"):
+                self.backend.append_trades(rows)
+            if self.aggregates:
+                for t in trades:
+                    self.aggregates.add_trade(t.get("ts_iso"), t.get("pair"), t.get("price"), t.get("qty"), t.get("fee"))
 
     def upsert_position(self, pair: str, position_qty: float, avg_cost: float):
         ts = datetime.now(timezone.utc).isoformat()
-        if self.sheet:
-            ws = self.sheet.worksheet(self.pos_name)
-            data = ws.get_all_records()
-            found = False
-            for idx, rec in enumerate(data, start=2):
-                if rec.get("pair") == pair:
-                    ws.update(f"B{idx}:D{idx}", [[position_qty, avg_cost, ts]])
-                    found = True
-                    break
-            if not found:
-                ws.append_row([pair, position_qty, avg_cost, ts])
-        else:
-            path = os.path.join(DATA_DIR, "positions.csv")
-            rows = []
-            if os.path.exists(path):
-                with open(path, newline="", encoding="utf-8") as f:
-                    reader = csv.DictReader(f)
-                    rows = list(reader)
-            updated = False
-            for r in rows:
-                if r["pair"] == pair:
-                    r["position_qty"] = str(position_qty)
-                    r["avg_cost"] = str(avg_cost)
-                    r["updated_at"] = ts
-                    updated = True
-            if not updated:
-                rows.append({"pair": pair, "position_qty": str(position_qty), "avg_cost": str(avg_cost), "updated_at": ts})
-            with open(path, "w", newline="", encoding="utf-8") as f:
-                w = csv.DictWriter(f, fieldnames=["pair","position_qty","avg_cost","updated_at"])
-                w.writeheader()
-                for r in rows:
-                    w.writerow(r)
-
-    def record_realized(self, pair: str, qty: float, avg_cost_used: float, sell_price: float, fee: float, pnl: float, src_image_id: str, note: str = None):
-        ts = datetime.now(timezone.utc).isoformat()
+        with metrics.timed("storage.upsert_position"):
+            self.backend.upsert_position(pair, position_qty, avg_cost, ts)
+
+    def record_realized(self, pair: str, qty: float, avg_cost_used: float, sell_price: float, fee: float, pnl: float, src_image_id: str, note: str = None,
+                        ts_iso: str = None):
+        # ใช้เวลาของดีลขาย (เหมือน replay) เพื่อให้ /report ตัดวันตรงกันทั้งก่อนและหลัง replay
+        ts = ts_iso or datetime.now(timezone.utc).isoformat()
         row = [ts, pair, qty, avg_cost_used, sell_price, fee, pnl, note, src_image_id]
-        if self.sheet:
-            ws = self.sheet.worksheet(self.real_name)
-            ws.append_row(row)
-        else:
-            _append_csv(os.path.join(DATA_DIR, "realized.csv"),
-                        ["ts_iso","pair","qty","avg_cost_used","sell_price","fee","realized_pnl","note","src_image_id"],
-                        row)
+        with self.transaction():
+            with metrics.timed("storage.append_realized"):
+                self.backend.append_realized(row)
+            if self.aggregates:
+                self.aggregates.add_realized(ts, pair, pnl)
+
+    def record_realized_rows(self, items: List[Dict[str, Any]]):
+        """เหมือน record_realized หลายรายการ — items เป็น dict ที่มี key ตามพารามิเตอร์ของ record_realized"""
+        ts = datetime.now(timezone.utc).isoformat()
+        rows = [[r.get("ts_iso") or ts, r["pair"], r["qty"], r["avg_cost_used"], r["sell_price"], r["fee"], r["pnl"],
+                 r.get("note"), r.get("src_image_id")] for r in items]
+        with self.transaction():
+            with metrics.timed("storage.append_realized"):
+                self.backend.append_realized_rows(rows)
+            if self.aggregates:
+                for row in rows:
+                    self.aggregates.add_realized(row[0], row[1], row[6])
 
     def get_position(self, pair: str):
-        if self.sheet:
-            ws = self.sheet.worksheet(self.pos_name)
-            data = ws.get_all_records()
-            for rec in data:
-                if rec.get("pair") == pair:
-                    return {
-                        "pair": pair,
-                        "position_qty": float(rec.get("position_qty") or 0),
-                        "avg_cost": float(rec.get("avg_cost") or 0),
-                    }
-            return {"pair": pair, "position_qty": 0.0, "avg_cost": 0.0}
-        else:
-            path = os.path.join(DATA_DIR, "positions.csv")
-            if not os.path.exists(path):
-                return {"pair": pair, "position_qty": 0.0, "avg_cost": 0.0}
-            with open(path, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                for rec in reader:
-                    if rec.get("pair") == pair:
-                        return {
-                            "pair": pair,
-                            "position_qty": float(rec.get("position_qty") or 0),
-                            "avg_cost": float(rec.get("avg_cost") or 0),
-                        }
-            return {"pair": pair, "position_qty": 0.0, "avg_cost": 0.0}
+        with metrics.timed("storage.get_position"):
+            return self.backend.get_position(pair)
 
     def get_all_positions(self):
-        if self.sheet:
-            ws = self.sheet.worksheet(self.pos_name)
-            data = ws.get_all_records()
-            return data
-        else:
-            path = os.path.join(DATA_DIR, "positions.csv")
-            if not os.path.exists(path):
-                return []
-            with open(path, newline="", encoding="utf-8") as f:
-                reader = csv.DictReader(f)
-                return list(reader)
+        return self.backend.get_all_positions()
+
+    def iter_rows(self, table: str, chunk_size: int = 10000):
+        return self.backend.iter_rows(table, chunk_size)
+
+    def replace_positions(self, rows: List[List[Any]]):
+        self.backend.replace_positions(rows)
+
+    def replace_realized(self, rows: List[List[Any]]):
+        self.backend.replace_realized(rows)
+        if self.aggregates is not None:
+            # realized เปลี่ยนทั้งตาราง (replay) — ยอดสรุปเดิมใช้ไม่ได้แล้ว
+            with metrics.timed("storage.rebuild_aggregates"):
+                self.aggregates.rebuild(self._rows("trades"), (dict(zip(REALIZED_HEADERS, r)) for r in rows))
+
+    def _rows(self, table: str) -> Iterator[Dict[str, Any]]:
+        for chunk in self.iter_rows(table):
+            yield from chunk
+
+    def rebuild_aggregates(self):
+        """สร้างยอดสรุปของ /report ใหม่จาก trades/realized ทั้งหมด"""
+        if self.aggregates is None:
+            return
+        with metrics.timed("storage.rebuild_aggregates"):
+            self.aggregates.rebuild(self._rows("trades"), self._rows("realized"))
+
+    def report(self, period: str = "month") -> Dict[str, Any]:
+        """ยอด P&L ต่อคู่ในช่วง day | week | month | all | YYYY-MM | YYYY-MM-DD (ดู aggregates.format_report)"""
+        agg = self._aggregates()
+        if agg is None:
+            # ปิดยอดสรุปไว้: คำนวณจากทั้งตารางทุกครั้ง
+            c = CFG.get("pnl_report") or {}
+            agg = PnLAggregates(None, float(c.get("utc_offset_hours", 7)))
+            agg.rebuild(self._rows("trades"), self._rows("realized"))
+        with metrics.timed("storage.report"):
+            return agg.report(period)
+
+    def reopen(self, backend: StorageBackend) -> None:
+        """ใช้ backend ที่เปิดใหม่แทนตัวที่ close ไปแล้ว (ยอดสรุปโหลดจากดิสก์และตรวจกับ ledger ใหม่)"""
+        self.backend = backend
+        self.aggregates = PnLAggregates.from_config(CFG, backend.state_dir())
+
+    def close(self):
+        """flush งานที่ค้าง (Sheets) / ปิด connection (SQLite) ก่อนปิดโปรแกรม"""
+        self.backend.close()
@@ -0,0 +1,352 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextlib
+from typing import List, Any, Dict, Optional
+
+import gspread
+from google.oauth2.service_account import Credentials
+
+import metrics
+from storage import StorageBackend, TRADE_HEADERS, POSITION_HEADERS, REALIZED_HEADERS, TABLE_HEADERS, DATA_DIR, _empty_position, shard_dir, \
+    PendingWrites
+
+logger = logging.getLogger("tradebot.sheets")
+
+SHEET_ID = os.getenv("GOOGLE_SHEET_ID")
+SHEETS_JSON = os.getenv("GOOGLE_SHEETS_JSON")
+
+RETRYABLE_CODES = (429, 500, 502, 503, 504)
+
+_SHEET = None
+
+def open_sheet():
+    # authorize ครั้งเดียวต่อ process แล้วใช้ spreadsheet เดิมกับทุก ledger ย่อย
+    global _SHEET
+    if _SHEET is not None:
+        return _SHEET
+    if not (SHEET_ID and SHEETS_JSON and os.path.exists(SHEETS_JSON)):
+        return None
+    scopes = ["https://www.googleapis.com/auth/spreadsheets"]
+    creds = Credentials.from_service_account_file(SHEETS_JSON, scopes=scopes)
+    client = gspread.authorize(creds)
+    _SHEET = client.open_by_key(SHEET_ID)
+    return _SHEET
+
+def _is_retryable(e: Exception) -> bool:
+    return isinstance(e, gspread.exceptions.APIError) and getattr(e, "code", None) in RETRYABLE_CODES
+
+class SheetsBackend(StorageBackend):
+    """Google Sheets แบบรวมคำสั่ง (batched)
+
+    - เปิด worksheet ครั้งเดียวแล้วเก็บ handle ไว้
+    - โหลด positions ทั้งชีตครั้งเดียวตอนเริ่ม แล้วเก็บ index pair -> แถว ไว้ในหน่วยความจำ
+      (get_position / get_all_positions ไม่เรียก API เลย)
+    - append ของ trades/realized และการแก้ positions ถูกพักไว้ แล้ว flush เป็น
+      append_rows หนึ่งครั้งต่อชีต + batch_update หนึ่งครั้ง ทุก flush_interval วินาที
+      หรือเมื่อค้างเกิน max_pending รายการ
+    - ถ้าเจอ 429/5xx จะ backoff แบบ exponential และเขียนงานที่ค้างลง retry_path
+      เพื่อส่งต่อหลังรีสตาร์ท
+
+    สมมติว่าบอทเป็นผู้เขียนชีต positions เพียงรายเดียว (ถ้าแก้ชีตด้วยมือต้องรีสตาร์ทบอท)
+    """
+    name = "sheets"
+
+    def __init__(self, sheet, trades_name: str = "trades", pos_name: str = "positions",
+                 real_name: str = "realized", flush_interval: float = 5.0, max_pending: int = 50,
+                 retry_path: str = os.path.join(DATA_DIR, "sheets_retry.json"), autostart: bool = True):
+        self.sheet = sheet
+        self.trades_name = trades_name
+        self.pos_name = pos_name
+        self.real_name = real_name
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_path = retry_path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._ws = {}
+        for name, headers in [
+            (trades_name, TRADE_HEADERS),
+            (pos_name, POSITION_HEADERS),
+            (real_name, REALIZED_HEADERS),
+        ]:
+            try:
+                ws = self.sheet.worksheet(name)
+            except gspread.WorksheetNotFound:
+                ws = self.sheet.add_worksheet(title=name, rows=1000, cols=20)
+                ws.append_row(headers)
+            self._ws[name] = ws
+
+        self._positions: Dict[str, Dict[str, Any]] = {}
+        for idx, rec in enumerate(self._ws[pos_name].get_all_records(), start=2):
+            self._positions[rec.get("pair")] = {
+                "row": idx,
+                "position_qty": float(rec.get("position_qty") or 0),
+                "avg_cost": float(rec.get("avg_cost") or 0),
+                "updated_at": rec.get("updated_at"),
+            }
+        self._next_row = len(self._positions) + 2
+
+        self._appends: Dict[str, List[List[Any]]] = {trades_name: [], real_name: []}
+        self._dirty: set = set()
+        self._last_flush = time.monotonic()
+        self._backoff = 0.0
+        self._retry_at = 0.0
+        self._load_retry_queue()
+
+        self._stop = threading.Event()
+        self._thread = None
+        if autostart:
+            self._thread = threading.Thread(target=self._run, name="sheets-flush", daemon=True)
+            self._thread.start()
+
+    @classmethod
+    def from_config(cls, cfg: Dict[str, Any], shard: Optional[str] = None) -> Optional["SheetsBackend"]:
+        """shard = ledger ย่อยของผู้ใช้: ใช้แท็บ <ชื่อชีต>_<shard> และ retry file ในโฟลเดอร์ของ shard"""
+        sheet = open_sheet()
+        if not sheet:
+            return None
+        c = cfg.get("sheets_sync") or {}
+        suffix = "" if shard is None else f"_{shard}"
+        retry_path = c.get("retry_path", os.path.join(DATA_DIR, "sheets_retry.json"))
+        if shard is not None:
+            retry_path = os.path.join(shard_dir(shard, cfg), os.path.basename(retry_path))
+            os.makedirs(os.path.dirname(retry_path), exist_ok=True)
+        return cls(
+            sheet,
+            cfg.get("trades_sheet_name", "trades") + suffix,
+            cfg.get("positions_sheet_name", "positions") + suffix,
+            cfg.get("realized_sheet_name", "realized") + suffix,
+            flush_interval=float(c.get("flush_interval_sec", 5)),
+            max_pending=int(c.get("max_pending", 50)),
+            retry_path=retry_path,
+        )
+
+    # ---------- retry queue บนดิสก์ ----------
+
+    def _load_retry_queue(self):
+        if not os.path.exists(self.retry_path):
+            return
+        with open(self.retry_path, encoding="utf-8") as f:
+            saved = json.load(f)
+        for name, rows in (saved.get("appends") or {}).items():
+            self._appends.setdefault(name, []).extend(rows)
+        for pair, p in (saved.get("positions") or {}).items():
+            cur = self._positions.get(pair)
+            row = cur["row"] if cur else self._alloc_row()
+            self._positions[pair] = {**p, "row": row}
+            self._dirty.add(pair)
+        logger.info("โหลดงานค้างจาก %s: %d แถวรอ append, %d positions",
+                    self.retry_path, sum(len(r) for r in self._appends.values()), len(self._dirty))
+
+    def _save_retry_queue(self):
+        data = {
+            "appends": {k: v for k, v in self._appends.items() if v},
+            "positions": {p: {k: v for k, v in self._positions[p].items() if k != "row"} for p in self._dirty},
+        }
+        tmp = self.retry_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.retry_path)
+
+    def _clear_retry_queue(self):
+        if os.path.exists(self.retry_path):
+            os.remove(self.retry_path)
+
+    # ---------- flush ----------
+
+    def _alloc_row(self) -> int:
+        row = self._next_row
+        self._next_row += 1
+        return row
+
+    def pending(self) -> int:
+        return sum(len(v) for v in self._appends.values()) + len(self._dirty)
+
+    def _maybe_flush(self):
+        if self._depth:
+            return
+        # ปกติ thread เบื้องหลังเป็นคน flush ตามเวลา; ฝั่งผู้เรียก flush เองเฉพาะตอนค้างเยอะ
+        due = self._thread is None and time.monotonic() - self._last_flush >= self.flush_interval
+        if due or self.pending() >= self.max_pending:
+            self.flush()
+
+    def flush(self) -> bool:
+        """ส่งงานที่ค้างทั้งหมด; คืน False ถ้ายังติด backoff หรือ API ล้ม (งานยังค้างอยู่)"""
+        with self._lock:
+            if not self.pending():
+                self._last_flush = time.monotonic()
+                return True
+            if time.monotonic() < self._retry_at:
+                return False
+            t0 = time.perf_counter()
+            try:
+                for name, rows in self._appends.items():
+                    if rows:
+                        self._ws[name].append_rows(rows)
+                        self._appends[name] = []
+                if self._dirty:
+                    ws = self._ws[self.pos_name]
+                    last = max(self._positions[p]["row"] for p in self._dirty)
+                    if last > ws.row_count:
+                        ws.add_rows(last - ws.row_count + 100)
+                    ws.batch_update([
+                        {"range": f"A{self._positions[p]['row']}:D{self._positions[p]['row']}",
+                         "values": [[p, self._positions[p]["position_qty"],
+                                     self._positions[p]["avg_cost"], self._positions[p]["updated_at"]]]}
+                        for p in sorted(self._dirty)
+                    ])
+                    self._dirty.clear()
+            except Exception as e:
+                metrics.get().error("sheets.flush")
+                if not _is_retryable(e):
+                    logger.exception("Sheets flush ล้มเหลว (จะลองใหม่รอบหน้า)")
+                self._backoff = min(max(self._backoff * 2, 1.0), 64.0)
+                self._retry_at = time.monotonic() + self._backoff * (1 + random.random() * 0.2)
+                logger.warning("Sheets API ไม่พร้อม (%s) — รอ %.1fs, ค้าง %d รายการ", e, self._backoff, self.pending())
+                self._save_retry_queue()
+                return False
+            metrics.observe("sheets.flush", time.perf_counter() - t0)
+            self._backoff = 0.0
+            self._retry_at = 0.0
+            self._last_flush = time.monotonic()
+            self._clear_retry_queue()
+            return True
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Sheets flush thread error")
+
+    def state_dir(self):
+        # ledger อยู่บน Sheets — ไฟล์ประกอบอยู่โฟลเดอร์เดียวกับ retry file (data/ หรือโฟลเดอร์ของผู้ใช้)
+        return os.path.dirname(self.retry_path) or "."
+
+    def close(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        with self._lock:
+            self._retry_at = 0.0
+            if not self.flush():
+                self._save_retry_queue()
+
+    # ---------- StorageBackend ----------
+
+    @contextlib.contextmanager
+    def transaction(self):
+        # ไม่มี transaction จริงบน Sheets — แค่กันไม่ให้ flush กลางดีล
+        with self._lock:
+            self._depth += 1
+            try:
+                yield
+            finally:
+                self._depth -= 1
+            self._maybe_flush()
+
+    def append_trade(self, row):
+        with self._lock:
+            self._appends[self.trades_name].append(row)
+            self._maybe_flush()
+
+    def append_realized(self, row):
+        with self._lock:
+            self._appends[self.real_name].append(row)
+            self._maybe_flush()
+
+    def append_trades(self, rows):
+        with self._lock:
+            self._appends[self.trades_name].extend(rows)
+            self._maybe_flush()
+
+    def append_realized_rows(self, rows):
+        with self._lock:
+            self._appends[self.real_name].extend(rows)
+            self._maybe_flush()
+
+    def upsert_position(self, pair, position_qty, avg_cost, ts):
+        with self._lock:
+            cur = self._positions.get(pair)
+            row = cur["row"] if cur else self._alloc_row()
+            self._positions[pair] = {"row": row, "position_qty": position_qty, "avg_cost": avg_cost, "updated_at": ts}
+            self._dirty.add(pair)
+            self._maybe_flush()
+
+    def get_position(self, pair):
+        with self._lock:
+            p = self._positions.get(pair)
+            if p is None:
+                return _empty_position(pair)
+            return {"pair": pair, "position_qty": p["position_qty"], "avg_cost": p["avg_cost"]}
+
+    def get_all_positions(self):
+        with self._lock:
+            return [
+                {"pair": pair, "position_qty": p["position_qty"], "avg_cost": p["avg_cost"], "updated_at": p["updated_at"]}
+                for pair, p in sorted(self._positions.items(), key=lambda kv: kv[1]["row"])
+            ]
+
+    def _get(self, ws, a1: str, tries: int = 6):
+        """อ่านช่วงเซลล์ (ค่าดิบ ไม่ format) — ถ้าโดน 429/5xx รอแบบ backoff แล้วลองใหม่"""
+        for i in range(tries):
+            try:
+                return ws.get(a1, value_render_option="UNFORMATTED_VALUE")
+            except Exception as e:
+                if not _is_retryable(e) or i == tries - 1:
+                    raise
+                time.sleep(min(2 ** i, 32) * (1 + random.random() * 0.2))
+
+    def iter_rows(self, table, chunk_size=10000):
+        # อ่านทีละช่วงแถว (API หนึ่งครั้งต่อก้อน) แทน get_all_records ทั้งชีต — หน่วยความจำคงที่แม้ชีตใหญ่
+        name = {"trades": self.trades_name, "realized": self.real_name, "positions": self.pos_name}[table]
+        headers = TABLE_HEADERS[table]
+        last_col = chr(ord("A") + len(headers) - 1)
+        with self._lock:
+            self.flush()
+            # แถวที่ยังค้างในบัฟเฟอร์ (API ติด backoff) ยังไม่อยู่บนชีต — อ่านตอนนี้ /export, /replay จะขาดดีลเหล่านั้น
+            waiting = len(self._dirty) if table == "positions" else len(self._appends.get(name, []))
+        if waiting:
+            raise PendingWrites(f"Google Sheets ยังไม่พร้อม ({waiting} แถวของ {table} ยังส่งไม่ได้) — ลองใหม่อีกครั้งภายหลังค่ะ")
+        ws = self._ws[name]
+        start = 2
+        while True:
+            values = self._get(ws, f"A{start}:{last_col}{start + chunk_size - 1}")
+            if values:
+                yield [dict(zip(headers, list(v) + [""] * (len(headers) - len(v)))) for v in values]
+            if len(values) < chunk_size:
+                return
+            start += chunk_size
+
+    def count_rows(self, table):
+        # แถวบนชีต (อ่านคอลัมน์ A คอลัมน์เดียว) + แถวที่ยังรอส่งในบัฟเฟอร์
+        name = {"trades": self.trades_name, "realized": self.real_name, "positions": self.pos_name}[table]
+        with self._lock:
+            ws = self._ws[name]
+            pending = len(self._appends.get(name, []))
+            return len(self._get(ws, f"A2:A{max(ws.row_count, 2)}")) + pending
+
+    def _rewrite(self, name: str, headers: List[str], rows: List[List[Any]]):
+        ws = self._ws[name]
+        ws.clear()
+        ws.resize(rows=max(len(rows) + 1, 1000))
+        ws.update([headers] + rows, "A1")
+
+    def replace_positions(self, rows):
+        with self._lock:
+            self._rewrite(self.pos_name, POSITION_HEADERS, rows)
+            self._positions = {
+                r[0]: {"row": i, "position_qty": r[1], "avg_cost": r[2], "updated_at": r[3]}
+                for i, r in enumerate(rows, start=2)
+            }
+            self._next_row = len(rows) + 2
+            self._dirty.clear()
+
+    def replace_realized(self, rows):
+        with self._lock:
+            self._appends[self.real_name] = []
+            self._rewrite(self.real_name, REALIZED_HEADERS, rows)
@@ -0,0 +1,200 @@
+import os
+import csv
+import sqlite3
+import argparse
+import threading
+import contextlib
+from typing import List, Dict
+
+from storage import StorageBackend, TRADE_HEADERS, REALIZED_HEADERS, POSITION_HEADERS, TABLE_HEADERS, DATA_DIR, _empty_position
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts_iso TEXT, exchange TEXT, pair TEXT, side TEXT,
+    price REAL, qty REAL, fee REAL, fee_asset TEXT,
+    gross_value REAL, note TEXT, src_image_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_trades_ts ON trades(ts_iso);
+CREATE INDEX IF NOT EXISTS idx_trades_pair_ts ON trades(pair, ts_iso);
+
+CREATE TABLE IF NOT EXISTS realized (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts_iso TEXT, pair TEXT, qty REAL, avg_cost_used REAL, sell_price REAL,
+    fee REAL, realized_pnl REAL, note TEXT, src_image_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_realized_ts ON realized(ts_iso);
+CREATE INDEX IF NOT EXISTS idx_realized_pair_ts ON realized(pair, ts_iso);
+
+CREATE TABLE IF NOT EXISTS positions (
+    pair TEXT PRIMARY KEY,
+    position_qty REAL NOT NULL DEFAULT 0,
+    avg_cost REAL NOT NULL DEFAULT 0,
+    updated_at TEXT
+) WITHOUT ROWID;
+"""
+
+def _insert_sql(table: str, headers: List[str]) -> str:
+    return f"INSERT INTO {table} ({','.join(headers)}) VALUES ({','.join('?' * len(headers))})"
+
+_INSERT_TRADE = _insert_sql("trades", TRADE_HEADERS)
+_INSERT_REALIZED = _insert_sql("realized", REALIZED_HEADERS)
+_UPSERT_POSITION = (
+    "INSERT INTO positions (pair, position_qty, avg_cost, updated_at) VALUES (?,?,?,?) "
+    "ON CONFLICT(pair) DO UPDATE SET position_qty=excluded.position_qty, "
+    "avg_cost=excluded.avg_cost, updated_at=excluded.updated_at"
+)
+
+class SQLiteBackend(StorageBackend):
+    """เก็บ ledger ใน SQLite (WAL) — position อ่าน/เขียนผ่าน primary key ไม่ต้องเขียนทั้งไฟล์ใหม่
+
+    การเขียนนอก transaction() จะ commit ทีละคำสั่ง; ใน transaction() ใช้ BEGIN IMMEDIATE
+    จึงกันการเขียนทับกันระหว่าง process ได้ (อีกฝั่งจะรอจน busy_timeout)
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str = os.path.join(DATA_DIR, "ledger.db")):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._depth:
+                self._depth += 1
+                try:
+                    yield
+                finally:
+                    self._depth -= 1
+                return
+            self.conn.execute("BEGIN IMMEDIATE")
+            self._depth = 1
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            else:
+                self.conn.execute("COMMIT")
+            finally:
+                self._depth = 0
+
+    def _exec(self, sql: str, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params)
+
+    def append_trade(self, row):
+        self._exec(_INSERT_TRADE, row)
+
+    def append_realized(self, row):
+        self._exec(_INSERT_REALIZED, row)
+
+    def append_trades(self, rows):
+        with self.transaction():
+            self.conn.executemany(_INSERT_TRADE, rows)
+
+    def append_realized_rows(self, rows):
+        with self.transaction():
+            self.conn.executemany(_INSERT_REALIZED, rows)
+
+    def upsert_position(self, pair, position_qty, avg_cost, ts):
+        self._exec(_UPSERT_POSITION, (pair, position_qty, avg_cost, ts))
+
+    def get_position(self, pair):
+        r = self._exec("SELECT position_qty, avg_cost FROM positions WHERE pair=?", (pair,)).fetchone()
+        if r is None:
+            return _empty_position(pair)
+        return {"pair": pair, "position_qty": float(r["position_qty"]), "avg_cost": float(r["avg_cost"])}
+
+    def get_all_positions(self):
+        rows = self._exec(f"SELECT {','.join(POSITION_HEADERS)} FROM positions ORDER BY pair").fetchall()
+        return [dict(r) for r in rows]
+
+    def iter_rows(self, table, chunk_size=10000):
+        headers = TABLE_HEADERS[table]
+        order = "pair" if table == "positions" else "id"
+        # ใช้ connection แยก เพื่อไม่ให้ cursor ค้างขวาง transaction ของบอท
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            cur = conn.execute(f"SELECT {','.join(headers)} FROM {table} ORDER BY {order}")
+            while True:
+                rows = cur.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield [dict(r) for r in rows]
+        finally:
+            conn.close()
+
+    def count_rows(self, table):
+        if table not in TABLE_HEADERS:
+            raise ValueError(table)
+        with self._lock:
+            return self.conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    def replace_positions(self, rows):
+        with self.transaction():
+            self.conn.execute("DELETE FROM positions")
+            self.conn.executemany(_UPSERT_POSITION, rows)
+
+    def replace_realized(self, rows):
+        with self.transaction():
+            self.conn.execute("DELETE FROM realized")
+            self.conn.executemany(_INSERT_REALIZED, rows)
+
+    def state_dir(self):
+        return os.path.dirname(self.path) or "."
+
+    def close(self):
+        self.conn.close()
+
+# ---------------- CSV -> SQLite ----------------
+
+def _read_csv_rows(path: str, headers: List[str]):
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="", encoding="utf-8") as f:
+        return [[(rec.get(h) or None) for h in headers] for rec in csv.DictReader(f)]
+
+def migrate_csv(data_dir: str = DATA_DIR, db_path: str = None, force: bool = False) -> Dict[str, int]:
+    """ย้าย trades.csv / realized.csv / positions.csv เข้า SQLite ใน transaction เดียว
+    ถ้าฐานข้อมูลมีข้อมูลอยู่แล้วจะไม่ทำ (เว้นแต่ force=True ซึ่งจะล้างตารางก่อน)"""
+    db_path = db_path or os.path.join(data_dir, "ledger.db")
+    backend = SQLiteBackend(db_path)
+    try:
+        existing = sum(backend._exec(f"SELECT COUNT(*) FROM {t}").fetchone()[0]
+                       for t in ("trades", "realized", "positions"))
+        if existing and not force:
+            raise RuntimeError(f"{db_path} มีข้อมูลอยู่แล้ว ({existing} แถว) — ใช้ --force เพื่อเขียนทับ")
+        trades = _read_csv_rows(os.path.join(data_dir, "trades.csv"), TRADE_HEADERS)
+        realized = _read_csv_rows(os.path.join(data_dir, "realized.csv"), REALIZED_HEADERS)
+        positions = _read_csv_rows(os.path.join(data_dir, "positions.csv"), POSITION_HEADERS)
+        with backend.transaction():
+            if force:
+                for t in ("trades", "realized", "positions"):
+                    backend.conn.execute(f"DELETE FROM {t}")
+            backend.conn.executemany(_INSERT_TRADE, trades)
+            backend.conn.executemany(_INSERT_REALIZED, realized)
+            backend.conn.executemany(_UPSERT_POSITION, positions)
+        return {"trades": len(trades), "realized": len(realized), "positions": len(positions)}
+    finally:
+        backend.close()
+
+def main():
+    ap = argparse.ArgumentParser(description="ย้ายข้อมูล CSV ใน data/ เข้า SQLite")
+    ap.add_argument("--data-dir", default=DATA_DIR)
+    ap.add_argument("--db", default=None, help="ค่าเริ่มต้น: <data-dir>/ledger.db")
+    ap.add_argument("--force", action="store_true", help="ล้างตารางเดิมก่อนย้าย")
+    args = ap.parse_args()
+    counts = migrate_csv(args.data_dir, args.db, args.force)
+    print(", ".join(f"{k}={v}" for k, v in counts.items()))
+
+if __name__ == "__main__":
+    main()
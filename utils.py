@@ -1,2 +1,44 @@
+import os
+import importlib
+import yaml
+
+# ใช้ตัว parse ของ libyaml ถ้ามี (เร็วกว่าแบบ pure Python ราว 10 เท่า — config ถูกอ่านตอน import หลายโมดูล)
+_Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+# โฟลเดอร์ของโค้ด — config.yaml / parser_patterns.yaml / layouts.yaml อยู่ข้างโค้ด ไม่ขึ้นกับโฟลเดอร์ที่สั่งรัน
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
 def parse_bool(text: str) -> bool:
     return str(text).strip().lower() in ("1","true","yes","y")
+
+def config_path(name: str) -> str:
+    """path ของไฟล์ตั้งค่า: path เต็มใช้ตามนั้น, ชื่อไฟล์อ้างจากโฟลเดอร์โค้ด
+    (หรือ TRADEBOT_CONFIG_DIR เช่น config ที่ mount เข้า container แยกจากโค้ด)"""
+    if os.path.isabs(name):
+        return name
+    return os.path.join(os.getenv("TRADEBOT_CONFIG_DIR") or BASE_DIR, name)
+
+def load_config(path: str = "config.yaml") -> dict:
+    try:
+        with open(config_path(path), "r", encoding="utf-8") as f:
+            return yaml.load(f, Loader=_Loader) or {}
+    except FileNotFoundError:
+        return {}
+
+class LazyModule:
+    """โมดูลที่ import จริงเมื่อใช้ attribute ครั้งแรก (ใช้กับ cv2/pytesseract ที่ import ช้า)
+    process หลักของบอทที่ไม่ได้ OCR เองจะไม่ต้องโหลดเลย"""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._mod = None
+
+    def __getattr__(self, attr):
+        if self._mod is None:
+            self._mod = importlib.import_module(self._name)
+        return getattr(self._mod, attr)
+
+def admin_ids() -> set:
+    """รายชื่อ user id ที่เป็นแอดมิน จาก env ADMIN_USER_IDS (คั่นด้วย ,)"""
+    raw = os.getenv("ADMIN_USER_IDS", "")
+    return {int(x) for x in raw.replace(" ", "").split(",") if x.lstrip("-").isdigit()}